@@ -0,0 +1,151 @@
+import io
+import os
+import base64
+import logging
+import numpy as np
+import pandas as pd
+from PIL import Image
+import artifacts
+import indicators
+import telemetry
+from config import (ANALYSIS_CHART_INPUT, VISION_IMAGE_MAX_PIXELS, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY,
+                    VISION_IMAGE_COLORS, DIGEST_ROWS)
+
+logger = logging.getLogger(__name__)
+
+# 数值摘要表各列：(数据列, 表头, 小数位数)
+DIGEST_COLUMNS = [
+    ("open", "开盘", 2), ("high", "最高", 2), ("low", "最低", 2), ("close", "收盘", 2), ("volume", "成交量(手)", 0),
+    ("MA5", "MA5", 2), ("MA20", "MA20", 2), ("MA60", "MA60", 2),
+    ("BOLL_upper", "BOLL上轨", 2), ("BOLL_lower", "BOLL下轨", 2),
+    ("MACD", "MACD", 3), ("RSI", "RSI", 1), ("K", "K", 1), ("D", "D", 1),
+]
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def uses_images() -> bool:
+    return ANALYSIS_CHART_INPUT in ("images", "both")
+
+
+def uses_digest() -> bool:
+    return ANALYSIS_CHART_INPUT in ("digest", "both")
+
+
+def encode_image(path: str, max_pixels: int = None, fmt: str = None, quality: int = None, colors: int = None) -> bytes:
+    """
+    将图表缩放到不超过 max_pixels 个像素（保持宽高比，不放大）后编码：
+    png 量化为 colors 色调色板（图表颜色很少，线条和文字仍然清晰），jpeg / webp 按 quality 有损压缩。
+    """
+    max_pixels = max_pixels or VISION_IMAGE_MAX_PIXELS
+    fmt = fmt or VISION_IMAGE_FORMAT
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        width, height = img.size
+        scale = min(1.0, (max_pixels / (width * height)) ** 0.5)
+        if scale < 1.0:
+            img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        buf = io.BytesIO()
+        if fmt == "png":
+            img.quantize(colors or VISION_IMAGE_COLORS, method=Image.Quantize.FASTOCTREE).save(buf, "PNG")
+        elif fmt == "jpeg":
+            img.save(buf, "JPEG", quality=quality or VISION_IMAGE_QUALITY, optimize=True)
+        elif fmt == "webp":
+            img.save(buf, "WEBP", quality=quality or VISION_IMAGE_QUALITY, method=4)
+        else:
+            raise ValueError(f"不支持的图片格式: {fmt}")
+    return buf.getvalue()
+
+
+def _write_text(path: str, text: str) -> str:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def image_data_uris(report_dir: str, paths: list) -> list:
+    """
+    返回各图表编码后的 Data URI。编码结果作为产物缓存在图表所在目录（按像素预算、格式与压缩参数区分），
+    同一图表只编码一次，之后的请求直接读取；产物目录按内容寻址，图表不变时缓存始终有效。
+    """
+    variant = artifacts.artifact_key(VISION_IMAGE_MAX_PIXELS, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY,
+                                     VISION_IMAGE_COLORS)[:8]
+    names = [f"{os.path.splitext(os.path.basename(path))[0]}_uri_{variant}" for path in paths]
+
+    def _build(out_dir):
+        files = {}
+        with telemetry.span("encode_images", format=VISION_IMAGE_FORMAT) as sp:
+            for name, path in zip(names, paths):
+                data = encode_image(path)
+                uri = f"data:{MIME_TYPES[VISION_IMAGE_FORMAT]};base64,{base64.b64encode(data).decode('ascii')}"
+                files[name] = _write_text(os.path.join(out_dir, f"{name}.txt"), uri)
+                sp["bytes"] = sp.get("bytes", 0) + len(data)
+        return files
+    files = artifacts.get_store().get_or_create(report_dir, names, _build)
+    return [_read_text(files[name]) for name in names]
+
+
+def _format_value(value, digits: int) -> str:
+    if not np.isfinite(value):
+        return "-"
+    return f"{value:.{digits}f}"
+
+
+def numeric_digest(df: pd.DataFrame, rows: int = None) -> str:
+    """
+    将行情整理为紧凑的文本表：区间概况一行，加最近 rows 个交易日的 OHLCV 与主要技术指标（逗号分隔）。
+    指标按全部数据计算（或取自本地行情存储增量维护的指标列），表中只保留最近的行。
+    """
+    rows = rows or DIGEST_ROWS
+    df = df.dropna(subset=["close"]).reset_index(drop=True)
+    if df.empty:
+        return "（无行情数据）"
+    values = {col: df[col].to_numpy(dtype="float64") for col in ("open", "high", "low", "close", "volume")}
+    values.update(indicators.for_frame(df))
+    close = values["close"]
+    first, last = df["date"].iloc[0], df["date"].iloc[-1]
+    lines = [f"区间 {first:%Y-%m-%d} 至 {last:%Y-%m-%d}，共 {len(df)} 个交易日；"
+             f"收盘价 {close[0]:.2f} → {close[-1]:.2f}（{(close[-1] / close[0] - 1) * 100:+.2f}%），"
+             f"区间最高 {np.nanmax(values['high']):.2f}，最低 {np.nanmin(values['low']):.2f}",
+             ",".join(["日期"] + [title for _, title, _ in DIGEST_COLUMNS])]
+    for i in range(max(len(df) - rows, 0), len(df)):
+        lines.append(",".join([f"{df['date'].iloc[i]:%Y-%m-%d}"] +
+                              [_format_value(values[col][i], digits) for col, _, digits in DIGEST_COLUMNS]))
+    return "\n".join(lines)
+
+
+def prepare_digest(report_dir: str, df: pd.DataFrame) -> str:
+    """
+    生成（或复用）产物目录中的数值摘要文件 digest_<行数>.txt，返回文件路径。
+    """
+    name = f"digest_{DIGEST_ROWS}"
+
+    def _build(out_dir):
+        return {name: _write_text(os.path.join(out_dir, f"{name}.txt"), numeric_digest(df))}
+    return artifacts.get_store().get_or_create(report_dir, (name,), _build)[name]
+
+
+def load_digest(report_dir: str):
+    """
+    读取 prepare_digest 生成的数值摘要，尚未生成时返回 None。
+    """
+    files = artifacts.get_store().lookup(report_dir, (f"digest_{DIGEST_ROWS}",))
+    return _read_text(next(iter(files.values()))) if files else None
+
+
+def chart_inputs(report_dir: str, chart_paths: list) -> tuple:
+    """
+    按 ANALYSIS_CHART_INPUT 准备三面分析的行情输入，返回 (图片 Data URI 列表, 数值摘要文本或 None)。
+    """
+    images = image_data_uris(report_dir, chart_paths) if uses_images() else []
+    digest = load_digest(report_dir) if uses_digest() else None
+    if digest is None and not images:
+        logger.warning("产物目录 %s 中没有数值摘要，改为发送图表图片", report_dir)
+        images = image_data_uris(report_dir, chart_paths)
+    return images, digest
@@ -1,41 +1,47 @@
-import base64
-from zhipuai import ZhipuAI
-from config import ZHIPU_API_KEY
+from concurrent.futures import ThreadPoolExecutor
+import zhipu_client
+import prompt_budget
+import telemetry
+from config import (SCORE_SAMPLES, SCORE_MAX_CONCURRENCY, SCORE_ADAPTIVE,
+                    SCORE_ADAPTIVE_MIN_SAMPLES, SCORE_TOLERANCE, MACRO_CACHE_TTL, MACRO_CACHE_REFRESH_AHEAD)
+from cache_utils import RefreshingCache
+from llm_cache import chat_completion
+
+# 评分采样共享线程池，限制全进程并发的评分请求数
+_score_executor = ThreadPoolExecutor(max_workers=SCORE_MAX_CONCURRENCY, thread_name_prefix="score")
+# 宏观分析（文本 + 评分）进程级缓存
+_macro_cache = RefreshingCache(ttl=MACRO_CACHE_TTL, refresh_ahead=MACRO_CACHE_REFRESH_AHEAD, name="macro")
+telemetry.register_collector(lambda: telemetry.cache_samples("macro", _macro_cache.stats()))
 
 def analyze_fund_ind_tech(stock_name: str, stock_summaries: list, industry_summaries: list,
-                          price_chart_path: str, volume_chart_path: str) -> str:
+                          images: list, digest: str = None, on_token=None) -> str:
     """
-    调用 GLM-4.1V-Thinking 多模态模型，对给定的新闻摘要和图表图像进行综合分析。
+    调用 GLM-4.1V-Thinking 多模态模型，对给定的新闻摘要和行情输入进行综合分析。
+    images 为图表图片的 Data URI（见 analysis_inputs.chart_inputs），digest 为近期行情与技术指标的文本表（可选）。
     返回股票的基本面分析、行业分析、技术面分析（不含评分）。
+    提供 on_token 时以流式方式生成，每收到新内容即以累计文本回调。
     """
     # 初始化多模态模型客户端
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
-    # 读取并编码图表图像为 Base64 Data URI
-    images_content = []
-    for img_path in [price_chart_path, volume_chart_path]:
-        with open(img_path, "rb") as f:
-            img_data = f.read()
-            img_base64 = base64.b64encode(img_data).decode('utf-8')
-            images_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{img_base64}"}
-            })
-    # 准备新闻摘要文本（股票新闻和行业新闻）
-    news_text = "股票相关新闻摘要：\n"
-    for summary in stock_summaries:
-        news_text += f"- {summary}\n"
-    news_text += "行业相关新闻摘要：\n"
-    for summary in industry_summaries:
-        news_text += f"- {summary}\n"
+    client = zhipu_client.get_client()
+    images_content = [{"type": "image_url", "image_url": {"url": uri}} for uri in images]
+    materials = "、".join((["收盘价与成交量图表"] if images else []) + (["近期行情与技术指标数据"] if digest else []))
     # 准备提示语文本（不要求模型输出评分，只输出分析内容）
     prompt_text = (
-        f"下面是关于股票「{stock_name}」的近期股票新闻摘要和行业新闻摘要，以及该股票的收盘价与成交量图表。\n"
-        f"请综合以上图像和文本信息，从基本面、行业面、技术面三个方面对「{stock_name}」进行详细分析。\n"
+        f"下面是关于股票「{stock_name}」的近期股票新闻摘要和行业新闻摘要，以及该股票的{materials}。\n"
+        f"请综合以上{'图像和文本' if images else '文本'}信息，从基本面、行业面、技术面三个方面对「{stock_name}」进行详细分析。\n"
         "请用中文回答，格式如下：\n"
         "基本面分析：<分析内容>\n"
         "行业分析：<分析内容>\n"
         "技术面分析：<分析内容>"
     )
+    digest_text = f"近期行情与技术指标（成交量单位为手）：\n{digest}\n" if digest else ""
+    # 准备新闻摘要文本（股票新闻和行业新闻），按调用点 token 预算截断（靠后的新闻先被截去）
+    stock_news, industry_news = prompt_budget.fit(
+        "fund_ind_tech", prompt_text + digest_text,
+        ["".join(f"- {summary}\n" for summary in stock_summaries),
+         "".join(f"- {summary}\n" for summary in industry_summaries)])
+    news_text = (f"股票相关新闻摘要：\n{stock_news}\n"
+                 f"行业相关新闻摘要：\n{industry_news}\n" + digest_text)
     # 组装多模态消息内容（文本 + 图像）
     messages = [
         {
@@ -47,33 +53,56 @@ def analyze_fund_ind_tech(stock_name: str, stock_summaries: list, industry_summa
         }
     ]
     # 调用多模态大模型获取分析结果
-    response = client.chat.completions.create(
+    result_text = chat_completion(
+        client, "fund_ind_tech", on_token=on_token,
         model="glm-4.1v-thinking-flashx",
         messages=messages
-    )
-    result_text = response.choices[0].message.content.strip()
+    ).strip()
     return result_text
 
-def analyze_macro(stock_name: str) -> str:
+def _generate_macro_analysis(on_token=None) -> str:
     """
     调用 GLM-4-Plus 模型，生成关于整体A股市场宏观环境和投资价值的分析段落。
     """
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
+    client = zhipu_client.get_client()
     prompt = (
         "请从宏观角度分析当前中国的宏观经济环境和整个A股市场的投资价值，并给出详细的宏观分析。"
         "请用中文回答。"
     )
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(model="glm-4-plus", messages=messages)
-    macro_analysis = response.choices[0].message.content.strip()
+    # 不经过大模型响应缓存：有效期由 _macro_cache 控制，后台刷新必须真正请求模型，否则会取回上一轮写入的同一结果
+    macro_analysis = chat_completion(client, "macro", use_cache=False, on_token=on_token,
+                                     model="glm-4-plus", messages=messages).strip()
     return macro_analysis
 
+def get_macro_analysis(on_token=None) -> tuple:
+    """
+    返回 (宏观分析文本, 宏观分析评分)。宏观分析与个股无关，结果在进程内共享缓存，
+    有效期为 MACRO_CACHE_TTL，临近过期时在后台刷新；并发未命中只触发一次生成。
+    on_token 仅在本次调用同步生成（未命中）时用于流式回调，后台刷新不回调。
+    """
+    def _load(callback):
+        macro_text = _generate_macro_analysis(callback)
+        return macro_text, get_score(macro_text, "宏观分析")
+    return _macro_cache.get("macro", lambda: _load(on_token), refresh_loader=lambda: _load(None))
+
+def analyze_macro(stock_name: str) -> str:
+    """
+    返回关于整体A股市场宏观环境和投资价值的分析段落（stock_name 不影响结果，命中进程内缓存）。
+    """
+    return get_macro_analysis()[0]
+
 def analyze_ai_free(stock_name: str, fund_analysis: str, industry_analysis: str,
-                   tech_analysis: str, macro_analysis: str) -> str:
+                   tech_analysis: str, macro_analysis: str, on_token=None) -> str:
     """
     调用 GLM-4-Plus 模型，基于已有的分析，自由生成AI视角的重要内容分析段落。
+    提供 on_token 时以流式方式生成，每收到新内容即以累计文本回调。
     """
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
+    client = zhipu_client.get_client()
+    instruction = "请你作为AI，从整体上进一步分析该股票，不要包含和上述分析重叠的部分，并自由阐述任何上述分析未充分覆盖的重要内容。请给出详细的 AI 分析。"
+    # 前序分析按调用点 token 预算截断（较短的分析保留原文，较长的分析分摊剩余预算）
+    fund_analysis, industry_analysis, tech_analysis, macro_analysis = prompt_budget.fit(
+        "ai_free", f"以下是关于股票「{stock_name}」的分析：\n{instruction}", [fund_analysis, industry_analysis, tech_analysis, macro_analysis])
     # 将之前的分析内容提供给模型，要求进一步补充重要内容
     prompt = (
         f"以下是关于股票「{stock_name}」的分析：\n"
@@ -81,11 +110,10 @@ def analyze_ai_free(stock_name: str, fund_analysis: str, industry_analysis: str,
         f"行业分析：{industry_analysis}\n"
         f"技术面分析：{tech_analysis}\n"
         f"宏观分析：{macro_analysis}\n"
-        "请你作为AI，从整体上进一步分析该股票，不要包含和上述分析重叠的部分，并自由阐述任何上述分析未充分覆盖的重要内容。请给出详细的 AI 分析。"
+        f"{instruction}"
     )
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(model="glm-4-plus", messages=messages)
-    ai_analysis = response.choices[0].message.content.strip()
+    ai_analysis = chat_completion(client, "ai_free", on_token=on_token, model="glm-4-plus", messages=messages).strip()
     return ai_analysis
 
 def parse_three_analysis(result_text: str) -> tuple:
@@ -120,32 +148,55 @@ def parse_three_analysis(result_text: str) -> tuple:
         fund_part = result_text
     return fund_part, industry_part, tech_part
 
-def get_score(analysis_text: str, aspect_name: str) -> int:
+def _score_once(client, prompt: str, use_cache: bool = False):
+    """
+    单次评分采样：返回 0~100 的整数评分，无法解析或超出范围时返回 None。
+    评分采样默认不走响应缓存，以保证自洽采样每次得到新的样本。
+    """
+    messages = [{"role": "user", "content": prompt}]
+    score_str = chat_completion(client, "score", use_cache=use_cache, model="glm-4-plus", messages=messages).strip()
+    # 提取数字
+    try:
+        score_val = int(''.join(filter(str.isdigit, score_str)))
+    except ValueError:
+        # 如果无法解析，则跳过
+        return None
+    # 保证在0-100范围
+    if 0 <= score_val <= 100:
+        return score_val
+    return None
+
+def get_score(analysis_text: str, aspect_name: str, samples: int = None,
+              adaptive: bool = None, tolerance: int = None) -> int:
     """
-    调用 GLM-4-Plus 模型，对给定分析文本进行0~100评分。调用5次取平均值作为最终评分。
+    调用 GLM-4-Plus 模型，对给定分析文本进行0~100评分。默认采样5次取有效评分的平均值作为最终评分。
     aspect_name 用于提示是哪个维度的评分（如“基本面分析”）。
+    各次采样并发发出，全进程的评分请求共享同一个有界线程池（SCORE_MAX_CONCURRENCY）。
+    adaptive 为 True 时先采样 SCORE_ADAPTIVE_MIN_SAMPLES 次，若有效评分的极差不超过 tolerance 则提前停止，
+    否则继续分批采样直至达到 samples 次。
     """
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
+    samples = SCORE_SAMPLES if samples is None else samples
+    adaptive = SCORE_ADAPTIVE if adaptive is None else adaptive
+    tolerance = SCORE_TOLERANCE if tolerance is None else tolerance
+    client = zhipu_client.get_client()
     scores = []
-    prompt = (
-        f"以下是对股票的{aspect_name}。\n{analysis_text}\n"
-        "请你根据上述分析内容，从0到100对该股票的此方面表现进行评分。"
-        "请大胆给出评分，并且只输出一个数字。"
-    )
-    for _ in range(5):
-        messages = [{"role": "user", "content": prompt}]
-        response = client.chat.completions.create(model="glm-4-plus", messages=messages)
-        score_str = response.choices[0].message.content.strip()
-        # 提取数字
-        try:
-            score_val = int(''.join(filter(str.isdigit, score_str)))
-        except:
-            # 如果无法解析，则跳过
-            continue
-        # 保证在0-100范围
-        if 0 <= score_val <= 100:
-            scores.append(score_val)
+    instruction = "请你根据上述分析内容，从0到100对该股票的此方面表现进行评分。请大胆给出评分，并且只输出一个数字。"
+    # 同一提示词会被采样多次，先按调用点 token 预算截断分析文本
+    analysis_text, = prompt_budget.fit("score", f"以下是对股票的{aspect_name}。\n{instruction}", [analysis_text])
+    prompt = f"以下是对股票的{aspect_name}。\n{analysis_text}\n{instruction}"
+    # 非自适应模式一次性发出全部采样；自适应模式按批发出，每批结束后检查是否已收敛
+    batch = min(SCORE_ADAPTIVE_MIN_SAMPLES, samples) if adaptive else samples
+    sent = 0
+    with telemetry.span("score", aspect=aspect_name) as sp:
+        while sent < samples:
+            n = min(batch, samples - sent)
+            futures = [_score_executor.submit(telemetry.bind(_score_once), client, prompt) for _ in range(n)]
+            sent += n
+            scores.extend(v for v in (f.result() for f in futures) if v is not None)
+            if adaptive and len(scores) >= 2 and max(scores) - min(scores) <= tolerance:
+                break
+        sp.update(samples=sent, valid=len(scores))
     if not scores:
         return 0
     avg_score = sum(scores) / len(scores)
-    return int(round(avg_score))
\ No newline at end of file
+    return int(round(avg_score))
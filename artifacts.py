@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from cache_utils import SingleFlight
+from config import ARTIFACT_DIR, ARTIFACT_MAX_BYTES, ARTIFACT_JANITOR_INTERVAL, ARTIFACT_ORPHAN_AGE
+
+logger = logging.getLogger(__name__)
+
+# 每个产物目录中记录已完成产物的清单文件；其修改时间同时作为最近访问时间（LRU）
+MANIFEST = "manifest.json"
+
+
+def artifact_key(*parts) -> str:
+    """
+    由 (代码, 起止日期, 模式, 数据版本, ...) 等组成部分生成内容寻址的产物键。
+    """
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class ArtifactStore:
+    """
+    报告产物（图表、Excel、PDF 等）的本地缓存。
+    相同键的请求复用同一目录中已生成的文件；目录清单只在产物完整写入后更新，
+    清理由后台线程按总大小上限和最近访问时间执行，不占用请求路径。
+    """
+
+    def __init__(self, root: str, max_bytes: int, orphan_age: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.orphan_age = orphan_age
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("artifacts")
+        self._janitor = None
+
+    def entry_dir(self, key: str, label: str = "") -> str:
+        """
+        返回产物键对应的目录（不存在时创建），label 仅用于便于辨认的目录名前缀。
+        """
+        path = os.path.join(self.root, f"{label}_{key}" if label else key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _read_manifest(self, entry_dir: str) -> dict:
+        try:
+            with open(os.path.join(entry_dir, MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def lookup(self, entry_dir: str, names) -> dict:
+        """
+        names 中的产物均已生成且文件仍存在时返回 {名称: 路径} 并刷新访问时间，否则返回 None。
+        """
+        manifest = self._read_manifest(entry_dir)
+        files = {}
+        for name in names:
+            file_name = manifest.get(name)
+            path = os.path.join(entry_dir, file_name) if file_name else None
+            if path is None or not os.path.exists(path):
+                return None
+            files[name] = path
+        try:
+            os.utime(os.path.join(entry_dir, MANIFEST))
+        except OSError:
+            pass
+        return files
+
+    def record(self, entry_dir: str, files: dict):
+        """
+        将已生成的产物 {名称: 路径} 写入目录清单（原子替换）。
+        """
+        with self._lock:
+            # 目录可能已被后台清理删除（如用户在查询很久之后才生成PDF），清单写入前重新创建
+            os.makedirs(entry_dir, exist_ok=True)
+            manifest = self._read_manifest(entry_dir)
+            for name, path in files.items():
+                if path:
+                    manifest[name] = os.path.relpath(path, entry_dir)
+            tmp_path = os.path.join(entry_dir, MANIFEST + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(entry_dir, MANIFEST))
+
+    def get_or_create(self, entry_dir: str, names, builder) -> dict:
+        """
+        返回 names 对应的产物路径，缺失时调用 builder(entry_dir) 生成（返回 {名称: 路径}）并记录。
+        同一目录的并发生成只执行一次，其余请求等待并复用结果。
+        """
+        files = self.lookup(entry_dir, names)
+        if files is not None:
+            return files
+
+        def _build():
+            cached = self.lookup(entry_dir, names)
+            if cached is not None:
+                return cached
+            os.makedirs(entry_dir, exist_ok=True)
+            built = builder(entry_dir)
+            self.record(entry_dir, built)
+            return built
+        return self._flight.do(entry_dir, _build)
+
+    def sweep(self):
+        """
+        清理一次：删除超过 orphan_age 仍未完成（无清单）的目录，
+        总大小超过上限时按最近访问时间从旧到新删除，直到低于上限的 90%。返回 (删除目录数, 释放字节数)。
+        """
+        if not os.path.isdir(self.root):
+            return 0, 0
+        now = time.time()
+        entries = []
+        removed = freed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or self._flight.in_flight(path):
+                continue
+            manifest = os.path.join(path, MANIFEST)
+            try:
+                accessed = os.path.getmtime(manifest if os.path.exists(manifest) else path)
+            except OSError:
+                continue
+            size = _dir_size(path)
+            if not os.path.exists(manifest) and now - accessed > self.orphan_age:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                freed += size
+                continue
+            entries.append((accessed, size, path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                removed += 1
+                freed += size
+        if removed:
+            logger.info("清理报告产物目录 %d 个，释放 %.1f MB", removed, freed / 1024 / 1024)
+        return removed, freed
+
+    def start_janitor(self, interval: float = None):
+        """
+        启动后台清理线程（每个进程只启动一次），每隔 interval 秒执行一次 sweep。
+        """
+        interval = interval or ARTIFACT_JANITOR_INTERVAL
+        with self._lock:
+            if self._janitor is not None:
+                return
+
+            def _loop():
+                while True:
+                    try:
+                        self.sweep()
+                    except Exception as e:
+                        logger.warning("清理报告产物失败: %s", e)
+                    time.sleep(interval)
+
+            self._janitor = threading.Thread(target=_loop, name="artifact-janitor", daemon=True)
+            self._janitor.start()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    """
+    返回进程级共享的产物缓存实例（首次使用时创建）。
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES, ARTIFACT_ORPHAN_AGE)
+    return _store
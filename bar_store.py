@@ -0,0 +1,257 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import indicators
+from config import BAR_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 按列存储的日线字段；date 以 datetime64[D] 保存，其余为 float64
+COLUMNS = ["open", "high", "low", "close", "volume"]
+# 技术指标按本地存储的全部历史计算，保存为 indicators.npy（行依次对应 indicators.COLUMNS，列对应各交易日）
+
+_locks = {}
+_locks_guard = threading.Lock()
+_mmaps = {}
+
+
+def _lock_for(ts_code: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(ts_code)
+        if lock is None:
+            lock = _locks[ts_code] = threading.Lock()
+        return lock
+
+
+def _code_dir(ts_code: str) -> str:
+    return os.path.join(BAR_STORE_DIR, ts_code.replace('.', '_'))
+
+
+def _to_date(s: str):
+    return datetime.strptime(s, "%Y%m%d").date()
+
+
+def _to_str(d) -> str:
+    return d.strftime("%Y%m%d")
+
+
+def _read_meta(ts_code: str) -> dict:
+    path = os.path.join(_code_dir(ts_code), "meta.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"ranges": [], "version": 0}
+
+
+def _merge_ranges(ranges: list) -> list:
+    """
+    合并重叠或相邻（相差一天）的日期区间，区间为闭区间 [YYYYMMDD, YYYYMMDD]。
+    """
+    spans = sorted((_to_date(a), _to_date(b)) for a, b in ranges)
+    merged = []
+    for a, b in spans:
+        if merged and a <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return [[_to_str(a), _to_str(b)] for a, b in merged]
+
+
+def missing_ranges(ts_code: str, start_date: str, end_date: str) -> list:
+    """
+    返回 [start_date, end_date] 中本地尚未覆盖的日期区间列表。
+    """
+    start, end = _to_date(start_date), _to_date(end_date)
+    gaps = []
+    cursor = start
+    for a, b in _read_meta(ts_code)["ranges"]:
+        a, b = _to_date(a), _to_date(b)
+        if b < cursor:
+            continue
+        if a > end:
+            break
+        if a > cursor:
+            gaps.append([_to_str(cursor), _to_str(a - timedelta(days=1))])
+        cursor = max(cursor, b + timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append([_to_str(cursor), _to_str(end)])
+    return gaps
+
+
+def _load_arrays(ts_code: str):
+    """
+    以只读内存映射方式加载某只股票的全部列，meta.json 未被替换时复用已映射的数组。
+    指标矩阵存在且与K线行数一致时以 "indicators" 返回。
+    """
+    code_dir = _code_dir(ts_code)
+    meta_path = os.path.join(code_dir, "meta.json")
+    try:
+        st = os.stat(meta_path)
+        stamp = (st.st_ino, st.st_mtime_ns)
+    except OSError:
+        return None
+    cached = _mmaps.get(ts_code)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        arrays = {"date": np.load(os.path.join(code_dir, "date.npy"), mmap_mode="r")}
+        for col in COLUMNS:
+            arrays[col] = np.load(os.path.join(code_dir, f"{col}.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    try:
+        ind = np.load(os.path.join(code_dir, "indicators.npy"), mmap_mode="r")
+        if ind.shape == (len(indicators.COLUMNS), len(arrays["date"])):
+            arrays["indicators"] = ind
+    except (OSError, ValueError):
+        pass
+    _mmaps[ts_code] = (stamp, arrays)
+    return arrays
+
+
+def _update_indicators(old, meta: dict, columns: dict, changed: bool):
+    """
+    返回写入后的 (指标矩阵, 指标状态字典)。
+    新数据只是追加在已有K线之后（已有部分未变）且保存了与之对应的 IndicatorState 时，从该状态逐根增量更新，
+    只计算新增的K线；首次写入、补齐更早的区间、修订已有K线等情况整体重算。
+    K线中存在非有效数值时不保存状态（IndicatorState 假定数据有效），下次写入时整体重算。
+    """
+    n_old = 0 if old is None else len(old["date"])
+    old_ind = None if old is None else old.get("indicators")
+    saved = meta.get("indicator_state")
+    if not changed and old_ind is not None:
+        return np.asarray(old_ind), saved
+    tail = {col: columns[col][n_old:] for col in COLUMNS}
+    if (old_ind is not None and saved is not None and saved["count"] == n_old and len(columns["date"]) > n_old
+            and all(np.array_equal(np.asarray(old[name]), arr[:n_old]) for name, arr in columns.items())
+            and all(np.isfinite(arr).all() for arr in tail.values())):
+        state = indicators.IndicatorState.from_dict(saved)
+        new = state.update_many(tail["high"], tail["low"], tail["close"], tail["volume"])
+        ind = np.concatenate([np.asarray(old_ind), np.stack([new[col] for col in indicators.COLUMNS])], axis=1)
+        return ind, state.to_dict()
+    full = indicators.compute_all(columns["high"], columns["low"], columns["close"], columns["volume"])
+    state = None
+    if all(np.isfinite(columns[col]).all() for col in COLUMNS):
+        state = indicators.IndicatorState.from_history(columns["high"], columns["low"], columns["close"],
+                                                       columns["volume"]).to_dict()
+    return np.stack([full[col] for col in indicators.COLUMNS]), state
+
+
+def _write(ts_code: str, new_df: pd.DataFrame, covered: list):
+    """
+    将新抓取的数据与已有数据合并（按日期去重，新数据优先）后原子替换各列文件，并更新覆盖区间与技术指标。
+    """
+    code_dir = _code_dir(ts_code)
+    os.makedirs(code_dir, exist_ok=True)
+    meta = _read_meta(ts_code)
+    frames = []
+    old = _load_arrays(ts_code)
+    if old is not None and len(old["date"]):
+        frames.append(pd.DataFrame({"date": np.asarray(old["date"]), **{c: np.asarray(old[c]) for c in COLUMNS}}))
+    if new_df is not None and not new_df.empty:
+        part = new_df[["date"] + COLUMNS].copy()
+        part["date"] = pd.to_datetime(part["date"]).values.astype("datetime64[D]")
+        frames.append(part)
+    if frames:
+        merged = pd.concat(frames, ignore_index=True)
+        merged = merged.drop_duplicates(subset="date", keep="last").sort_values("date")
+    else:
+        merged = pd.DataFrame({"date": np.array([], dtype="datetime64[D]"), **{c: np.array([], dtype="float64") for c in COLUMNS}})
+    columns = {"date": merged["date"].values.astype("datetime64[D]")}
+    for col in COLUMNS:
+        columns[col] = merged[col].to_numpy(dtype="float64")
+    changed = old is None or any(not np.array_equal(np.asarray(old[name]), arr, equal_nan=name != "date")
+                                 for name, arr in columns.items())
+    ind, meta["indicator_state"] = _update_indicators(old, meta, columns, changed)
+    for name, arr in list(columns.items()) + [("indicators", ind)]:
+        tmp_path = os.path.join(code_dir, f"{name}.npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp_path, os.path.join(code_dir, f"{name}.npy"))
+    meta["ranges"] = _merge_ranges(meta["ranges"] + covered)
+    # 仅在数据实际变化时递增版本号（如重复拉取当天数据而行情未变），使依赖版本号的产物缓存保持有效
+    if changed:
+        meta["version"] = meta.get("version", 0) + 1
+    tmp_meta = os.path.join(code_dir, "meta.json.tmp")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, os.path.join(code_dir, "meta.json"))
+
+
+def read(ts_code: str, start_date: str, end_date: str):
+    """
+    读取本地已存储的 [start_date, end_date] 日线数据，返回 {列名: ndarray}，
+    已计算指标时另含 "indicators"（形状为 (len(indicators.COLUMNS), 行数)）。
+    返回的数组是内存映射数组的切片（零拷贝），不存在数据时返回 None。
+    """
+    arrays = _load_arrays(ts_code)
+    if arrays is None:
+        return None
+    dates = arrays["date"]
+    lo = np.searchsorted(dates, np.datetime64(_to_date(start_date), "D"), side="left")
+    hi = np.searchsorted(dates, np.datetime64(_to_date(end_date), "D"), side="right")
+    return {name: arr[..., lo:hi] for name, arr in arrays.items()}
+
+
+def version(ts_code: str) -> int:
+    """
+    返回某只股票本地数据的版本号，每次写入新数据后递增。
+    """
+    return _read_meta(ts_code).get("version", 0)
+
+
+def get_bars(ts_code: str, start_date: str, end_date: str, fetcher):
+    """
+    返回 [start_date, end_date] 的日线 DataFrame（列: date, open, high, low, close, volume，
+    以及按本地存储的全部历史维护的技术指标列 indicators.COLUMNS，写入失败时不含指标列）。
+    仅对本地未覆盖的日期区间调用 fetcher(ts_code, start, end) 从上游拉取，其余直接读取本地列存储。
+    fetcher 返回 None 表示拉取失败，该区间不记为已覆盖，下次请求时重试；
+    当天数据可能尚未收盘，因此不计入覆盖区间。
+    返回的 df.attrs 记录数据来源：sources 为本次提供数据的上游数据源（全部命中本地时为 ["local"]），
+    failed 为拉取失败的日期区间，便于调用方提示数据不完整。
+    """
+    today = datetime.now().strftime("%Y%m%d")
+    sources = []
+    failed = []
+    with _lock_for(ts_code):
+        gaps = missing_ranges(ts_code, start_date, end_date)
+        if gaps:
+            fetched = []
+            covered = []
+            for gap_start, gap_end in gaps:
+                df_part = fetcher(ts_code, gap_start, gap_end)
+                if df_part is None:
+                    failed.append([gap_start, gap_end])
+                    continue
+                source = df_part.attrs.get("source")
+                if source and source not in sources:
+                    sources.append(source)
+                fetched.append(df_part)
+                cover_end = min(gap_end, _to_str(_to_date(today) - timedelta(days=1)))
+                if cover_end >= gap_start:
+                    covered.append([gap_start, cover_end])
+            if fetched:
+                try:
+                    _write(ts_code, pd.concat(fetched, ignore_index=True), covered)
+                except OSError as e:
+                    logger.warning("写入本地行情存储失败 %s: %s", ts_code, e)
+                    df = pd.concat(fetched, ignore_index=True)[["date"] + COLUMNS]
+                    df.attrs.update(sources=sources, failed=failed)
+                    return df
+    bars = read(ts_code, start_date, end_date)
+    if bars is None or len(bars["date"]) == 0:
+        return None
+    data = {name: bars[name] for name in ["date"] + COLUMNS}
+    if "indicators" in bars:
+        data.update(zip(indicators.COLUMNS, bars["indicators"]))
+    df = pd.DataFrame(data)
+    df["date"] = pd.to_datetime(df["date"])
+    df.attrs.update(sources=sources or ["local"], failed=failed)
+    return df
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import analyzer
+import exporters
+import nlp_parser
+import report_pipeline
+import security_master
+import stock_plotter
+from config import BATCH_MAX_CONCURRENCY, BATCH_DEFAULT_DAYS, EXPORT_DEFAULT_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# 结果中各分析部分的键与对应的评分阶段
+SCORE_STAGES = {"fund": "score_fund", "industry": "score_industry", "tech": "score_tech", "ai": "score_ai"}
+
+
+def resolve_targets(codes=None, industry: str = None) -> list:
+    """
+    将股票代码列表和/或行业名称解析为证券主数据中的行 [{"ts_code", "name", "industry"}]（按代码去重）。
+    主数据中不存在的代码仍保留（名称、行业为空），分析时按代码处理。
+    """
+    master = security_master.get_master()
+    targets = []
+    seen = set()
+    for code in codes or []:
+        code = code.strip().upper()
+        if not code or code in seen:
+            continue
+        row = master.lookup_code(code)
+        targets.append({"ts_code": code, "name": row["name"] if row else code,
+                        "industry": row["industry"] if row else ""})
+        seen.add(code)
+    if industry:
+        for row in master.lookup_industry(industry):
+            if row["ts_code"] not in seen:
+                targets.append({"ts_code": row["ts_code"], "name": row["name"], "industry": row["industry"]})
+                seen.add(row["ts_code"])
+    return targets
+
+
+def _analyze_one(target: dict, start_date: str, end_date: str, mode: str, macro, industry_news, fetcher) -> dict:
+    code_for_dir = target["ts_code"].replace('.', '_')
+    result = {"ts_code": target["ts_code"], "name": target["name"], "industry": target["industry"]}
+    if mode == "data":
+        report_dir, charts, data_source = report_pipeline.get_charts(
+            target["ts_code"], target["name"], start_date, end_date, mode, code_for_dir, fetcher)
+        result.update(report_dir=report_dir, charts=list(charts), data_source=data_source,
+                      export=exporters.export_history(target["ts_code"], start_date, end_date, EXPORT_DEFAULT_FORMAT))
+        return result
+    pipe = report_pipeline.build_analysis_pipeline(
+        target["ts_code"], target["name"], target["industry"], start_date, end_date, mode, code_for_dir,
+        macro=macro, industry_news=industry_news, fetcher=fetcher)
+    results, timings = pipe.run()
+    report_dir, charts, data_source = results["charts"]
+    fund_text, industry_text, tech_text = results["analysis"]
+    macro_text, score_macro = results["macro"]
+    result.update(
+        report_dir=report_dir,
+        charts=list(charts),
+        data_source=data_source,
+        texts={"fund": fund_text, "industry": industry_text, "tech": tech_text, "macro": macro_text, "ai": results["ai"]},
+        scores={**{key: results[stage] for key, stage in SCORE_STAGES.items()}, "macro": score_macro},
+        timings=timings,
+    )
+    return result
+
+
+def run_batch(targets: list, start_date: str, end_date: str, mode: str = "analysis",
+              max_concurrency: int = None, on_progress=None) -> list:
+    """
+    批量分析多只股票，最多 max_concurrency 只同时进行，返回与 targets 顺序一致的结果列表。
+    批内共享的工作只做一次：宏观分析、每个行业的行业新闻、按缺失日期区间分组的行情拉取。
+    on_progress(完成数, 总数, 单只结果) 在每只股票完成（或失败）后回调。单只失败不影响其余股票，
+    失败项的结果中 ok 为 False 并带有 error。
+    """
+    max_concurrency = max_concurrency or BATCH_MAX_CONCURRENCY
+    total = len(targets)
+    t0 = time.perf_counter()
+    # 共享行情：缺失区间相同的股票合并为一次上游请求
+    fetcher = stock_plotter.prefetch_history([t["ts_code"] for t in targets], start_date, end_date)
+    macro = None
+    industry_news = {}
+    if mode != "data":
+        industries = sorted({t["industry"] for t in targets if t["industry"]})
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch-shared") as pool:
+            # 宏观分析与个股无关，每个行业的行业新闻在同行业股票间共享，均在批次开始时并发获取一次
+            macro_future = pool.submit(analyzer.get_macro_analysis)
+            news_futures = {ind: pool.submit(nlp_parser.get_industry_news, ind, 5) for ind in industries}
+            macro = macro_future.result()
+            industry_news = {ind: f.result() for ind, f in news_futures.items()}
+        logger.info("批量分析共享数据就绪：%d 个行业，耗时 %.1fs", len(industries), time.perf_counter() - t0)
+
+    results = [None] * total
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch") as pool:
+        futures = {}
+        for i, target in enumerate(targets):
+            futures[pool.submit(_analyze_one, target, start_date, end_date, mode, macro,
+                                industry_news.get(target["industry"], []), fetcher)] = (i, time.perf_counter())
+        for fut in as_completed(futures):
+            i, started = futures[fut]
+            target = targets[i]
+            try:
+                result = fut.result()
+                result["ok"] = True
+            except Exception as e:
+                logger.warning("批量分析 %s 失败: %s", target["ts_code"], e)
+                result = {**target, "ok": False, "error": str(e)}
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            results[i] = result
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total, result)
+    logger.info("批量分析完成：%d 只，失败 %d 只，总耗时 %.1fs",
+                total, sum(1 for r in results if not r["ok"]), time.perf_counter() - t0)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析自选股或某一行业的全部股票")
+    parser.add_argument("--codes", nargs="*", default=[], help="股票代码列表，如 600519.SH 000858.SZ")
+    parser.add_argument("--codes-file", help="股票代码文件，每行一个代码")
+    parser.add_argument("--industry", help="行业名称（取自证券主数据 data.csv 的 industry 列），如 白酒")
+    parser.add_argument("--start", help="起始日期 YYYYMMDD，默认为结束日期前 BATCH_DEFAULT_DAYS 天")
+    parser.add_argument("--end", help="结束日期 YYYYMMDD，默认为今天")
+    parser.add_argument("--mode", choices=["analysis", "data"], default="analysis",
+                        help="analysis：完整分析；data：仅生成图表和行情数据文件")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY, help="同时分析的股票数")
+    parser.add_argument("--output", default="batch_results.json", help="结果输出的 JSON 文件路径")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    codes = list(args.codes)
+    if args.codes_file:
+        with open(args.codes_file, "r", encoding="utf-8") as f:
+            codes.extend(line.strip() for line in f if line.strip())
+    targets = resolve_targets(codes, args.industry)
+    if not targets:
+        parser.error("未找到任何待分析的股票，请通过 --codes / --codes-file / --industry 指定")
+    end_date = args.end or datetime.now().strftime("%Y%m%d")
+    start_date = args.start or (datetime.strptime(end_date, "%Y%m%d") - timedelta(days=BATCH_DEFAULT_DAYS)).strftime("%Y%m%d")
+
+    def _progress(done, total, result):
+        status = "完成" if result["ok"] else f"失败: {result['error']}"
+        print(f"[{done}/{total}] {result['ts_code']} {result['name']} {status} ({result['seconds']:.1f}s)", flush=True)
+
+    results = run_batch(targets, start_date, end_date, mode=args.mode,
+                        max_concurrency=args.concurrency, on_progress=_progress)
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"start_date": start_date, "end_date": end_date, "mode": args.mode, "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+端到端负载测试：N 个并发用户反复调用 main.on_query，统计请求延迟（p50/p95/p99）、首次输出延迟与吞吐量。
+智谱 API 与行情接口均由 fakes 中的本地替身提供（可注入延迟），结果写入 JSON（默认 benchmarks/results/load-<时间戳>.json）。
+默认模式下各级并发共用 --stocks 只股票并在测试前预热一遍，测量缓存命中时的表现；
+--cold 时关闭大模型、新闻、宏观缓存，且每个请求使用不同的股票，测量全部未命中时的表现。
+用法：python benchmarks/bench_load.py [--users 1 4 8] [--requests-per-user 3] [--cold] [--llm-latency 0.5]
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+import pandas as pd
+import harness
+import fakes
+
+
+def _stock_pool(n: int, offset: int = 0) -> list:
+    df = pd.read_csv(os.path.join(harness.ROOT, "data.csv"), usecols=["ts_code", "name", "industry"])
+    df = df[~df["name"].str.contains(r"[*A-Za-z]", regex=True) & df["industry"].notna()]
+    return df.iloc[offset:offset + n].to_dict("records")
+
+
+def _query(stock: dict, mode: str) -> str:
+    return f"{stock['name']}最近1年行情数据" if mode == "data" else f"{stock['name']}最近1年情况如何？"
+
+
+def run_one(main_module, query: str) -> tuple:
+    """
+    执行一次查询并消费全部输出，返回 (总耗时, 首次输出耗时)。
+    """
+    start = time.perf_counter()
+    first = None
+    for _ in main_module.on_query(query):
+        if first is None:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+def run_level(main_module, users: int, requests_per_user: int, queries: list) -> dict:
+    """
+    users 个线程各自依次执行 requests_per_user 次查询（第 i 个用户取 queries[i::users]）。
+    """
+    latencies = []
+    first_outputs = []
+    errors = []
+    lock = threading.Lock()
+
+    def _user(i):
+        for query in queries[i::users][:requests_per_user]:
+            try:
+                total, first = run_one(main_module, query)
+                with lock:
+                    latencies.append(total)
+                    if first is not None:
+                        first_outputs.append(first)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{query}: {type(e).__name__}: {e}")
+    threads = [threading.Thread(target=_user, args=(i,), name=f"user-{i}") for i in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return {"users": users, "requests": len(latencies) + len(errors), "errors": len(errors),
+            "error_samples": errors[:5], "wall_seconds": round(wall, 3),
+            "throughput_rps": round(len(latencies) / wall, 4) if wall > 0 else 0.0,
+            "latency": harness.latency_summary(latencies), "first_output": harness.latency_summary(first_outputs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8], help="并发用户数（每个取值运行一轮）")
+    parser.add_argument("--requests-per-user", type=int, default=3)
+    parser.add_argument("--mode", choices=["analysis", "data"], default="analysis")
+    parser.add_argument("--stocks", type=int, default=10, help="缓存命中模式下的股票数")
+    parser.add_argument("--cold", action="store_true", help="关闭缓存，每个请求使用不同的股票")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="模型首个分片前的延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0005, help="每个字符的生成延迟（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="网络搜索延迟（秒）")
+    parser.add_argument("--data-latency", type=float, default=0.2, help="tushare 日线接口延迟（秒）")
+    parser.add_argument("--akshare-latency", type=float, default=None, help="启用 akshare 替身并设置其延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.3, help="延迟的对数标准差")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="智谱替身返回 429 的比例")
+    parser.add_argument("--out", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.cold:
+        overrides = {"LLM_CACHE_ENABLED": False, "NEWS_CACHE_TTL": 0, "NEWS_CACHE_REFRESH_AHEAD": 0,
+                     "NEWS_CACHE_MAX_STALE": 0, "MACRO_CACHE_TTL": 0, "MACRO_CACHE_REFRESH_AHEAD": 0}
+    with tempfile.TemporaryDirectory() as workdir:
+        harness.configure(workdir, **overrides)
+        server = fakes.StubZhipuServer(llm_latency=args.llm_latency, token_latency=args.token_latency,
+                                       search_latency=args.search_latency, jitter=args.jitter,
+                                       error_rate=args.error_rate).start()
+        harness.use_stub_zhipu(server)
+        pro = fakes.FakePro(latency=args.data_latency, jitter=args.jitter)
+        akshare = fakes.fake_akshare(args.akshare_latency, args.jitter) if args.akshare_latency is not None else None
+        fakes.install_market_data(pro, akshare)
+        import main as app
+        import telemetry
+
+        levels = []
+        if args.cold:
+            offset = 1
+            for users in args.users:
+                n = users * args.requests_per_user
+                queries = [_query(s, args.mode) for s in _stock_pool(n, offset)]
+                offset += n
+                levels.append(run_level(app, users, args.requests_per_user, queries))
+        else:
+            pool = [_query(s, args.mode) for s in _stock_pool(args.stocks, 1)]
+            for query in pool:  # 预热：行情、图表、新闻、宏观与大模型缓存
+                run_one(app, query)
+            for users in args.users:
+                queries = [pool[i % len(pool)] for i in range(users * args.requests_per_user)]
+                levels.append(run_level(app, users, args.requests_per_user, queries))
+        results = {"levels": levels, "stub_requests": dict(server.requests), "tushare_calls": pro.calls,
+                   "telemetry": telemetry.snapshot()["spans"]}
+        server.shutdown()
+
+    print(f"{'users':>6} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'first p50 s':>12}")
+    for level in levels:
+        lat, first = level["latency"], level["first_output"]
+        if not lat["count"]:
+            print(f"{level['users']:>6} {level['requests']:>9} {level['errors']:>7}  （全部失败：{level['error_samples'][:1]}）")
+            continue
+        print(f"{level['users']:>6} {level['requests']:>9} {level['errors']:>7} {level['throughput_rps']:>8.3f} "
+              f"{lat['p50']:>8.3f} {lat['p95']:>8.3f} {lat['p99']:>8.3f} {first.get('p50', 0):>12.3f}")
+    path = harness.save_results("load", vars(args), results, args.out)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+微基准：自然语言解析、技术指标计算（整体与增量）、图表生成、行情导出（CSV/XLSX/Parquet）、PDF 报告生成、三面分析解析。
+全部使用合成数据，不访问网络。结果写入 JSON（默认 benchmarks/results/micro-<时间戳>.json）。
+用法：python benchmarks/bench_micro.py [--bars 250 1250 5000] [--repeat 20] [--out results.json]
+"""
+import os
+import random
+import argparse
+import tempfile
+import harness
+import fakes
+
+QUERIES = [
+    "海尔智家最近1年情况如何？",
+    "600519.SH 20230101 到 20240101 的行情数据",
+    "贵州茅台和五粮液最近3个月走势",
+    "pfyh 最近30天怎么样",
+    "000858 过去2年表现",
+]
+
+
+def bench_parse(repeat: int) -> dict:
+    import nlp_parser
+    import security_master
+    security_master.get_master()  # 主数据只在首次使用时构建，不计入解析耗时
+
+    def _run():
+        for q in QUERIES:
+            nlp_parser.parse_user_query(q)
+    result = harness.time_op(_run, repeat)
+    result["queries_per_call"] = len(QUERIES)
+    return result
+
+
+def bench_parse_three_analysis(repeat: int) -> dict:
+    import analyzer
+    text = fakes.fake_reply([{"role": "user", "content": [{"type": "text", "text": ""}, {"type": "image_url"}]}],
+                            random.Random(0), 1500)
+    return harness.time_op(lambda: analyzer.parse_three_analysis(text), repeat * 50)
+
+
+def bench_bars(n_bars: int, repeat: int, out_dir: str) -> dict:
+    import pandas as pd
+    import indicators
+    import exporters
+    import report_pdf
+    import stock_plotter
+    end = pd.bdate_range(fakes.SYNTHETIC_ORIGIN, periods=n_bars + 1)[-1].strftime("%Y%m%d")
+    df = fakes.synthetic_ohlcv("600519.SH", fakes.SYNTHETIC_ORIGIN.replace("-", ""), end).tail(n_bars)
+    df = df.reset_index(drop=True)
+    arrays = (df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), df["volume"].to_numpy())
+    results = {"indicators": harness.time_op(lambda: indicators.compute_all(*arrays), repeat)}
+    # 增量路径：由前 n-1 根K线的状态追加最后一根（bar_store 追加新行情时的计算量），并校验与整体重算一致
+    state = indicators.IndicatorState.from_history(*(a[:-1] for a in arrays)).to_dict()
+    results["indicators_incremental"] = harness.time_op(
+        lambda: indicators.IndicatorState.from_dict(state).update(*(a[-1] for a in arrays)), repeat)
+    results["indicators_incremental"]["max_rel_error"] = indicators.verify_incremental(*arrays)
+
+    chart_dir = os.path.join(out_dir, f"charts_{n_bars}")
+    results["charts"] = harness.time_op(
+        lambda: stock_plotter.generate_charts("600519.SH", "基准", "", "", chart_dir, df=df), max(repeat // 4, 3))
+
+    frame = df.assign(**indicators.compute_all(*arrays))[exporters.EXPORT_COLUMNS]
+    for fmt in exporters.available_formats():
+        ext, writer = exporters.EXPORTERS[fmt]
+        path = os.path.join(out_dir, f"export_{n_bars}.{ext}")
+        results[f"export_{fmt}"] = harness.time_op(lambda: writer(path, frame), max(repeat // 4, 3))
+        results[f"export_{fmt}"]["bytes"] = os.path.getsize(path)
+
+    images = [os.path.join(chart_dir, name) for name in sorted(os.listdir(chart_dir))]
+    sections = [(title, fakes.fake_reply([{"role": "user", "content": title}], random.Random(i), 800), 70)
+                for i, title in enumerate(["基本面分析", "行业分析", "技术面分析", "宏观分析", "AI分析"])]
+    pdf_path = os.path.join(out_dir, f"report_{n_bars}.pdf")
+    results["pdf"] = harness.time_op(lambda: report_pdf.build_report(pdf_path, "基准报告", sections, images),
+                                     max(repeat // 4, 3))
+    results["pdf"]["bytes"] = os.path.getsize(pdf_path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", type=int, nargs="+", default=[250, 1250, 5000], help="行情长度（交易日数）")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数（较慢的项按比例减少）")
+    parser.add_argument("--out", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        harness.configure(workdir)
+        results = {"parse_user_query": bench_parse(args.repeat),
+                   "parse_three_analysis": bench_parse_three_analysis(args.repeat),
+                   "bars": {str(n): bench_bars(n, args.repeat, workdir) for n in args.bars}}
+    print(f"{'benchmark':<28} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    rows = [("parse_user_query", results["parse_user_query"]),
+            ("parse_three_analysis", results["parse_three_analysis"])]
+    rows += [(f"{name}[{n}]", r) for n, per_bars in results["bars"].items() for name, r in per_bars.items()]
+    for name, r in rows:
+        print(f"{name:<28} {r['p50'] * 1000:>10.2f} {r['p95'] * 1000:>10.2f} {r['p99'] * 1000:>10.2f}")
+    path = harness.save_results("micro", vars(args), results, args.out)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+图表渲染基准：对比旧版 pyplot 渲染路径与 chart_renderer（模板复用 + Agg + 单 PolyCollection 柱体）的
+单核吞吐（每秒图表数）。结果写入 JSON（默认 benchmarks/results/render-<时间戳>.json）。
+用法：python benchmarks/bench_render.py [--bars 250] [--rounds 10] [--out results.json]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import harness
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chart_renderer  # noqa: E402
+import downsample  # noqa: E402
+
+
+def synthetic_frame(n_bars: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+    df = pd.DataFrame({
+        "date": pd.bdate_range("2015-01-01", periods=n_bars),
+        "close": close,
+        "volume": rng.uniform(1e4, 1e5, n_bars),
+    })
+    for w in (5, 10, 20, 60):
+        df[f"MA{w}"] = df["close"].rolling(w).mean()
+        df[f"VOL_MA{w}"] = df["volume"].rolling(w).mean()
+    std = df["close"].rolling(20).std()
+    df["BOLL_upper"] = df["MA20"] + 2 * std
+    df["BOLL_lower"] = df["MA20"] - 2 * std
+    return df
+
+
+def legacy_render(df: pd.DataFrame, out_dir: str):
+    """旧版 generate_charts 的绘图部分（pyplot、逐根柱体、bbox_inches='tight'）。"""
+    plt.rcParams['figure.dpi'] = 800
+    dates = df['date']
+    fig1, ax1 = plt.subplots(figsize=(10, 6))
+    ax1.set_title("基准 收盘价走势", fontsize=12)
+    ax1.plot(dates, df['close'], label='收盘价', color='black')
+    for key, color in (("MA5", "red"), ("MA10", "orange"), ("MA20", "green"), ("MA60", "purple")):
+        ax1.plot(dates, df[key], label=key, color=color)
+    ax1.plot(dates, df['BOLL_upper'], label='BOLL上轨', color='grey', linestyle='--')
+    ax1.plot(dates, df['BOLL_lower'], label='BOLL下轨', color='grey', linestyle='--')
+    ax1.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10))
+    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    fig1.autofmt_xdate(rotation=45)
+    ax1.legend(fontsize=8)
+    ax1.grid(True, linestyle='--', alpha=0.5)
+    fig1.savefig(os.path.join(out_dir, "legacy_price.png"), dpi=150, bbox_inches='tight')
+    plt.close(fig1)
+    fig2, ax2 = plt.subplots(figsize=(10, 4))
+    ax2.set_title("基准 成交量", fontsize=12)
+    close_vals = df['close'].ffill()
+    prev_close = close_vals.shift(1)
+    vol_colors = ['red' if close_vals[i] >= prev_close[i] else 'green' for i in range(len(close_vals))]
+    ax2.bar(dates, df['volume'], color=vol_colors, label='成交量')
+    for key, color in (("VOL_MA5", "orange"), ("VOL_MA10", "purple"), ("VOL_MA20", "brown"), ("VOL_MA60", "blue")):
+        ax2.plot(dates, df[key], label=key, color=color)
+    ax2.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10))
+    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    fig2.autofmt_xdate(rotation=45)
+    ax2.legend(fontsize=8)
+    ax2.grid(True, linestyle='--', alpha=0.5)
+    fig2.savefig(os.path.join(out_dir, "legacy_volume.png"), dpi=150, bbox_inches='tight')
+    plt.close(fig2)
+
+
+def renderer_render(df: pd.DataFrame, out_dir: str, fmt: str = "png"):
+    dates = mdates.date2num(df['date'].values)
+    close_vals = df['close'].ffill()
+    up = (close_vals >= close_vals.shift(1)).to_numpy()
+    price = {"dates": dates, "series": {k: df[k].to_numpy() for k, _, _, _ in chart_renderer.PRICE_SERIES}}
+    volume = {"dates": dates, "volume": df['volume'].to_numpy(), "up": up,
+              "series": {k: df[k].to_numpy() for k, _, _ in chart_renderer.VOLUME_SERIES}}
+    chart_renderer.render_charts(out_dir, "基准", price, volume, fmt=fmt, processes=False)
+
+
+def downsampled_render(df: pd.DataFrame, out_dir: str):
+    """与 stock_plotter 相同的路径：LTTB 曲线降采样 + 按像素宽度选择日/周/月柱线后渲染。"""
+    width_px = chart_renderer.plot_width_px()
+    dates = mdates.date2num(df['date'].values)
+    price_dates, price_series = downsample.downsample_price(
+        dates, {k: df[k].to_numpy() for k, _, _, _ in chart_renderer.PRICE_SERIES}, width_px)
+    volume = downsample.downsample_volume(
+        df['date'].values, df['close'].to_numpy(), df['volume'].to_numpy(),
+        {k: df[k].to_numpy() for k, _, _ in chart_renderer.VOLUME_SERIES}, width_px)
+    volume["dates"] = mdates.date2num(volume["dates"])
+    chart_renderer.render_charts(out_dir, "基准", {"dates": price_dates, "series": price_series}, volume,
+                                 processes=False)
+
+
+def charts_per_second(fn, df, out_dir, rounds: int) -> float:
+    fn(df, out_dir)  # 预热（字体缓存、模板创建）
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(df, out_dir)
+    return 2 * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bars", type=int, nargs="+", default=[60, 250, 1250, 5000])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--out", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        print(f"{'bars':>6} {'legacy charts/s/core':>22} {'renderer png':>14} {'renderer webp':>14} {'downsampled png':>16}")
+        for n in args.bars:
+            df = synthetic_frame(n)
+            legacy = charts_per_second(legacy_render, df, out_dir, args.rounds)
+            new_png = charts_per_second(renderer_render, df, out_dir, args.rounds)
+            new_webp = charts_per_second(lambda d, o: renderer_render(d, o, "webp"), df, out_dir, args.rounds)
+            sampled = charts_per_second(downsampled_render, df, out_dir, args.rounds)
+            print(f"{n:>6} {legacy:>22.2f} {new_png:>14.2f} {new_webp:>14.2f} {sampled:>16.2f}")
+            results[str(n)] = {"legacy_charts_per_s": round(legacy, 3), "renderer_png_charts_per_s": round(new_png, 3),
+                               "renderer_webp_charts_per_s": round(new_webp, 3),
+                               "downsampled_png_charts_per_s": round(sampled, 3)}
+    path = harness.save_results("render", vars(args), results, args.out)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+基准测试使用的本地替身：不访问外网、结果确定（相同请求得到相同响应和延迟）、可注入延迟。
+- StubZhipuServer：本地 HTTP 服务，实现智谱 /chat/completions（含 SSE 流式）与 /web_search 接口，
+  应用通过 ZHIPUAI_BASE_URL 指向它，请求仍经过 zhipuai SDK、共享连接池与重试逻辑；
+- FakePro / fake_akshare：为 tushare pro.daily 与 akshare stock_zh_a_hist 生成合成日线（OHLCV）。
+"""
+import sys
+import json
+import math
+import time
+import types
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+
+# 合成行情的起点：同一股票同一交易日在任意请求区间内得到相同的数据
+SYNTHETIC_ORIGIN = "2000-01-03"
+
+
+def _rng(*parts) -> random.Random:
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "little"))
+
+
+def _latency(rng: random.Random, mean: float, jitter: float) -> float:
+    # 对数正态分布的延迟：均值约为 mean，jitter 为对数标准差（0 表示固定延迟）
+    if mean <= 0:
+        return 0.0
+    if jitter <= 0:
+        return mean
+    return mean * math.exp(rng.gauss(-jitter * jitter / 2, jitter))
+
+
+# ---- 智谱 API 替身 ----
+
+_FILLER = ("公司经营稳健，主营业务收入保持增长，盈利能力处于行业中上游水平。"
+           "行业景气度回升，政策面整体偏暖，竞争格局趋于稳定。"
+           "股价近期在均线附近震荡，成交量温和放大，短期走势偏强。")
+
+
+def _text(rng: random.Random, n_chars: int) -> str:
+    start = rng.randrange(len(_FILLER))
+    repeated = _FILLER * (n_chars // len(_FILLER) + 2)
+    return repeated[start:start + n_chars]
+
+
+def _prompt_text(messages: list) -> tuple:
+    """
+    返回 (全部文本, 是否包含图片)。
+    """
+    parts = []
+    has_image = False
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for item in content:
+                if item.get("type") == "text":
+                    parts.append(item.get("text", ""))
+                else:
+                    has_image = True
+        elif content:
+            parts.append(content)
+    return "\n".join(parts), has_image
+
+
+def fake_reply(messages: list, rng: random.Random, reply_chars: int) -> str:
+    """
+    按提示词类型生成格式与真实模型一致的回复：评分只含数字、三面分析带固定标签、批量新闻摘要为 JSON 数组。
+    """
+    prompt, has_image = _prompt_text(messages)
+    if has_image or "技术面分析：<分析内容>" in prompt:
+        third = max(reply_chars // 3, 20)
+        return (f"基本面分析：{_text(rng, third)}\n"
+                f"行业分析：{_text(rng, third)}\n"
+                f"技术面分析：{_text(rng, third)}")
+    if "只输出一个数字" in prompt:
+        return str(rng.randint(55, 85))
+    if "JSON 数组" in prompt:
+        n = prompt.count("【")
+        return json.dumps([{"id": i, "summary": _text(rng, 24), "sentiment": rng.choice(["乐观", "悲观", "中性"])}
+                           for i in range(n)], ensure_ascii=False)
+    if "总结其主要内容" in prompt:
+        return f"{_text(rng, 24)}（{rng.choice(['乐观', '悲观', '中性'])}）"
+    return _text(rng, reply_chars)
+
+
+def _search_results(query: str, count: int, rng: random.Random) -> list:
+    results = []
+    for i in range(count):
+        results.append({
+            "title": f"{query} 相关报道 {i + 1}",
+            "link": f"https://finance.sina.com.cn/bench/{hashlib.md5(f'{query}{i}'.encode()).hexdigest()[:12]}.shtml",
+            "content": _text(rng, 200),
+            "icon": "",
+            "media": "新浪财经",
+            "refer": f"ref_{i + 1}",
+            "publish_date": "2024-06-01",
+        })
+    return results
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 以便客户端复用连接（与真实 API 的 keep-alive 行为一致）
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        request = json.loads(raw or b"{}")
+        server.count(self.path)
+        if server.error_rate > 0 and _rng("error", raw, server.next_seq()).random() < server.error_rate:
+            self._send_json({"error": {"code": "1302", "message": "rate limited (stub)"}}, status=429)
+            return
+        rng = _rng(self.path, raw)
+        if self.path.endswith("/web_search"):
+            time.sleep(_latency(rng, server.search_latency, server.jitter))
+            results = _search_results(request.get("search_query", ""), int(request.get("count", 10)), rng)
+            self._send_json({"id": "bench", "created": int(time.time()), "search_result": results})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+            return
+        messages = request.get("messages", [])
+        content = fake_reply(messages, rng, server.reply_chars)
+        prompt, has_image = _prompt_text(messages)
+        usage = {"prompt_tokens": len(prompt) + (1000 if has_image else 0), "completion_tokens": len(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(_latency(rng, server.llm_latency, server.jitter))
+        base = {"id": "bench", "created": int(time.time()), "model": request.get("model")}
+        if not request.get("stream"):
+            time.sleep(server.token_latency * len(content))
+            self._send_json({**base, "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = 8
+        for i in range(0, len(content), step):
+            piece = content[i:i + step]
+            time.sleep(server.token_latency * len(piece))
+            chunk = {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        final = {**base, "usage": usage, "choices": [{"index": 0, "finish_reason": "stop", "delta": {"content": ""}}]}
+        self._write_chunk(f"data: {json.dumps(final, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+class StubZhipuServer(ThreadingHTTPServer):
+    """
+    智谱 API 的本地替身。延迟参数（秒）：llm_latency 为模型首个分片前的延迟，token_latency 为每个字符的生成延迟，
+    search_latency 为网络搜索延迟；jitter 为延迟的对数标准差；error_rate 为返回 429 的比例（用于观察重试开销）。
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, llm_latency: float = 0.5,
+                 token_latency: float = 0.0005, search_latency: float = 0.3, jitter: float = 0.3,
+                 reply_chars: int = 400, error_rate: float = 0.0):
+        super().__init__((host, port), _StubHandler)
+        self.llm_latency = llm_latency
+        self.token_latency = token_latency
+        self.search_latency = search_latency
+        self.jitter = jitter
+        self.reply_chars = reply_chars
+        self.error_rate = error_rate
+        self.requests = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def count(self, path: str):
+        with self._lock:
+            key = path.rsplit("/", 1)[-1]
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def next_seq(self) -> int:
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="stub-zhipu", daemon=True).start()
+        return self
+
+
+# ---- 行情数据替身 ----
+
+def synthetic_ohlcv(ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    某只股票 [start_date, end_date] 内每个工作日的合成日线（列为 date, open, high, low, close, volume）。
+    价格为以六位代码为种子、从 SYNTHETIC_ORIGIN 开始的几何随机游走，同一交易日的数据与请求区间、数据源无关。
+    """
+    end = pd.to_datetime(end_date)
+    dates = pd.bdate_range(SYNTHETIC_ORIGIN, end)
+    symbol = ts_code.split(".")[0]
+    rng = np.random.default_rng(int.from_bytes(hashlib.sha256(symbol.encode()).digest()[:8], "little"))
+    n = len(dates)
+    close = 10 * np.exp(np.cumsum(rng.normal(0.0002, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+    volume = rng.uniform(5e4, 5e5, n).round()
+    df = pd.DataFrame({"date": dates, "open": open_.round(2), "high": high.round(2), "low": low.round(2),
+                       "close": close.round(2), "volume": volume})
+    return df[df["date"] >= pd.to_datetime(start_date)].reset_index(drop=True)
+
+
+class FakePro:
+    """
+    tushare pro_api 的替身：daily 支持逗号分隔的多个代码，返回与 tushare 相同的列（trade_date 倒序）。
+    latency 为每次请求的延迟（秒），jitter 为延迟的对数标准差。
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.3):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    def daily(self, ts_code: str, start_date: str, end_date: str, **kwargs) -> pd.DataFrame:
+        self.calls += 1
+        time.sleep(_latency(_rng("tushare", ts_code, start_date, end_date), self.latency, self.jitter))
+        frames = []
+        for code in ts_code.split(","):
+            df = synthetic_ohlcv(code, start_date, end_date)
+            frames.append(pd.DataFrame({"ts_code": code, "trade_date": df["date"].dt.strftime("%Y%m%d"),
+                                        "open": df["open"], "high": df["high"], "low": df["low"],
+                                        "close": df["close"], "vol": df["volume"]}))
+        return pd.concat(frames).iloc[::-1].reset_index(drop=True)
+
+
+def fake_akshare(latency: float = 0.4, jitter: float = 0.3) -> types.ModuleType:
+    """
+    构造 akshare 模块的替身，仅实现 stock_zh_a_hist（返回中文列名，与 akshare 一致）。
+    """
+    module = types.ModuleType("akshare")
+
+    def stock_zh_a_hist(symbol: str, period: str = "daily", start_date: str = "", end_date: str = "", adjust: str = ""):
+        time.sleep(_latency(_rng("akshare", symbol, start_date, end_date), latency, jitter))
+        df = synthetic_ohlcv(symbol, start_date, end_date)
+        return pd.DataFrame({"日期": df["date"].dt.strftime("%Y-%m-%d"), "开盘": df["open"], "收盘": df["close"],
+                             "最高": df["high"], "最低": df["low"], "成交量": df["volume"]})
+    module.stock_zh_a_hist = stock_zh_a_hist
+    return module
+
+
+def install_market_data(pro: FakePro, akshare_module: types.ModuleType = None):
+    """
+    让 market_data 使用行情替身：tushare 接口替换为 pro，akshare 模块替换为 akshare_module（None 表示不可用）。
+    须在首次拉取行情前调用。
+    """
+    import market_data
+    market_data._pro = pro
+    if akshare_module is not None:
+        sys.modules["akshare"] = akshare_module
+    market_data._akshare_available.cache_clear()
+    if akshare_module is None:
+        market_data.SOURCES["akshare"]._available = lambda: False
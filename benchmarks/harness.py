@@ -0,0 +1,97 @@
+"""
+基准测试的公共部分：隔离的运行目录与配置、延迟分位数统计、结果保存（JSON，便于不同版本之间对比）。
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+# 默认结果目录
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def configure(workdir: str, **overrides):
+    """
+    将缓存、行情存储、报告产物目录指向 workdir（避免读写项目下的真实缓存），并按 overrides 覆盖 config 中的其他配置。
+    各模块在导入时读取配置，须在导入应用模块之前调用。
+    """
+    import config
+    os.makedirs(workdir, exist_ok=True)
+    config.LLM_CACHE_PATH = os.path.join(workdir, "llm_cache.sqlite3")
+    config.BAR_STORE_DIR = os.path.join(workdir, "bars")
+    config.ARTIFACT_DIR = os.path.join(workdir, "reports")
+    config.SECURITY_MASTER_CSV = os.path.join(ROOT, config.SECURITY_MASTER_CSV)
+    config.SECURITY_MASTER_SNAPSHOT = os.path.join(ROOT, config.SECURITY_MASTER_SNAPSHOT)
+    config.METRICS_PORT = 0
+    for key, value in overrides.items():
+        if not hasattr(config, key):
+            raise AttributeError(f"config 中没有配置项 {key}")
+        setattr(config, key, value)
+    return config
+
+
+def use_stub_zhipu(server):
+    """
+    让智谱客户端请求本地替身服务（zhipuai SDK 读取 ZHIPUAI_BASE_URL），须在首次创建客户端之前调用。
+    """
+    import config
+    os.environ["ZHIPUAI_BASE_URL"] = server.base_url
+    config.ZHIPU_API_KEY = config.ZHIPU_API_KEY or "bench.stub"
+
+
+def latency_summary(values) -> dict:
+    """
+    返回耗时（秒）的次数、均值、最小/最大值及 p50/p95/p99。
+    """
+    if len(values) == 0:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=float)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"count": int(arr.size), "mean": round(float(arr.mean()), 6), "min": round(float(arr.min()), 6),
+            "p50": round(float(p50), 6), "p95": round(float(p95), 6), "p99": round(float(p99), 6),
+            "max": round(float(arr.max()), 6)}
+
+
+def time_op(fn, repeat: int, warmup: int = 1) -> dict:
+    """
+    预热 warmup 次后重复执行 fn() repeat 次，返回每次耗时的统计。
+    """
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return latency_summary(durations)
+
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+def save_results(name: str, params: dict, results: dict, out: str = None) -> str:
+    """
+    将结果写入 JSON 文件（默认 benchmarks/results/<name>-<时间戳>.json），返回文件路径。
+    文件包含运行参数、环境（提交号、Python 版本、CPU 数）与结果。
+    """
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    payload = {"benchmark": name, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "environment": environment_info(), "params": params, "results": results}
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return out
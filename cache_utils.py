@@ -0,0 +1,239 @@
+import time
+import logging
+import threading
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    合并同一 key 的并发调用：同一时刻只有一个线程真正执行 fn，
+    其余线程等待并共享其结果（或异常）。提供 name 时按名称累计被合并的调用次数（singleflight_coalesced_total）。
+    """
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+        if not leader:
+            if self.name:
+                telemetry.incr("singleflight_coalesced_total", layer=self.name)
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+class _Stream:
+    """
+    StreamFlight 中一次计算的事件流：保存已产生的全部事件，供之后加入的订阅者从头重放。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = []
+        self._latest = {}
+        self._closed = False
+
+    def emit(self, event, replaces=None):
+        """
+        追加一个事件。replaces 不为 None 时，同一 replaces 的上一个事件从历史中清除（如累计文本只需保留最新的一份），
+        已读过旧事件的订阅者仍会收到新事件。
+        """
+        with self._cond:
+            if replaces is not None:
+                prev = self._latest.get(replaces)
+                if prev is not None:
+                    self._events[prev] = None
+                self._latest[replaces] = len(self._events)
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def batches(self):
+        """
+        依次返回事件批次：每次取出当前积压的全部事件（至少一个），事件流结束后停止。
+        """
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._events) and not self._closed:
+                    self._cond.wait()
+                if i >= len(self._events):
+                    return
+                batch = [event for event in self._events[i:] if event is not None]
+                i = len(self._events)
+            if batch:
+                yield batch
+
+
+class StreamFlight:
+    """
+    合并同一 key 的并发流式计算：第一个调用者在后台线程中启动 producer(emit)，producer 通过 emit 产生事件；
+    计算结束前到达的同一 key 的调用者订阅同一个事件流，先重放已产生的事件，再与发起者一起接收后续事件。
+    producer 应将异常作为事件产生，事件流在 producer 返回后结束。
+    """
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def subscribe(self, key, producer):
+        """
+        返回 key 对应事件流的批次迭代器（见 _Stream.batches），没有进行中的计算时启动 producer。
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            leader = stream is None
+            if leader:
+                stream = self._streams[key] = _Stream()
+        if not leader:
+            if self.name:
+                telemetry.incr("singleflight_coalesced_total", layer=self.name)
+            return stream.batches()
+
+        def _run():
+            try:
+                producer(stream.emit)
+            finally:
+                # 先移出再结束事件流：之后到达的请求重新计算，不会订阅到已结束的流
+                with self._lock:
+                    self._streams.pop(key, None)
+                stream.close()
+        threading.Thread(target=_run, name=f"{self.name or 'stream'}-flight", daemon=True).start()
+        return stream.batches()
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._streams
+
+
+class RefreshingCache:
+    """
+    线程安全的 TTL 缓存，支持提前后台刷新与过期后短暂返回旧值。
+    - 命中且未进入刷新窗口：直接返回缓存值；
+    - 距过期不足 refresh_ahead 秒（或已过期但未超过 max_stale 秒）：返回旧值，同时在后台线程刷新；
+    - 未命中或旧值过期太久：同步加载，并发未命中只触发一次加载。
+    """
+
+    def __init__(self, ttl: float, refresh_ahead: float = 0.0, max_stale: float = 0.0, max_entries: int = None,
+                 name: str = None):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flight = SingleFlight(name)
+        # 正在后台刷新的 key，与命中/未命中计数一样只在 _lock 内读写
+        self._refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            # 超出容量时淘汰最早写入的条目
+            if self.max_entries and len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                del self._entries[oldest]
+
+    def _load(self, key, loader):
+        def _run():
+            value = loader()
+            self._store(key, value)
+            return value
+        return self._flight.do(key, _run)
+
+    def _refresh_in_background(self, key, loader):
+        def _run():
+            try:
+                self._load(key, loader)
+            except Exception as e:
+                # 后台刷新失败时保留旧值，等待下次访问重试
+                logger.warning("缓存后台刷新失败 key=%s: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, name="cache-refresh", daemon=True).start()
+
+    def get(self, key, loader, refresh_loader=None):
+        """
+        读取 key 对应的值，缺失或过期时调用 loader() 生成。
+        refresh_loader 为后台刷新使用的加载函数（默认同 loader），
+        用于 loader 绑定了调用方上下文（如流式回调）而后台刷新不应再触达该调用方的情况。
+        """
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                age = time.time() - created
+                if age < self.ttl + self.max_stale:
+                    self.hits += 1
+                    # 进入刷新窗口时每个 key 只启动一个后台刷新
+                    if (age >= self.ttl - self.refresh_ahead and key not in self._refreshing
+                            and not self._flight.in_flight(key)):
+                        self._refreshing.add(key)
+                        self.refreshes += 1
+                        refresh = True
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+        if entry is None:
+            return self._load(key, loader)
+        if refresh:
+            self._refresh_in_background(key, refresh_loader or loader)
+        return value
+
+    def peek(self, key):
+        """
+        返回 key 当前缓存的值（不论是否过期），不存在时返回 None，不触发加载。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "refreshes": self.refreshes,
+                    "refreshing": len(self._refreshing), "size": len(self._entries)}
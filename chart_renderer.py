@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+import matplotlib.dates as mdates
+from config import CHART_DPI, CHART_FORMAT, CHART_RENDER_PROCESSES, CHART_RENDER_START_METHOD
+
+logger = logging.getLogger(__name__)
+
+matplotlib.rcParams['font.sans-serif'] = ['Heiti TC']
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+# 价格图各曲线：(数据键, 图例标签, 颜色, 线型)
+PRICE_SERIES = [
+    ("close", "收盘价", "black", "-"),
+    ("MA5", "MA5", "red", "-"),
+    ("MA10", "MA10", "orange", "-"),
+    ("MA20", "MA20", "green", "-"),
+    ("MA60", "MA60", "purple", "-"),
+    ("BOLL_upper", "BOLL上轨", "grey", "--"),
+    ("BOLL_lower", "BOLL下轨", "grey", "--"),
+]
+# 成交量图均线：(数据键, 图例标签, 颜色)
+VOLUME_SERIES = [
+    ("VOL_MA5", "MA5", "orange"),
+    ("VOL_MA10", "MA10", "purple"),
+    ("VOL_MA20", "MA20", "brown"),
+    ("VOL_MA60", "MA60", "blue"),
+]
+UP_COLOR = "red"
+DOWN_COLOR = "green"
+# 图表宽度（英寸）及绘图区左右边距（英寸）
+FIG_WIDTH = 10
+MARGIN_LEFT = 0.9
+MARGIN_RIGHT = 0.2
+
+# 每个进程（线程）复用的图表模板：图形、坐标轴、图例只创建一次，渲染时仅更新数据
+_templates = threading.local()
+
+
+def _new_axes(figsize, title_size=12):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.title.set_fontsize(title_size)
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True, linestyle='--', alpha=0.5)
+    # 固定边距（按英寸换算）代替 bbox_inches='tight'，省去保存时的额外布局计算
+    width, height = figsize
+    fig.subplots_adjust(left=MARGIN_LEFT / width, right=1 - MARGIN_RIGHT / width,
+                        top=1 - 0.45 / height, bottom=1.05 / height)
+    return fig, ax
+
+
+def _price_template():
+    tpl = getattr(_templates, "price", None)
+    if tpl is None:
+        fig, ax = _new_axes((FIG_WIDTH, 6))
+        ax.set_xlabel("日期", fontsize=10)
+        ax.set_ylabel("价格", fontsize=10)
+        lines = {}
+        for key, label, color, style in PRICE_SERIES:
+            lines[key], = ax.plot([], [], label=label, color=color, linestyle=style)
+        ax.legend(fontsize=8, loc="upper left")
+        tpl = _templates.price = (fig, ax, lines)
+    return tpl
+
+
+def _volume_template():
+    tpl = getattr(_templates, "volume", None)
+    if tpl is None:
+        fig, ax = _new_axes((FIG_WIDTH, 4))
+        ax.set_xlabel("日期", fontsize=10)
+        ax.set_ylabel("成交量", fontsize=10)
+        # 所有柱体合并为一个 PolyCollection，避免为每根柱子创建独立的 Rectangle
+        bars = PolyCollection([], label='成交量', facecolors=UP_COLOR, linewidths=0)
+        ax.add_collection(bars)
+        lines = {}
+        for key, label, color in VOLUME_SERIES:
+            lines[key], = ax.plot([], [], label=label, color=color)
+        ax.legend(fontsize=8, loc="upper left")
+        tpl = _templates.volume = (fig, ax, bars, lines)
+    return tpl
+
+
+def plot_width_px(dpi: int = None) -> int:
+    """
+    返回按给定 DPI 输出时绘图区的像素宽度，供降采样决定保留的点数/柱数。
+    """
+    return int((FIG_WIDTH - MARGIN_LEFT - MARGIN_RIGHT) * (dpi or CHART_DPI))
+
+
+def _set_limits(ax, x, ys, floor=None):
+    if len(x) == 0:
+        return
+    pad = max((x[-1] - x[0]) * 0.02, 1.0)
+    ax.set_xlim(x[0] - pad, x[-1] + pad)
+    stacked = np.concatenate([np.asarray(y, dtype="float64") for y in ys])
+    finite = stacked[np.isfinite(stacked)]
+    if finite.size == 0:
+        return
+    lo = finite.min() if floor is None else floor
+    hi = finite.max()
+    margin = (hi - lo) * 0.05 or 1.0
+    ax.set_ylim(lo - (0 if floor is not None else margin), hi + margin)
+
+
+def _save(fig, path: str, dpi: int, fmt: str):
+    fig.savefig(path, dpi=dpi, format=fmt)
+
+
+def render_price_chart(path: str, stock_name: str, dates, series: dict, dpi: int = None, fmt: str = None) -> str:
+    """
+    渲染收盘价走势图（收盘价、MA5/10/20/60、BOLL上下轨）。dates 为 matplotlib 日期数值（天）。
+    """
+    dpi = dpi or CHART_DPI
+    fmt = fmt or CHART_FORMAT
+    fig, ax, lines = _price_template()
+    x = np.asarray(dates, dtype="float64")
+    ax.set_title(f"{stock_name} 收盘价走势")
+    for key, line in lines.items():
+        line.set_data(x, series[key])
+    _set_limits(ax, x, [series[key] for key in lines])
+    _save(fig, path, dpi, fmt)
+    return path
+
+
+def render_volume_chart(path: str, stock_name: str, dates, volume, up, series: dict,
+                        dpi: int = None, fmt: str = None, bar_width: float = 0.8, title_suffix: str = "") -> str:
+    """
+    渲染成交量柱状图（涨红跌绿）及成交量均线。up 为布尔数组，True 表示收盘价不低于前一日。
+    bar_width 为柱宽（天），降采样后的周/月线应传入相应的柱宽，title_suffix 用于标注柱线周期。
+    """
+    dpi = dpi or CHART_DPI
+    fmt = fmt or CHART_FORMAT
+    fig, ax, bars, lines = _volume_template()
+    x = np.asarray(dates, dtype="float64")
+    v = np.nan_to_num(np.asarray(volume, dtype="float64"))
+    ax.set_title(f"{stock_name} 成交量{title_suffix}")
+    half = bar_width / 2
+    verts = np.empty((len(x), 4, 2))
+    verts[:, 0, 0] = verts[:, 1, 0] = x - half
+    verts[:, 2, 0] = verts[:, 3, 0] = x + half
+    verts[:, 0, 1] = verts[:, 3, 1] = 0
+    verts[:, 1, 1] = verts[:, 2, 1] = v
+    bars.set_verts(verts)
+    bars.set_facecolor(np.where(np.asarray(up, dtype=bool)[:, None],
+                                matplotlib.colors.to_rgba_array(UP_COLOR),
+                                matplotlib.colors.to_rgba_array(DOWN_COLOR)))
+    for key, line in lines.items():
+        line.set_data(x, series[key])
+    _set_limits(ax, x, [v] + [series[key] for key in lines], floor=0.0)
+    _save(fig, path, dpi, fmt)
+    return path
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                ctx = multiprocessing.get_context(CHART_RENDER_START_METHOD)
+                # 工作进程启动后先构建模板、加载字体，再开始接收渲染任务
+                _pool = ProcessPoolExecutor(max_workers=CHART_RENDER_PROCESSES, mp_context=ctx,
+                                            initializer=_warm_templates)
+    return _pool
+
+
+def _discard_pool(pool):
+    """
+    丢弃已损坏的进程池（工作进程异常退出后，进程池拒绝后续全部任务），下次使用时重新创建。
+    其他线程可能已替换为新的进程池，只在仍为同一个池时才置空。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _warm_templates():
+    """
+    构建当前进程（线程）的图表模板并绘制一次，触发中文字体查找与字形缓存。
+    """
+    for fig in (_price_template()[0], _volume_template()[0]):
+        fig.canvas.draw()
+
+
+def warm_up(timeout: float = 60.0) -> int:
+    """
+    预热图表渲染：在当前进程构建模板；启用渲染进程池时启动全部工作进程并等待其完成预热（超时为止），
+    返回已就绪的工作进程数。首个请求因此不再承担进程启动、模块导入和模板构建的耗时。
+    """
+    _warm_templates()
+    if CHART_RENDER_PROCESSES <= 0:
+        return 0
+    pool = _get_pool()
+    pids = set()
+    deadline = time.monotonic() + timeout
+    # 进程池按需启动工作进程，已就绪的进程可能连续取走多个任务，因此反复提交直到每个进程都响应过
+    while len(pids) < CHART_RENDER_PROCESSES and time.monotonic() < deadline:
+        futures = [pool.submit(os.getpid) for _ in range(CHART_RENDER_PROCESSES)]
+        pids.update(f.result() for f in futures)
+        if len(pids) < CHART_RENDER_PROCESSES:
+            time.sleep(0.05)
+    return len(pids)
+
+
+def render_charts(output_dir: str, stock_name: str, price: dict, volume: dict,
+                  dpi: int = None, fmt: str = None, processes: bool = True):
+    """
+    渲染价格图和成交量图，返回 (价格图路径, 成交量图路径)。
+    price: {"dates", "series"}；volume: {"dates", "volume", "up", "series", 可选 "bar_width", "title_suffix"}。
+    processes 为 True 且 CHART_RENDER_PROCESSES > 0 时两张图在进程池中并行渲染。
+    """
+    fmt = fmt or CHART_FORMAT
+    ext = "jpg" if fmt == "jpeg" else fmt
+    price_path = os.path.join(output_dir, f"price_chart.{ext}")
+    volume_path = os.path.join(output_dir, f"volume_chart.{ext}")
+    price_args = (price_path, stock_name, price["dates"], price["series"], dpi, fmt)
+    volume_args = (volume_path, stock_name, volume["dates"], volume["volume"], volume["up"], volume["series"],
+                   dpi, fmt, volume.get("bar_width", 0.8), volume.get("title_suffix", ""))
+    if processes and CHART_RENDER_PROCESSES > 0:
+        pool = _get_pool()
+        try:
+            f_price = pool.submit(render_price_chart, *price_args)
+            f_volume = pool.submit(render_volume_chart, *volume_args)
+            return f_price.result(), f_volume.result()
+        except BrokenProcessPool as e:
+            # 工作进程崩溃（内存不足、Agg/freetype 段错误等）：重建进程池，本次请求改为在当前进程内渲染
+            logger.warning("图表渲染进程池已损坏，重建进程池并在当前进程内渲染: %s", e)
+            _discard_pool(pool)
+    return render_price_chart(*price_args), render_volume_chart(*volume_args)
@@ -1,5 +1,142 @@
+import os
+
 # 智谱 API Key（请在此填写您的智谱 AI 接口密钥）
 ZHIPU_API_KEY = ""
 
 # Tushare API Token（请在此填写您的 Tushare API 密钥）
 TUSHARE_TOKEN = ""
+
+# 分析流水线并发线程数（互不依赖的阶段并发执行）
+PIPELINE_MAX_WORKERS = 8
+
+# 评分自洽采样：每个维度的采样次数、全进程评分请求并发上限
+SCORE_SAMPLES = 5
+SCORE_MAX_CONCURRENCY = 10
+# 自适应评分：先并发采样 SCORE_ADAPTIVE_MIN_SAMPLES 次，若有效评分极差不超过 SCORE_TOLERANCE 则提前停止
+SCORE_ADAPTIVE = False
+SCORE_ADAPTIVE_MIN_SAMPLES = 3
+SCORE_TOLERANCE = 5
+
+# 宏观分析缓存（与个股无关，全进程共享）：有效期（秒，默认一个交易日）及提前后台刷新的时间窗口
+MACRO_CACHE_TTL = 24 * 3600
+MACRO_CACHE_REFRESH_AHEAD = 30 * 60
+
+# 大模型响应本地缓存（SQLite，按模型+消息+采样参数的规范化哈希寻址）
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = os.path.join("cache", "llm_cache.sqlite3")
+LLM_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# 各调用点的缓存有效期（秒），0 表示不缓存；评分采样需要每次获得新的样本，因此不缓存；
+# 宏观分析已由进程内缓存按 MACRO_CACHE_TTL 复用，若再经本缓存，临近过期的后台刷新会命中同一份旧结果，因此不缓存
+LLM_CACHE_TTLS = {
+    "fund_ind_tech": 6 * 3600,
+    "macro": 0,
+    "ai_free": 6 * 3600,
+    "news_summary": 7 * 24 * 3600,
+    "score": 0,
+}
+LLM_CACHE_DEFAULT_TTL = 3600
+
+# 提示词 token 预算：各调用点输入的估算 token 数上限（不含图片）。超出时压缩并截断新闻摘要、前序分析等可变部分，
+# 使请求大小（及模型预填充耗时）不随前序输出的长短无限增长；未列出的调用点不限制
+PROMPT_BUDGETS = {
+    "fund_ind_tech": 3000,
+    "ai_free": 4000,
+    "score": 2000,
+    "news_summary": 3000,
+}
+
+# 本地日线行情列存储目录（每只股票一个子目录，内存映射的 .npy 列文件）
+BAR_STORE_DIR = os.path.join("cache", "bars")
+
+# 本地证券主数据（用于从查询文本中识别股票名称/代码/拼音缩写）；快照由 csv_to_jsonl.py 生成
+SECURITY_MASTER_CSV = "data.csv"
+SECURITY_MASTER_SNAPSHOT = "stock_master.snap"
+
+# 智谱 API 共享客户端：连接池大小、keep-alive、对 API 主机的并发上限、重试与退避（秒）、各类调用的超时（秒）
+ZHIPU_MAX_CONNECTIONS = 32
+ZHIPU_MAX_KEEPALIVE = 16
+ZHIPU_KEEPALIVE_EXPIRY = 60
+ZHIPU_MAX_CONCURRENCY = 16
+ZHIPU_MAX_RETRIES = 3
+ZHIPU_BACKOFF_BASE = 0.5
+ZHIPU_BACKOFF_MAX = 8.0
+ZHIPU_CALL_TIMEOUTS = {
+    "chat": 120,
+    "web_search": 20,
+}
+
+# 图表渲染：输出分辨率（DPI）、格式（png / webp）、渲染进程数（0 表示在当前进程内渲染）及进程启动方式
+CHART_DPI = 150
+CHART_FORMAT = "png"
+CHART_RENDER_PROCESSES = 2
+CHART_RENDER_START_METHOD = "spawn"
+
+# 三面分析的行情输入："images" 发送图表图片，"digest" 以近期行情与技术指标的文本表代替图片，"both" 两者都发送；
+# 图片按像素预算缩放（保持宽高比）后以紧凑格式编码（png 量化为 VISION_IMAGE_COLORS 色调色板，jpeg / webp 按质量有损压缩），
+# 编码结果缓存在图表所在的产物目录；数值摘要表包含的最近交易日数
+ANALYSIS_CHART_INPUT = "images"
+VISION_IMAGE_MAX_PIXELS = 1024 * 640
+VISION_IMAGE_FORMAT = "png"
+VISION_IMAGE_QUALITY = 80
+VISION_IMAGE_COLORS = 64
+DIGEST_ROWS = 20
+
+# 长区间图表降采样：每像素保留的曲线点数（LTTB），日线柱宽低于该像素数时改用周线/月线
+DOWNSAMPLE_POINTS_PER_PX = 1.0
+DOWNSAMPLE_MIN_BAR_PX = 2
+
+# 报告产物缓存（图表、导出文件、PDF）：按 (代码, 区间, 模式, 数据版本) 内容寻址复用；
+# 后台清理线程按最近访问时间淘汰，总大小上限（字节）、清理间隔（秒），未完成的目录超过该时长（秒）视为残留删除
+ARTIFACT_DIR = "tmp_reports"
+ARTIFACT_MAX_BYTES = 1024 * 1024 * 1024
+ARTIFACT_JANITOR_INTERVAL = 10 * 60
+ARTIFACT_ORPHAN_AGE = 3600
+
+# PDF报告：生成方式（"on_demand" 仅在用户点击生成时生成，"background" 分析完成后在后台线程生成）、
+# 嵌入图片按放置尺寸预缩放时使用的分辨率（DPI）及后台生成线程数
+PDF_GENERATION = "on_demand"
+PDF_IMAGE_DPI = 150
+PDF_WORKERS = 1
+
+# 行情数据导出：可选格式（csv / parquet / xlsx）及默认格式；导出文件按需生成，作为报告产物缓存在 ARTIFACT_DIR 下
+EXPORT_FORMATS = ["csv", "xlsx", "parquet"]
+EXPORT_DEFAULT_FORMAT = "csv"
+
+# 批量（自选股 / 行业）分析：同时分析的股票数上限，未指定日期范围时默认的回看天数
+BATCH_MAX_CONCURRENCY = 4
+BATCH_DEFAULT_DAYS = 365
+
+# 新闻搜索与摘要：并发线程数；近似重复判定的 MinHash 哈希个数与 Jaccard 相似度阈值；
+# 每个批量摘要请求包含的新闻条数（0 表示逐条并发摘要，逐条结果可命中大模型缓存）
+NEWS_MAX_WORKERS = 8
+NEWS_MINHASH_PERMUTATIONS = 128
+NEWS_DEDUP_JACCARD = 0.6
+NEWS_SUMMARY_BATCH_SIZE = 0
+
+# 新闻搜索结果缓存：按 (规范化查询, 搜索引擎, 域名过滤, 时间范围过滤, 条数) 共享；有效期、提前后台刷新时间、
+# 过期后仍可返回旧结果（同时后台刷新）的时长（秒）及最大条目数
+NEWS_CACHE_TTL = 30 * 60
+NEWS_CACHE_REFRESH_AHEAD = 5 * 60
+NEWS_CACHE_MAX_STALE = 6 * 3600
+NEWS_CACHE_MAX_ENTRIES = 2048
+
+# 行情数据源：按优先级排列的数据源；主源耗时超过其 p95 延迟时是否并发请求备用源（对冲请求）及启用对冲所需的最少样本数；
+# 延迟统计窗口（次）；熔断：连续失败次数达到阈值后熔断，冷却时间（秒）后放行一次试探请求
+MARKET_DATA_SOURCES = ["tushare", "akshare"]
+MARKET_DATA_HEDGE = True
+MARKET_DATA_HEDGE_MIN_SAMPLES = 20
+MARKET_DATA_LATENCY_WINDOW = 200
+MARKET_DATA_BREAKER_FAILURES = 3
+MARKET_DATA_BREAKER_COOLDOWN = 60
+
+# 运行指标：本地指标服务监听地址与端口（0 表示不启动，提供 /metrics 与 /metrics.json）、
+# 每个 span 名称保留用于计算分位数的最近耗时样本数；是否将每次请求的追踪（各 span 耗时、token 与字节数）写入报告目录的 trace.json
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_WINDOW = 1000
+TRACE_DUMP = False
+
+# 启动预热：python main.py 在开始接受请求前依次执行的预热步骤（空列表表示不预热，各项在首次使用时才初始化），可选：
+# security_master（证券主数据）、charts（图表模板、字体与渲染进程池）、pdf_font（reportlab 与 PDF 中文字体）、
+# zhipu_client（zhipuai SDK 与连接池）、market_data（tushare 接口、akshare）、llm_cache（模型响应缓存库）
+STARTUP_WARMUP = ["security_master", "charts", "pdf_font", "zhipu_client", "market_data", "llm_cache"]
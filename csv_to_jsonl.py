@@ -1,28 +1,21 @@
-import csv
 import json
+from security_snapshot import read_csv_rows, write_snapshot, csv_source
 
-# 读取 csv 文件并构建数据结构
-data_dict = {}
+# 读取 csv 文件的全部行（同名证券全部保留）
 csv_file_path = 'data.csv'
-with open(csv_file_path, 'r', encoding='utf-8') as csv_file:
-    reader = csv.DictReader(csv_file)
-    for row in reader:
-        name = row.get('name')
-        ts_code = row.get('ts_code')
-        industry = row.get('industry')
-        if name:
-            data_dict[name] = {
-                'ts_code': ts_code,
-                'industry': industry
-            }
+rows = read_csv_rows(csv_file_path)
 
 # 将构建好的数据写入 jsonl 文件
 jsonl_file_path = 'stock_info.jsonl'
 with open(jsonl_file_path, 'w', encoding='utf-8') as jsonl_file:
-    for name, info in data_dict.items():
+    for row in rows:
         json_line = {
-            'name': name,
-            'ts_code': info['ts_code'],
-            'industry': info['industry']
+            'name': row['name'],
+            'ts_code': row['ts_code'],
+            'industry': row['industry']
         }
-        jsonl_file.write(json.dumps(json_line, ensure_ascii=False) + '\n')
\ No newline at end of file
+        jsonl_file.write(json.dumps(json_line, ensure_ascii=False) + '\n')
+
+# 写入可内存映射的二进制快照（驻留字符串表 + 定长列 + ts_code/name 排序索引）
+snapshot_file_path = 'stock_master.snap'
+write_snapshot(rows, snapshot_file_path, csv_source(csv_file_path))
@@ -0,0 +1,134 @@
+import numpy as np
+from config import DOWNSAMPLE_POINTS_PER_PX, DOWNSAMPLE_MIN_BAR_PX
+
+# 各柱线周期的柱宽（天）及标题说明
+BAR_PERIODS = {
+    "D": (0.8, ""),
+    "W": (5.0, "（周线，日均）"),
+    "M": (21.0, "（月线，日均）"),
+}
+
+
+def lttb_indices(x, y, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（含首尾点）。
+    每个桶内选取与前一保留点、下一桶均值构成三角形面积最大的点，保留曲线的视觉形状。
+    y 中的 NaN 不参与面积计算（按 0 处理），仍可能被选中以保留缺口。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        # 当前桶 [lo, hi) 与下一桶 [nlo, nhi)
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        nlo = hi
+        nhi = min(int((i + 2) * every) + 1, n)
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def choose_bar_period(n_bars: int, width_px: int) -> str:
+    """
+    根据绘图区像素宽度选择柱线周期：日线柱宽不足 DOWNSAMPLE_MIN_BAR_PX 像素时改用周线，仍不足则用月线。
+    """
+    max_bars = max(width_px // DOWNSAMPLE_MIN_BAR_PX, 1)
+    if n_bars <= max_bars:
+        return "D"
+    if n_bars / 5 <= max_bars:
+        return "W"
+    return "M"
+
+
+def _period_bounds(dates, period: str):
+    days = np.asarray(dates).astype("datetime64[D]")
+    if period == "W":
+        # 1970-01-05 为周一，按自然周（周一至周日）分组
+        keys = (days.astype(np.int64) - 4) // 7
+    else:
+        keys = days.astype("datetime64[M]").astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:] - 1, [len(days) - 1]))
+    return starts, ends
+
+
+def resample_ohlcv(dates, ohlcv: dict, period: str) -> dict:
+    """
+    将日线 OHLCV 重采样为周线（"W"）或月线（"M"）：开盘取首、最高取最大、最低取最小、收盘取末、成交量求和。
+    返回的 date 为各周期最后一个交易日，另含 days（周期内交易日数）及 starts / ends 下标。
+    """
+    starts, ends = _period_bounds(dates, period)
+    out = {"date": np.asarray(dates)[ends], "starts": starts, "ends": ends, "days": ends - starts + 1}
+    if "open" in ohlcv:
+        out["open"] = np.asarray(ohlcv["open"], dtype="float64")[starts]
+    if "high" in ohlcv:
+        out["high"] = np.fmax.reduceat(np.asarray(ohlcv["high"], dtype="float64"), starts)
+    if "low" in ohlcv:
+        out["low"] = np.fmin.reduceat(np.asarray(ohlcv["low"], dtype="float64"), starts)
+    if "close" in ohlcv:
+        out["close"] = np.asarray(ohlcv["close"], dtype="float64")[ends]
+    if "volume" in ohlcv:
+        out["volume"] = np.add.reduceat(np.nan_to_num(np.asarray(ohlcv["volume"], dtype="float64")), starts)
+    return out
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    idx = np.where(np.isfinite(values), np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+def up_mask(close) -> np.ndarray:
+    """
+    收盘价（前值填充 NaN 后）不低于前一根时为 True。
+    """
+    c = _ffill(np.asarray(close, dtype="float64"))
+    up = np.zeros(len(c), dtype=bool)
+    up[1:] = c[1:] >= c[:-1]
+    return up
+
+
+def downsample_price(dates, series: dict, width_px: int, driver: str = "close"):
+    """
+    价格图曲线降采样：以 driver 列（收盘价）计算 LTTB 保留点，所有曲线共用同一组下标以保持对齐。
+    指标须已在全分辨率数据上计算完毕。返回 (dates, series)。
+    """
+    threshold = int(width_px * DOWNSAMPLE_POINTS_PER_PX)
+    idx = lttb_indices(dates, series[driver], threshold)
+    if len(idx) == len(dates):
+        return dates, series
+    return np.asarray(dates)[idx], {k: np.asarray(v)[idx] for k, v in series.items()}
+
+
+def downsample_volume(dates, close, volume, series: dict, width_px: int) -> dict:
+    """
+    成交量图降采样：按像素宽度自动选择日/周/月柱线。周/月线柱高为周期内日均成交量，
+    使其与全分辨率计算的成交量均线（取各周期最后一个交易日的值）处于同一量纲。
+    返回 {"dates", "volume", "up", "series", "bar_width", "title_suffix"}，dates 与输入类型一致。
+    """
+    period = choose_bar_period(len(dates), width_px)
+    bar_width, suffix = BAR_PERIODS[period]
+    if period == "D":
+        return {"dates": dates, "volume": np.asarray(volume), "up": up_mask(close), "series": series,
+                "bar_width": bar_width, "title_suffix": suffix}
+    agg = resample_ohlcv(dates, {"close": close, "volume": volume}, period)
+    ends = agg["ends"]
+    return {
+        "dates": agg["date"],
+        "volume": agg["volume"] / agg["days"],
+        "up": up_mask(agg["close"]),
+        "series": {k: np.asarray(v)[ends] for k, v in series.items()},
+        "bar_width": bar_width,
+        "title_suffix": suffix,
+    }
@@ -0,0 +1,110 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import artifacts
+import bar_store
+import indicators
+import stock_plotter
+import telemetry
+from config import EXPORT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# 导出的列：行情及全部技术指标
+EXPORT_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume'] + indicators.COLUMNS
+
+# 已注册的导出器：{格式: (文件扩展名, 写出函数)}；写出函数签名为 writer(path, df)
+EXPORTERS = {}
+
+
+def register(fmt: str, ext: str):
+    """
+    注册导出格式的装饰器。
+    """
+    def _wrap(writer):
+        EXPORTERS[fmt] = (ext, writer)
+        return writer
+    return _wrap
+
+
+@register("csv", "csv")
+def write_csv(path: str, df: pd.DataFrame):
+    df.to_csv(path, index=False, date_format="%Y-%m-%d", encoding="utf-8-sig")
+
+
+@register("parquet", "parquet")
+def write_parquet(path: str, df: pd.DataFrame):
+    # 依赖 pyarrow（或 fastparquet），未安装时由 pandas 抛出 ImportError
+    df.to_parquet(path, index=False)
+
+
+@register("xlsx", "xlsx")
+def write_xlsx(path: str, df: pd.DataFrame):
+    """
+    以 xlsxwriter 的 constant_memory 模式逐行流式写出，内存占用与行数无关。
+    日期以 Excel 日期序列数写入并设置日期格式，NaN 写为空单元格。
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        sheet = workbook.add_worksheet("Sheet1")
+        date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+        columns = list(df.columns)
+        sheet.write_row(0, 0, columns)
+        sheet.set_column(0, 0, 12)
+        serials = (df["date"].values.astype("datetime64[D]") - np.datetime64("1899-12-30", "D")).astype(np.int64)
+        values = df[columns[1:]].to_numpy(dtype="float64")
+        finite = np.isfinite(values)
+        for row in range(len(df)):
+            sheet.write_number(row + 1, 0, int(serials[row]), date_format)
+            row_values = values[row]
+            row_finite = finite[row]
+            for col in range(len(columns) - 1):
+                if row_finite[col]:
+                    sheet.write_number(row + 1, col + 1, row_values[col])
+    finally:
+        workbook.close()
+
+
+def available_formats() -> list:
+    """
+    返回配置中启用且已注册的导出格式。
+    """
+    return [fmt for fmt in EXPORT_FORMATS if fmt in EXPORTERS]
+
+
+def export_history(ts_code: str, start_date: str, end_date: str, fmt: str) -> str:
+    """
+    导出 [start_date, end_date] 的行情及技术指标，返回文件路径。
+    导出文件作为报告产物按 (代码, 区间, 本地行情数据版本, 格式) 内容寻址缓存，数据未变化时直接复用；
+    由产物缓存的后台清理按最近访问时间淘汰（相对日期的查询每天区间不同，旧文件不再累积）。
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    ext, writer = EXPORTERS[fmt]
+    df = stock_plotter.load_history(ts_code, start_date, end_date)
+    store = artifacts.get_store()
+    code_for_file = ts_code.replace('.', '_')
+    key = artifacts.artifact_key(ts_code, start_date, end_date, "export", fmt, bar_store.version(ts_code))
+    entry_dir = store.entry_dir(key, f"{code_for_file}_export")
+    name = f"export_{fmt}"
+    built = []
+
+    def _build(out_dir):
+        path = os.path.join(out_dir, f"{code_for_file}_{start_date}_{end_date}.{ext}")
+        with telemetry.span("export", fmt=fmt, rows=len(df)) as sp:
+            with telemetry.span("indicators", rows=len(df)):
+                ind = indicators.for_frame(df)
+            df_to_save = df.assign(**ind)[EXPORT_COLUMNS]
+            tmp_path = f"{path}.tmp.{ext}"
+            writer(tmp_path, df_to_save)
+            os.replace(tmp_path, path)
+            sp["bytes"] = os.path.getsize(path)
+        built.append(path)
+        logger.info("导出行情数据 %s -> %s", ts_code, path)
+        return {name: path}
+    path = store.get_or_create(entry_dir, (name,), _build)[name]
+    if not built:
+        telemetry.incr("export_reused_total", fmt=fmt)
+    return path
@@ -0,0 +1,363 @@
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 所有函数均支持 1 维（单只股票）或 2 维（多只股票 × 交易日）数组，时间沿最后一个轴；
+# 窗口内存在 NaN 或数据不足时结果为 NaN，与 pandas rolling(window).mean()/std() 的默认行为一致。
+MA_WINDOWS = (5, 10, 20, 60)
+VOL_MA_WINDOWS = (5, 10, 20, 60)
+BOLL_WINDOW = 20
+BOLL_K = 2
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_WINDOW = 14
+KDJ_WINDOW, KDJ_K_SMOOTH, KDJ_D_SMOOTH = 9, 3, 3
+# ewm 闭式解分块计算时单块内衰减系数累乘的对数上限（exp(500) 约 1e217，留足 float64 余量）
+_EWM_LOG_SPAN = 500.0
+
+# compute_all 输出的全部列（stock_plotter 绘图与 Excel 导出共用）
+COLUMNS = ([f"MA{w}" for w in MA_WINDOWS] + ["BOLL_mid", "BOLL_upper", "BOLL_lower"]
+           + [f"VOL_MA{w}" for w in VOL_MA_WINDOWS] + ["DIF", "DEA", "MACD", "RSI", "K", "D", "J"])
+
+
+def _window_sums(x: np.ndarray, window: int):
+    """
+    返回 (窗口和, 窗口内有效值个数)，与 x 同形状，前 window-1 个位置无完整窗口。
+    """
+    valid = np.isfinite(x)
+    filled = np.where(valid, x, 0.0)
+    pad = [(0, 0)] * (x.ndim - 1) + [(1, 0)]
+    cs = np.cumsum(np.pad(filled, pad), axis=-1)
+    cnt = np.cumsum(np.pad(valid.astype(np.int64), pad), axis=-1)
+    sums = np.full(x.shape, np.nan)
+    counts = np.zeros(x.shape, dtype=np.int64)
+    if x.shape[-1] >= window:
+        sums[..., window - 1:] = cs[..., window:] - cs[..., :-window]
+        counts[..., window - 1:] = cnt[..., window:] - cnt[..., :-window]
+    return sums, counts
+
+
+def sma(x, window: int) -> np.ndarray:
+    """
+    简单移动平均（基于累加和，整体 O(n)）。
+    """
+    x = np.asarray(x, dtype="float64")
+    sums, counts = _window_sums(x, window)
+    return np.where(counts == window, sums / window, np.nan)
+
+
+def rolling_std(x, window: int, ddof: int = 1) -> np.ndarray:
+    """
+    滚动标准差（样本标准差，ddof=1 与 pandas 一致）。先减去首个有效值以降低平方和相减的数值误差。
+    """
+    x = np.asarray(x, dtype="float64")
+    finite = x[np.isfinite(x)]
+    shifted = x - (finite[0] if finite.size else 0.0)
+    sums, counts = _window_sums(shifted, window)
+    sq_sums, _ = _window_sums(shifted * shifted, window)
+    var = (sq_sums - sums * sums / window) / (window - ddof)
+    return np.where(counts == window, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+
+def _rolling_extreme(x: np.ndarray, window: int, func) -> np.ndarray:
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] >= window:
+        out[..., window - 1:] = func(sliding_window_view(x, window, axis=-1), axis=-1)
+    return out
+
+
+def rolling_max(x, window: int) -> np.ndarray:
+    return _rolling_extreme(np.asarray(x, dtype="float64"), window, np.max)
+
+
+def rolling_min(x, window: int) -> np.ndarray:
+    return _rolling_extreme(np.asarray(x, dtype="float64"), window, np.min)
+
+
+def ewm(x, alpha: float, init=None) -> np.ndarray:
+    """
+    指数加权平均（递推式 y_t = alpha * x_t + (1 - alpha) * y_{t-1}，即 pandas ewm(adjust=False)），alpha 取 (0, 1)。
+    NaN 处沿用上一值；init 为首个有效值之前的初始值，为 None 时以首个有效值起算，之前的位置为 NaN。
+    按闭式解整体向量化：y_t = P_t * (y_0 + sum_k alpha * x_k / P_k)，P_t 为衰减系数的累乘（NaN 处系数为 1），
+    在对数域累加并按块重新起算，使块内 1 / P_k 不超过 exp(_EWM_LOG_SPAN)，避免长序列上溢或下溢。
+    """
+    x = np.asarray(x, dtype="float64")
+    valid = np.isfinite(x)
+    weighted = np.where(valid, alpha * x, 0.0)
+    log_beta = np.where(valid, np.log1p(-alpha), 0.0)
+    n = x.shape[-1]
+    if n == 0:
+        return x.copy()
+    if init is None:
+        first = np.argmax(valid, axis=-1)
+        seed = np.where(valid.any(axis=-1), np.take_along_axis(x, first[..., None], axis=-1)[..., 0], np.nan)
+    else:
+        seed = np.full(x.shape[:-1], init, dtype="float64")
+    out = np.empty(x.shape)
+    prev = seed
+    block = max(int(_EWM_LOG_SPAN / -np.log1p(-alpha)), 1)
+    for s in range(0, n, block):
+        log_p = np.cumsum(log_beta[..., s:s + block], axis=-1)
+        acc = np.cumsum(weighted[..., s:s + block] * np.exp(-log_p), axis=-1)
+        out[..., s:s + block] = np.exp(log_p) * (prev[..., None] + acc)
+        prev = out[..., min(s + block, n) - 1]
+    if init is None:
+        # 首个有效值之前没有可沿用的值
+        out[np.arange(n) < first[..., None]] = np.nan
+    return out
+
+
+def ema(x, span: int) -> np.ndarray:
+    return ewm(x, 2.0 / (span + 1))
+
+
+def boll(close, window: int = BOLL_WINDOW, k: float = BOLL_K):
+    """
+    布林带，返回 (中轨, 上轨, 下轨)。
+    """
+    mid = sma(close, window)
+    std = rolling_std(close, window)
+    return mid, mid + k * std, mid - k * std
+
+
+def macd(close, fast: int = MACD_FAST, slow: int = MACD_SLOW, signal: int = MACD_SIGNAL):
+    """
+    MACD，返回 (DIF, DEA, MACD柱)，MACD柱 = 2 * (DIF - DEA)。
+    """
+    dif = ema(close, fast) - ema(close, slow)
+    dea = ema(dif, signal)
+    return dif, dea, 2 * (dif - dea)
+
+
+def _diff(close: np.ndarray) -> np.ndarray:
+    delta = np.full(close.shape, np.nan)
+    delta[..., 1:] = close[..., 1:] - close[..., :-1]
+    return delta
+
+
+def rsi(close, window: int = RSI_WINDOW) -> np.ndarray:
+    """
+    RSI（Wilder 平滑，alpha = 1/window）。
+    """
+    close = np.asarray(close, dtype="float64")
+    delta = _diff(close)
+    gain = ewm(np.where(np.isfinite(delta), np.maximum(delta, 0.0), np.nan), 1.0 / window)
+    loss = ewm(np.where(np.isfinite(delta), np.maximum(-delta, 0.0), np.nan), 1.0 / window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100.0 - 100.0 / (1.0 + gain / loss)
+    out = np.where(loss == 0, np.where(gain > 0, 100.0, 50.0), out)
+    return np.where(np.isfinite(gain), out, np.nan)
+
+
+def kdj(high, low, close, window: int = KDJ_WINDOW, k_smooth: int = KDJ_K_SMOOTH, d_smooth: int = KDJ_D_SMOOTH):
+    """
+    KDJ，返回 (K, D, J)。RSV = (C - N日最低) / (N日最高 - N日最低) * 100，K、D 以 50 为初值平滑，J = 3K - 2D。
+    """
+    close = np.asarray(close, dtype="float64")
+    hh = rolling_max(high, window)
+    ll = rolling_min(low, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsv = np.where(hh > ll, (close - ll) / (hh - ll) * 100.0, np.where(np.isfinite(hh), 50.0, np.nan))
+    k = ewm(rsv, 1.0 / k_smooth, init=50.0)
+    d = ewm(k, 1.0 / d_smooth, init=50.0)
+    k = np.where(np.isfinite(rsv), k, np.nan)
+    d = np.where(np.isfinite(rsv), d, np.nan)
+    return k, d, 3 * k - 2 * d
+
+
+def compute_all(high, low, close, volume) -> dict:
+    """
+    一次计算全部指标，返回 {列名: 数组}，列名见 COLUMNS。输入可为 1 维或 2 维（多只股票批量）数组。
+    """
+    close = np.asarray(close, dtype="float64")
+    volume = np.asarray(volume, dtype="float64")
+    out = {}
+    for w in MA_WINDOWS:
+        out[f"MA{w}"] = sma(close, w)
+    out["BOLL_mid"], out["BOLL_upper"], out["BOLL_lower"] = boll(close)
+    for w in VOL_MA_WINDOWS:
+        out[f"VOL_MA{w}"] = sma(volume, w)
+    out["DIF"], out["DEA"], out["MACD"] = macd(close)
+    out["RSI"] = rsi(close)
+    out["K"], out["D"], out["J"] = kdj(high, low, close)
+    return out
+
+
+class IndicatorState:
+    """
+    单只股票的指标滚动状态：由历史数据初始化后，每追加一根新K线只需 O(1) 更新
+    （窗口和增量维护、EMA/Wilder 平滑递推、KDJ 在固定 9 根窗口内取极值），
+    可通过 to_dict / from_dict 持久化，避免每次请求从头计算。假定追加的K线数据均为有效数值。
+    """
+
+    def __init__(self):
+        max_window = max(max(MA_WINDOWS), max(VOL_MA_WINDOWS), BOLL_WINDOW)
+        self.closes = deque(maxlen=max_window)
+        self.volumes = deque(maxlen=max_window)
+        self.highs = deque(maxlen=KDJ_WINDOW)
+        self.lows = deque(maxlen=KDJ_WINDOW)
+        self.close_sums = {w: 0.0 for w in MA_WINDOWS}
+        self.volume_sums = {w: 0.0 for w in VOL_MA_WINDOWS}
+        self.boll_sq_sum = 0.0
+        self.ema_fast = None
+        self.ema_slow = None
+        self.dea = None
+        self.avg_gain = None
+        self.avg_loss = None
+        self.k = 50.0
+        self.d = 50.0
+        self.count = 0
+
+    @classmethod
+    def from_history(cls, high, low, close, volume):
+        """
+        由完整历史构建状态，与逐根调用 update 等价；递推量取向量化计算结果的最后一个值，不逐根循环。
+        """
+        high, low, close, volume = (np.asarray(a, dtype="float64") for a in (high, low, close, volume))
+        state = cls()
+        n = close.shape[-1]
+        if n == 0:
+            return state
+        state.closes.extend(close[-state.closes.maxlen:].tolist())
+        state.volumes.extend(volume[-state.volumes.maxlen:].tolist())
+        state.highs.extend(high[-KDJ_WINDOW:].tolist())
+        state.lows.extend(low[-KDJ_WINDOW:].tolist())
+        state.close_sums = {w: float(close[-w:].sum()) for w in MA_WINDOWS}
+        state.volume_sums = {w: float(volume[-w:].sum()) for w in VOL_MA_WINDOWS}
+        state.boll_sq_sum = float((close[-BOLL_WINDOW:] ** 2).sum())
+        ema_fast, ema_slow = ema(close, MACD_FAST), ema(close, MACD_SLOW)
+        state.ema_fast, state.ema_slow = float(ema_fast[-1]), float(ema_slow[-1])
+        state.dea = float(ema(ema_fast - ema_slow, MACD_SIGNAL)[-1])
+        if n >= 2:
+            delta = np.diff(close)
+            state.avg_gain = float(ewm(np.maximum(delta, 0.0), 1.0 / RSI_WINDOW)[-1])
+            state.avg_loss = float(ewm(np.maximum(-delta, 0.0), 1.0 / RSI_WINDOW)[-1])
+        if n >= KDJ_WINDOW:
+            k, d, _ = kdj(high, low, close)
+            state.k, state.d = float(k[-1]), float(d[-1])
+        state.count = n
+        return state
+
+    @staticmethod
+    def _slide(buf: deque, sums: dict, value: float):
+        # 在新值入队前，从各窗口和中扣除即将滑出窗口的值
+        n = len(buf)
+        for w in sums:
+            if n >= w:
+                sums[w] -= buf[n - w]
+            sums[w] += value
+        buf.append(value)
+
+    def update(self, high: float, low: float, close: float, volume: float) -> dict:
+        """
+        追加一根K线并返回最新一根的全部指标值（列名同 COLUMNS）。
+        """
+        prev_close = self.closes[-1] if self.closes else None
+        n = len(self.closes)
+        if n >= BOLL_WINDOW:
+            self.boll_sq_sum -= self.closes[n - BOLL_WINDOW] ** 2
+        self.boll_sq_sum += close * close
+        self._slide(self.closes, self.close_sums, close)
+        self._slide(self.volumes, self.volume_sums, volume)
+        self.highs.append(high)
+        self.lows.append(low)
+        self.count += 1
+        out = {}
+        for w in MA_WINDOWS:
+            out[f"MA{w}"] = self.close_sums[w] / w if self.count >= w else np.nan
+        for w in VOL_MA_WINDOWS:
+            out[f"VOL_MA{w}"] = self.volume_sums[w] / w if self.count >= w else np.nan
+        if self.count >= BOLL_WINDOW:
+            s = self.close_sums[BOLL_WINDOW]
+            var = max((self.boll_sq_sum - s * s / BOLL_WINDOW) / (BOLL_WINDOW - 1), 0.0)
+            mid = s / BOLL_WINDOW
+            out["BOLL_mid"], out["BOLL_upper"], out["BOLL_lower"] = mid, mid + BOLL_K * var ** 0.5, mid - BOLL_K * var ** 0.5
+        else:
+            out["BOLL_mid"] = out["BOLL_upper"] = out["BOLL_lower"] = np.nan
+        a_fast, a_slow, a_sig = 2.0 / (MACD_FAST + 1), 2.0 / (MACD_SLOW + 1), 2.0 / (MACD_SIGNAL + 1)
+        self.ema_fast = close if self.ema_fast is None else a_fast * close + (1 - a_fast) * self.ema_fast
+        self.ema_slow = close if self.ema_slow is None else a_slow * close + (1 - a_slow) * self.ema_slow
+        dif = self.ema_fast - self.ema_slow
+        self.dea = dif if self.dea is None else a_sig * dif + (1 - a_sig) * self.dea
+        out["DIF"], out["DEA"], out["MACD"] = dif, self.dea, 2 * (dif - self.dea)
+        if prev_close is None:
+            out["RSI"] = np.nan
+        else:
+            delta = close - prev_close
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            a = 1.0 / RSI_WINDOW
+            self.avg_gain = gain if self.avg_gain is None else a * gain + (1 - a) * self.avg_gain
+            self.avg_loss = loss if self.avg_loss is None else a * loss + (1 - a) * self.avg_loss
+            if self.avg_loss == 0:
+                out["RSI"] = 100.0 if self.avg_gain > 0 else 50.0
+            else:
+                out["RSI"] = 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+        if self.count >= KDJ_WINDOW:
+            hh, ll = max(self.highs), min(self.lows)
+            rsv = (close - ll) / (hh - ll) * 100.0 if hh > ll else 50.0
+            self.k = self.k * (1 - 1.0 / KDJ_K_SMOOTH) + rsv / KDJ_K_SMOOTH
+            self.d = self.d * (1 - 1.0 / KDJ_D_SMOOTH) + self.k / KDJ_D_SMOOTH
+            out["K"], out["D"], out["J"] = self.k, self.d, 3 * self.k - 2 * self.d
+        else:
+            out["K"] = out["D"] = out["J"] = np.nan
+        return out
+
+    def update_many(self, high, low, close, volume) -> dict:
+        """
+        依次追加多根K线，返回这些K线的全部指标 {列名: 数组}（列名同 COLUMNS）。
+        """
+        rows = [self.update(h, l, c, v) for h, l, c, v in zip(high, low, close, volume)]
+        return {col: np.array([row[col] for row in rows], dtype="float64") for col in COLUMNS}
+
+    def to_dict(self) -> dict:
+        return {
+            "closes": list(self.closes), "volumes": list(self.volumes),
+            "highs": list(self.highs), "lows": list(self.lows),
+            "close_sums": {str(k): v for k, v in self.close_sums.items()},
+            "volume_sums": {str(k): v for k, v in self.volume_sums.items()},
+            "boll_sq_sum": self.boll_sq_sum, "ema_fast": self.ema_fast, "ema_slow": self.ema_slow,
+            "dea": self.dea, "avg_gain": self.avg_gain, "avg_loss": self.avg_loss,
+            "k": self.k, "d": self.d, "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        state = cls()
+        state.closes.extend(data["closes"])
+        state.volumes.extend(data["volumes"])
+        state.highs.extend(data["highs"])
+        state.lows.extend(data["lows"])
+        state.close_sums = {int(k): v for k, v in data["close_sums"].items()}
+        state.volume_sums = {int(k): v for k, v in data["volume_sums"].items()}
+        for key in ("boll_sq_sum", "ema_fast", "ema_slow", "dea", "avg_gain", "avg_loss", "k", "d", "count"):
+            setattr(state, key, data[key])
+        return state
+
+
+def verify_incremental(high, low, close, volume, split: int = None) -> float:
+    """
+    校验增量状态与整体重算一致：用前 split 根K线（默认一半）构建 IndicatorState，再逐根追加其余K线，
+    返回追加部分各指标与 compute_all 结果的最大相对误差（以 max(|重算值|, 1) 为分母；两边均为 NaN 的位置不计，仅一边为 NaN 时返回 inf）。
+    """
+    high, low, close, volume = (np.asarray(a, dtype="float64") for a in (high, low, close, volume))
+    split = len(close) // 2 if split is None else split
+    state = IndicatorState.from_history(high[:split], low[:split], close[:split], volume[:split])
+    tail = state.update_many(high[split:], low[split:], close[split:], volume[split:])
+    full = compute_all(high, low, close, volume)
+    worst = 0.0
+    for col in COLUMNS:
+        a, b = tail[col], full[col][split:]
+        if not np.array_equal(np.isnan(a), np.isnan(b)):
+            return float("inf")
+        if a.size:
+            worst = max(worst, float(np.nanmax(np.abs(a - b) / np.maximum(np.abs(b), 1.0), initial=0.0)))
+    return worst
+
+
+def for_frame(df) -> dict:
+    """
+    返回行情 DataFrame 各行的全部指标 {列名: 数组}：df 已带有指标列（bar_store 随K线追加增量维护）时直接取用，
+    否则在 df 的 high/low/close/volume 上整体计算。
+    """
+    if all(col in df.columns for col in COLUMNS):
+        return {col: df[col].to_numpy(dtype="float64") for col in COLUMNS}
+    return compute_all(df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), df["volume"].to_numpy())
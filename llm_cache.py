@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import telemetry
+from config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTLS, LLM_CACHE_DEFAULT_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    """
+    规范化请求内容：字符串去除首尾空白，字典按键排序，用于生成稳定的缓存键。
+    """
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(value[k]) for k in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(model: str, messages: list, **params) -> str:
+    """
+    基于模型名、消息列表和采样参数生成内容寻址的缓存键（SHA-256）。
+    """
+    payload = {"model": model, "messages": _normalize(messages),
+               "params": _normalize({k: v for k, v in params.items() if v is not None})}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    基于 SQLite 的本地大模型响应缓存。
+    每条记录带有独立 TTL，总大小超过 max_bytes 时按最近访问时间淘汰（LRU），
+    并按调用点统计命中/未命中次数。多个 Gradio 工作线程共享同一连接（加锁访问）。
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, call_site TEXT, content TEXT, size INTEGER,"
+            " created REAL, expires REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str, call_site: str = ""):
+        """
+        读取缓存内容，未命中或已过期时返回 None。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, expires, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total -= row[2]
+                row = None
+            if row is None:
+                self.misses[call_site] = self.misses.get(call_site, 0) + 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[call_site] = self.hits.get(call_site, 0) + 1
+            return row[0]
+
+    def put(self, key: str, content: str, ttl: float, call_site: str = ""):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, call_site, content, size, created, expires, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, call_site, content, size, now, now + ttl, now),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """
+        先删除所有过期记录，仍超出上限时按最近访问时间从旧到新删除，直到总大小低于上限的 90%。
+        """
+        self._conn.execute("DELETE FROM responses WHERE expires < ?", (now,))
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._total <= target:
+            return
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            victims.append((key,))
+            freed += size
+            if self._total - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._total -= freed
+
+    def stats(self) -> dict:
+        """
+        返回各调用点的命中/未命中次数及缓存总大小。
+        """
+        with self._lock:
+            sites = set(self.hits) | set(self.misses)
+            per_site = {s: {"hits": self.hits.get(s, 0), "misses": self.misses.get(s, 0)} for s in sites}
+            return {"bytes": self._total, "call_sites": per_site}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """
+    返回进程级共享的缓存实例（首次使用时创建）。
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _request_bytes(messages) -> int:
+    # 请求消息体的大小（多模态消息中的图片按 Data URI 计入）
+    return len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+
+
+def _record_usage(sp: dict, call_site: str, usage, content: str):
+    """
+    记录单次模型调用的 token 数与响应字节数（写入 span 属性并累加计数器）。
+    """
+    sp["response_bytes"] = len(content.encode("utf-8"))
+    telemetry.incr("llm_bytes_total", sp["request_bytes"], call_site=call_site, direction="request")
+    telemetry.incr("llm_bytes_total", sp["response_bytes"], call_site=call_site, direction="response")
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            sp[kind] = value
+            telemetry.incr("llm_tokens_total", value, call_site=call_site, kind=kind[:-len("_tokens")])
+
+
+def _create(client, call_site: str, on_token=None, **kwargs) -> str:
+    """
+    请求模型并返回回复文本。提供 on_token 时以流式方式请求，每收到一段增量即以累计文本回调 on_token。
+    每次请求记录为名为 "llm.<调用点>" 的 span，附带请求/响应字节数及接口返回的 token 数。
+    """
+    with telemetry.span(f"llm.{call_site}", model=kwargs.get("model"),
+                        request_bytes=_request_bytes(kwargs.get("messages"))) as sp:
+        if on_token is None:
+            response = client.chat.completions.create(**kwargs)
+            content = response.choices[0].message.content
+            _record_usage(sp, call_site, getattr(response, "usage", None), content)
+            return content
+        parts = []
+        usage = None
+        for chunk in client.chat.completions.create(stream=True, **kwargs):
+            # 流式响应的 token 用量在最后一个分片中返回
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token("".join(parts))
+        content = "".join(parts)
+        _record_usage(sp, call_site, usage, content)
+        return content
+
+
+def chat_completion(client, call_site: str, use_cache: bool = True, on_token=None, **kwargs) -> str:
+    """
+    调用 client.chat.completions.create(**kwargs) 并返回回复文本，结果按调用点 TTL 缓存。
+    use_cache=False 或该调用点 TTL 为 0 时直接请求模型（如评分采样需要每次获得新的样本）。
+    提供 on_token 时未命中缓存的请求以流式方式返回，命中缓存时以完整文本回调一次。
+    """
+    ttl = LLM_CACHE_TTLS.get(call_site, LLM_CACHE_DEFAULT_TTL)
+    if not (LLM_CACHE_ENABLED and use_cache and ttl > 0):
+        return _create(client, call_site, on_token, **kwargs)
+    params = {k: v for k, v in kwargs.items() if k not in ("model", "messages")}
+    key = make_key(kwargs.get("model"), kwargs.get("messages"), **params)
+    cache = get_cache()
+    try:
+        cached = cache.get(key, call_site)
+    except sqlite3.Error as e:
+        logger.warning("读取大模型缓存失败: %s", e)
+        cached = None
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached)
+        return cached
+    content = _create(client, call_site, on_token, **kwargs)
+    try:
+        cache.put(key, content, ttl, call_site)
+    except sqlite3.Error as e:
+        logger.warning("写入大模型缓存失败: %s", e)
+    return content
+
+
+def _metrics() -> list:
+    # 各调用点的缓存命中率；缓存尚未创建时无数据
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    samples = [("llm_cache_bytes", {}, stats["bytes"])]
+    for call_site, counts in sorted(stats["call_sites"].items()):
+        samples.extend(telemetry.cache_samples("llm", counts, call_site=call_site))
+    return samples
+
+
+telemetry.register_collector(_metrics)
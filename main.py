@@ -1,31 +1,57 @@
 import os
-import shutil
-import time
-from datetime import datetime
-import gradio as gr
-import analyzer
-import stock_plotter
-import nlp_parser
-
-# 清理过期文件（删除 tmp_reports 中1小时之前的文件夹）
-def clear_expired_reports():
-    base_dir = "tmp_reports"
-    if not os.path.isdir(base_dir):
-        return
-    now = time.time()
-    for fname in os.listdir(base_dir):
-        fpath = os.path.join(base_dir, fname)
-        if os.path.isdir(fpath):
-            mtime = os.path.getmtime(fpath)
-            # 删除1小时之前的文件夹
-            if now - mtime > 3600:
-                shutil.rmtree(fpath, ignore_errors=True)
-
-# 处理用户查询的主函数
+import json
+import logging
+import artifacts
+import pipeline
+import telemetry
+import warmup
+from cache_utils import SingleFlight, StreamFlight
+from config import PDF_GENERATION, EXPORT_DEFAULT_FORMAT, TRACE_DUMP, STARTUP_WARMUP
+
+logger = logging.getLogger(__name__)
+
+# 相同查询的并发请求合并：数据模式共享结果，分析模式共享阶段事件流
+_data_flight = SingleFlight("on_query.data")
+_analysis_flight = StreamFlight("on_query.analysis")
+
+# 模块级只导入轻量模块；gradio 与依赖 pandas / matplotlib / 大模型 SDK 的业务模块（analyzer、nlp_parser、
+# report_pipeline、exporters、report_pdf）在处理函数和 build_demo 中导入，界面在启动时才构建。
+# 图表渲染进程以 spawn 方式启动时会重新导入本模块（__mp_main__），这样工作进程不必导入这些模块、构建界面
+
+# 左侧五个分析栏目：(键, 标题)
+SECTIONS = [("fund", "基本面分析"), ("industry", "行业分析"), ("tech", "技术面分析"),
+            ("macro", "宏观分析"), ("ai", "AI分析")]
+
+def _section_markdown(title, text, score=None):
+    """
+    组织左侧输出内容，标题和评分加粗显示，内容换行显示；评分尚未完成时显示“评分中”。
+    """
+    score_text = "评分中…" if score is None else f"评分：{score}"
+    return f"**{title}（{score_text}）**\n{text}"
+
+def _chart_outputs(charts, data_source):
+    """
+    图表输出，标题中标注行情数据来源；数据缺失或部分区间获取失败时提示用户。
+    """
+    import gradio as gr
+    if not data_source["complete"]:
+        gr.Warning(f"行情数据获取不完整，数据来源：{data_source['text']}")
+    return (gr.update(value=charts[0], label=f"股价走势（数据来源：{data_source['text']}）"),
+            gr.update(value=charts[1], label=f"成交量走势（数据来源：{data_source['text']}）"))
+
+# 处理用户查询的主函数（生成器：各部分结果就绪后立即推送到界面）
 def on_query(user_input):
-    clear_expired_reports()
+    import gradio as gr
+    import analyzer
+    import exporters
+    import nlp_parser
+    import report_pdf
+    import report_pipeline
+    # 本次请求的追踪：解析、行情、新闻、各次模型调用、评分等环节的耗时与 token/字节数
+    trace = telemetry.Trace("on_query", query=user_input)
     # 解析用户输入
-    parse_result = nlp_parser.parse_user_query(user_input)
+    with trace.activate(), telemetry.span("parse"):
+        parse_result = nlp_parser.parse_user_query(user_input)
     stock_code = parse_result.get("stock_code", "")
     stock_name = parse_result.get("stock_name", "")
     industry_name = parse_result.get("industry_name", "")  # 可能由 parse_user_query 提取
@@ -33,135 +59,273 @@ def on_query(user_input):
     end_date = parse_result.get("end_date", "")
     mode = parse_result.get("mode", "analysis")
 
+    trace.attrs.update(stock_code=stock_code, mode=mode)
+    telemetry.incr("requests_total", mode=mode)
+
     # 如果解析未得到股票代码但有名称，再尝试从名称映射代码
     if not stock_code and stock_name:
         # parse_user_query内部已尝试，如仍没有则在此返回错误提示
-        raise gr.Error(f"无法识别股票代码，请确认输入的股票名称/代码: {stock_name}")
+        error = gr.Error(f"无法识别股票代码，请确认输入的股票名称/代码: {stock_name}")
+        trace.finish(error=error)
+        raise error
 
-    # 创建用于保存本次报告的目录
-    os.makedirs("tmp_reports", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 本次报告的产物目录由图表阶段按查询内容确定（相同查询复用），过期产物由后台线程清理
     code_for_dir = stock_code.replace('.', '_') if stock_code else stock_name
-    report_dir = os.path.join("tmp_reports", f"{code_for_dir}_{timestamp}")
-    os.makedirs(report_dir, exist_ok=True)
+    export_query = (stock_code, start_date, end_date)
+
+    # 相同查询（代码, 起止日期, 模式）的并发请求合并为一次计算
+    query_key = (stock_code, start_date, end_date, mode)
+
+    # 本请求是否实际执行了计算（而非合并到进行中的相同查询上）：只有执行计算的请求的追踪含有各环节 span
+    led = []
 
     # 根据查询模式执行不同操作
     if mode == "data":
-        # 数据模式，仅返回历史数据Excel文件（和图表）
-        price_chart_path, volume_chart_path, excel_path = stock_plotter.generate_charts(stock_code, stock_name, start_date, end_date, report_dir)
-        # 数据模式不进行分析，直接提供Excel下载和图表（图表在此模式下可选显示）
+        # 数据模式，返回历史数据文件（默认格式，其他格式可在界面中选择导出）和图表
+        def _load_data():
+            led.append(True)
+            with trace.activate():
+                report_dir, charts, data_source = report_pipeline.get_charts(stock_code, stock_name, start_date, end_date, mode, code_for_dir)
+                export_path = exporters.export_history(stock_code, start_date, end_date, EXPORT_DEFAULT_FORMAT)
+            _finish_trace(trace, report_dir)
+            return report_dir, charts, data_source, export_path
+        try:
+            report_dir, charts, data_source, export_path = _data_flight.do(query_key, _load_data)
+        except Exception as e:
+            if led:
+                trace.finish(error=e)
+                raise
+            # 合并的请求共享同一个异常对象，各自抛出新的异常，避免多个线程同时修改其 __traceback__
+            _finish_trace(trace, error=e, coalesced=True)
+            raise gr.Error(f"查询失败：{e}") from e
+        if not led:
+            _finish_trace(trace, coalesced=True)
+        # 数据模式不进行分析，直接提供数据下载和图表（图表在此模式下可选显示）
         # 这里仍然返回图表路径方便预览，但分析文本留空
         empty_text = "（本次查询为行情数据请求，未生成分析结论。）"
-        return empty_text, empty_text, empty_text, empty_text, empty_text, price_chart_path, volume_chart_path, excel_path, None
-
-    # 分析模式：生成图表、新闻摘要、AI分析
-    # 1. 获取历史行情数据并绘制图表
-    price_chart_path, volume_chart_path, excel_path = stock_plotter.generate_charts(stock_code, stock_name, start_date, end_date, report_dir)
-    # 2. 获取新闻摘要（股票新闻10条，行业新闻5条）
-    stock_news_list = nlp_parser.get_stock_news(stock_name, count=10)
-    # 如果解析结果没有industry_name，则尝试通过stock_name获取所属行业名（可在股票新闻中推测或略过）
-    if not industry_name:
-        industry_name = parse_result.get("industry_name", "")
-    industry_news_list = nlp_parser.get_industry_news(industry_name, count=5) if industry_name else []
-    # 3. 调用多模态大模型获取 基本面/行业/技术面 分析
-    analysis_text = analyzer.analyze_fund_ind_tech(stock_name, stock_news_list, industry_news_list, price_chart_path, volume_chart_path)
-    # 防止重复输出，确保只生成一次分析结论
-    analysis_text = analysis_text.strip()
-    # 4. 解析三部分分析文本
-    fund_text, industry_text, tech_text = analyzer.parse_three_analysis(analysis_text)
-    # 5. 调用 glm-4-plus 获取宏观分析 和 AI自由分析
-    macro_text = analyzer.analyze_macro(stock_name).strip()
-    ai_text = analyzer.analyze_ai_free(stock_name, fund_text, industry_text, tech_text, macro_text).strip()
-    # 6. 分别对五部分分析调用AI评分5次取平均
-    score_fund = analyzer.get_score(fund_text, "基本面分析")
-    score_industry = analyzer.get_score(industry_text, "行业分析")
-    score_tech = analyzer.get_score(tech_text, "技术面分析")
-    score_macro = analyzer.get_score(macro_text, "宏观分析")
-    score_ai = analyzer.get_score(ai_text, "AI分析")
-    # 7. 组织左侧输出内容，每部分标题和评分加粗显示，内容换行显示
-    fund_output = f"**基本面分析（评分：{score_fund}）**\n{fund_text}"
-    industry_output = f"**行业分析（评分：{score_industry}）**\n{industry_text}"
-    tech_output = f"**技术面分析（评分：{score_tech}）**\n{tech_text}"
-    macro_output = f"**宏观分析（评分：{score_macro}）**\n{macro_text}"
-    ai_output = f"**AI分析（评分：{score_ai}）**\n{ai_text}"
-    # 8. 生成PDF报告文件，包含分析文本和图表
-    pdf_path = os.path.join(report_dir, f"{code_for_dir}_报告.pdf")
-    try:
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-        c = canvas.Canvas(pdf_path, pagesize=A4)
-        c.setFont('STSong-Light', 12)
-        # 报告标题
-        title_text = f"{stock_name}（{stock_code}）分析报告"
-        c.drawString(50, 800, title_text)
-        y = 770
-        # 输出每个分析段落文本
-        sections = [("基本面分析", fund_text, score_fund),
-                    ("行业分析", industry_text, score_industry),
-                    ("技术面分析", tech_text, score_tech),
-                    ("宏观分析", macro_text, score_macro),
-                    ("AI分析", ai_text, score_ai)]
-        for cat, text, score in sections:
-            c.drawString(50, y, f"{cat} (评分: {score})：")
-            y -= 20
-            # 简单按固定宽度换行
-            width_limit = 38  # 每行约38个汉字
-            text_lines = [text[i:i+width_limit] for i in range(0, len(text), width_limit)]
-            for line in text_lines:
-                c.drawString(70, y, line)
-                y -= 18
-                if y < 100:  # 页面空间不足时换页
-                    c.showPage()
-                    c.setFont('STSong-Light', 12)
-                    y = 800
-            y -= 10
-            if y < 100:
-                c.showPage()
-                c.setFont('STSong-Light', 12)
-                y = 800
-        # 新页放图表
-        c.showPage()
-        # 将图表插入PDF第二页
+        yield (empty_text, empty_text, empty_text, empty_text, empty_text) + _chart_outputs(charts, data_source) + (export_path, None, None, export_query)
+        return
+
+    # 分析模式：按依赖关系构建阶段图，互不依赖的阶段并发执行
+    # 阶段完成和模型流式输出都以事件形式写入事件流，由本生成器取出后推送到界面；
+    # 同一查询进行中时，后到的请求订阅同一个事件流（重放已有事件），不再重复执行分析
+    def _produce(emit):
+        led.append(True)
+        pipe = report_pipeline.build_analysis_pipeline(
+            stock_code, stock_name, industry_name, start_date, end_date, mode, code_for_dir,
+            on_token=lambda section, text: emit(("tokens", section, text), replaces=section))
+        try:
+            with trace.activate():
+                results, timings = pipe.run(on_stage_done=lambda name, value: emit(("stage", name, value)))
+        except Exception as e:
+            logger.warning("on_query %s 分析失败: %s", stock_code, e)
+            telemetry.record_error("on_query", e)
+            trace.finish(error=e)
+            emit(("error", e))
+            return
+        # 阶段耗时与追踪由实际执行分析的请求写入报告目录（合并的请求不重复写入）
+        report_dir = results["charts"][0]
+        logger.info("on_query %s 阶段耗时:\n%s", stock_code, pipeline.format_timings(timings))
+        with open(os.path.join(report_dir, "stage_timings.json"), "w", encoding="utf-8") as f:
+            json.dump(timings, f, ensure_ascii=False, indent=2)
+        _finish_trace(trace, report_dir)
+        emit(("done", results, timings))
+
+    texts = {key: "" for key, _ in SECTIONS}
+    scores = {key: None for key, _ in SECTIONS}
+    charts = None
+    finished = None
+    # 每次取出当前积压的全部事件后合并推送一次，避免逐个 token 刷新界面
+    for batch in _analysis_flight.subscribe(query_key, _produce):
+        changed = set()
+        for event in batch:
+            kind = event[0]
+            if kind == "tokens":
+                _, key, text = event
+                if key == "analysis":
+                    # 三面分析为一段连续输出，边生成边按标签拆分到三个栏目
+                    texts["fund"], texts["industry"], texts["tech"] = analyzer.parse_three_analysis(text.strip())
+                    changed.update(("fund", "industry", "tech"))
+                else:
+                    texts[key] = text.strip()
+                    changed.add(key)
+            elif kind == "stage":
+                _, name, value = event
+                if name == "charts":
+                    _, charts, data_source = value
+                    changed.add("charts")
+                elif name == "analysis":
+                    texts["fund"], texts["industry"], texts["tech"] = value
+                    changed.update(("fund", "industry", "tech"))
+                elif name == "macro":
+                    texts["macro"], scores["macro"] = value
+                    changed.add("macro")
+                elif name == "ai":
+                    texts["ai"] = value
+                    changed.add("ai")
+                elif name.startswith("score_"):
+                    key = name[len("score_"):]
+                    scores[key] = value
+                    changed.add(key)
+            elif kind == "error":
+                # 同一个异常对象会被所有订阅者收到，各自抛出新的异常，避免多个线程同时修改其 __traceback__
+                if not led:
+                    _finish_trace(trace, error=event[1], coalesced=True)
+                raise gr.Error(f"分析失败：{event[1]}") from event[1]
+            elif kind == "done":
+                finished = event
+        if finished is not None:
+            break
+        outputs = [gr.update(value=_section_markdown(title, texts[key], scores[key])) if key in changed else gr.update()
+                   for key, title in SECTIONS]
+        if "charts" in changed:
+            outputs.extend(_chart_outputs(charts, data_source))
+        else:
+            outputs.extend([gr.update(), gr.update()])
+        outputs.extend([gr.update(), gr.update(), gr.update(), gr.update()])
+        yield tuple(outputs)
+    if finished is None:
+        error = RuntimeError("分析流程意外结束")
+        trace.finish(error=error)
+        raise error
+
+    if not led:
+        _finish_trace(trace, coalesced=True)
+
+    _, results, timings = finished
+    report_dir, (price_chart_path, volume_chart_path), _ = results["charts"]
+
+    fund_text, industry_text, tech_text = results["analysis"]
+    macro_text, score_macro = results["macro"]
+    ai_text = results["ai"]
+    score_fund = results["score_fund"]
+    score_industry = results["score_industry"]
+    score_tech = results["score_tech"]
+    score_ai = results["score_ai"]
+    # 6. 组织左侧输出内容，每部分标题和评分加粗显示，内容换行显示
+    fund_output = _section_markdown("基本面分析", fund_text, score_fund)
+    industry_output = _section_markdown("行业分析", industry_text, score_industry)
+    tech_output = _section_markdown("技术面分析", tech_text, score_tech)
+    macro_output = _section_markdown("宏观分析", macro_text, score_macro)
+    ai_output = _section_markdown("AI分析", ai_text, score_ai)
+    # 7. PDF报告不在请求路径上生成：按配置在后台线程生成，或在用户点击“生成PDF报告”时按需生成
+    report = {
+        "report_dir": report_dir,
+        "pdf_name": "pdf_" + artifacts.artifact_key(fund_output, industry_output, tech_output, macro_output, ai_output),
+        "file_prefix": code_for_dir,
+        "title": f"{stock_name}（{stock_code}）分析报告",
+        "sections": [("基本面分析", fund_text, score_fund),
+                     ("行业分析", industry_text, score_industry),
+                     ("技术面分析", tech_text, score_tech),
+                     ("宏观分析", macro_text, score_macro),
+                     ("AI分析", ai_text, score_ai)],
+        "images": [price_chart_path, volume_chart_path],
+    }
+    pdf_future = report_pdf.submit(build_pdf, report) if PDF_GENERATION == "background" else None
+    yield fund_output, industry_output, tech_output, macro_output, ai_output, price_chart_path, volume_chart_path, None, None, report, export_query
+    if pdf_future is not None:
+        # 后台生成失败（如报告目录已被清理）时不影响已输出的分析结果，PDF 留给“生成PDF报告”按钮按需生成
+        try:
+            pdf_path = pdf_future.result()
+        except Exception as e:
+            logger.warning("后台生成PDF报告失败 %s: %s", stock_code, e)
+            return
+        yield (gr.update(),) * 8 + (pdf_path, gr.update(), gr.update())
+
+# 结束请求追踪：记录请求耗时，按配置将追踪写入报告目录的 trace.json。
+# coalesced 表示本请求合并到了进行中的相同查询上：其追踪没有 span，耗时单独记为 request.on_query_coalesced，
+# 也不写入 trace.json（以免覆盖实际执行计算的请求写入的追踪）
+def _finish_trace(trace, report_dir=None, error=None, coalesced=False):
+    if coalesced:
+        trace.name = "on_query_coalesced"
+        trace.attrs["coalesced"] = True
+    duration = trace.finish(error=error)
+    logger.info("on_query %s 完成，耗时 %.2fs%s", trace.attrs.get("stock_code"), duration, "（合并请求）" if coalesced else "")
+    if TRACE_DUMP and report_dir and not coalesced:
+        trace.dump(os.path.join(report_dir, "trace.json"))
+
+# 生成（或复用）PDF报告文件，包含分析文本和图表；分析文本相同时复用已生成的PDF
+def build_pdf(report):
+    import gradio as gr
+    import report_pdf
+    if not report:
+        return None
+    # 报告目录可能已被后台清理按最近访问时间淘汰，图表不存在时无法生成PDF
+    if not all(os.path.exists(path) for path in report["images"]):
+        raise gr.Error("报告已过期，请重新查询")
+    pdf_name = report["pdf_name"]
+
+    def _build(out_dir):
+        pdf_path = os.path.join(out_dir, f"{report['file_prefix']}_报告_{pdf_name[4:12]}.pdf")
         try:
-            c.drawImage(price_chart_path, 50, 440, width=500, height=300)
-            c.drawImage(volume_chart_path, 50, 100, width=500, height=300)
-        except Exception:
-            pass
-        c.save()
-    except Exception as e:
-        pdf_path = None  # 如果生成PDF失败，则返回None
+            with telemetry.span("pdf") as sp:
+                report_pdf.build_report(pdf_path, report["title"], report["sections"], report["images"])
+                sp["bytes"] = os.path.getsize(pdf_path)
+        except Exception as e:
+            logger.warning("生成PDF报告失败: %s", e)
+            telemetry.record_error("build_pdf", e)
+            return {}  # 如果生成PDF失败，则不记录，返回None
+        return {pdf_name: pdf_path}
+    return artifacts.get_store().get_or_create(report["report_dir"], (pdf_name,), _build).get(pdf_name)
 
-    return fund_output, industry_output, tech_output, macro_output, ai_output, price_chart_path, volume_chart_path, excel_path, pdf_path
+# 按用户选择的格式导出最近一次查询的行情及技术指标（生成后缓存，数据未变化时直接复用）
+def export_data(export_query, fmt):
+    import gradio as gr
+    import exporters
+    if not export_query:
+        raise gr.Error("请先查询股票后再导出行情数据")
+    stock_code, start_date, end_date = export_query
+    try:
+        return exporters.export_history(stock_code, start_date, end_date, fmt or EXPORT_DEFAULT_FORMAT)
+    except ImportError as e:
+        raise gr.Error(f"导出 {fmt} 格式需要安装相应的依赖: {e}")
 
 # 搭建 Gradio 界面
-with gr.Blocks(title="股票多维度分析AI工具") as demo:
-    gr.Markdown("## 股票多维度分析 AI Agent\n输入股票名称或代码和问题，例如：`海尔智家最近1年情况如何？`")
-    with gr.Row():
-        query_input = gr.Textbox(label="股票名称或问句", placeholder="输入股票名称、代码或问题进行查询", lines=1)
-        submit_btn = gr.Button("查询")
-    with gr.Row():
-        with gr.Column():
-            fund_output = gr.Markdown()
-            industry_output = gr.Markdown()
-            tech_output = gr.Markdown()
-            macro_output = gr.Markdown()
-            ai_output = gr.Markdown()
-        with gr.Column():
-            price_image = gr.Image(label="股价走势", height=350)
-            volume_image = gr.Image(label="成交量走势", height=250)
-            with gr.Row():
-                excel_file = gr.File(label="下载Excel", interactive=False)
-                pdf_file = gr.File(label="下载PDF", interactive=False)
-    # 将点击按钮事件绑定处理函数
-    submit_btn.click(fn=on_query,
-                     inputs=query_input,
-                     outputs=[fund_output, industry_output, tech_output, macro_output, ai_output,
-                              price_image, volume_image, excel_file, pdf_file],
-                     queue=True)
+def build_demo():
+    import gradio as gr
+    import exporters
+    with gr.Blocks(title="股票多维度分析AI工具") as demo:
+        gr.Markdown("## 股票多维度分析 AI Agent\n输入股票名称或代码和问题，例如：`海尔智家最近1年情况如何？`")
+        with gr.Row():
+            query_input = gr.Textbox(label="股票名称或问句", placeholder="输入股票名称、代码或问题进行查询", lines=1)
+            submit_btn = gr.Button("查询")
+        with gr.Row():
+            with gr.Column():
+                fund_output = gr.Markdown()
+                industry_output = gr.Markdown()
+                tech_output = gr.Markdown()
+                macro_output = gr.Markdown()
+                ai_output = gr.Markdown()
+            with gr.Column():
+                price_image = gr.Image(label="股价走势", height=350)
+                volume_image = gr.Image(label="成交量走势", height=250)
+                with gr.Row():
+                    excel_file = gr.File(label="下载行情数据", interactive=False)
+                    pdf_file = gr.File(label="下载PDF", interactive=False)
+                with gr.Row():
+                    export_format = gr.Dropdown(choices=exporters.available_formats(), value=EXPORT_DEFAULT_FORMAT,
+                                                label="导出格式")
+                    export_btn = gr.Button("导出行情数据")
+                    pdf_btn = gr.Button("生成PDF报告")
+        # 最近一次分析的报告内容，用于按需生成PDF
+        report_state = gr.State()
+        # 最近一次查询的 (代码, 起始日期, 结束日期)，用于按需导出行情数据
+        export_state = gr.State()
+        # 将点击按钮事件绑定处理函数
+        submit_btn.click(fn=on_query,
+                         inputs=query_input,
+                         outputs=[fund_output, industry_output, tech_output, macro_output, ai_output,
+                                  price_image, volume_image, excel_file, pdf_file, report_state, export_state],
+                         queue=True)
+        pdf_btn.click(fn=build_pdf, inputs=report_state, outputs=pdf_file, queue=True)
+        export_btn.click(fn=export_data, inputs=[export_state, export_format], outputs=excel_file, queue=True)
+    return demo
 
 # 启动应用
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    artifacts.get_store().start_janitor()
+    telemetry.start_server()
+    # 按配置预热（字体、证券主数据、图表模板与渲染进程等），使首个请求的延迟与后续请求一致
+    if STARTUP_WARMUP:
+        warmup.run()
+    build_demo().launch()
\ No newline at end of file
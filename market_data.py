@@ -0,0 +1,332 @@
+import time
+import logging
+import functools
+import importlib.util
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import telemetry
+from config import (TUSHARE_TOKEN, MARKET_DATA_SOURCES, MARKET_DATA_HEDGE, MARKET_DATA_HEDGE_MIN_SAMPLES,
+                    MARKET_DATA_LATENCY_WINDOW, MARKET_DATA_BREAKER_FAILURES, MARKET_DATA_BREAKER_COOLDOWN)
+
+logger = logging.getLogger(__name__)
+
+# 统一后的日线字段
+COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+# tushare 日线接口单次最多返回的行数
+TUSHARE_DAILY_ROW_LIMIT = 6000
+
+
+class LatencyTracker:
+    """
+    记录某个数据源最近若干次请求的耗时，提供分位数统计。
+    """
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, q: float):
+        with self._lock:
+            samples = list(self._samples)
+        return float(np.percentile(samples, q)) if samples else None
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后进入熔断（open），cooldown 秒内直接跳过该数据源；
+    冷却结束后放行一次试探请求（half-open），成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class Source:
+    """
+    一个行情数据源：fetch(代码, 起始, 结束) 返回原始数据，normalize 将其转换为统一字段（COLUMNS）。
+    每个数据源独立统计延迟并带有熔断器。
+    """
+
+    def __init__(self, name: str, fetch, normalize, available=lambda: True):
+        self.name = name
+        self._fetch = fetch
+        self._normalize = normalize
+        self._available = available
+        self.latency = LatencyTracker(MARKET_DATA_LATENCY_WINDOW)
+        self.breaker = CircuitBreaker(MARKET_DATA_BREAKER_FAILURES, MARKET_DATA_BREAKER_COOLDOWN)
+        self.successes = 0
+        self.failures = 0
+        self.empty = 0
+
+    def available(self) -> bool:
+        return self._available()
+
+    def fetch(self, stock_code: str, start_date: str, end_date: str):
+        """
+        请求数据并统计耗时、更新熔断状态。无数据时返回空 DataFrame，请求失败时抛出异常。
+        """
+        start = time.perf_counter()
+        try:
+            with telemetry.span(f"fetch.{self.name}", code=stock_code, start=start_date, end=end_date) as sp:
+                raw = self._fetch(stock_code, start_date, end_date)
+                df = self._normalize(raw) if raw is not None and not raw.empty else pd.DataFrame(columns=COLUMNS)
+                sp["rows"] = len(df)
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.latency.record(time.perf_counter() - start)
+        self.breaker.record_success()
+        df.attrs["source"] = self.name
+        if df.empty:
+            self.empty += 1
+        else:
+            self.successes += 1
+        return df
+
+    def stats(self) -> dict:
+        return {"state": self.breaker.state, "successes": self.successes, "failures": self.failures,
+                "empty": self.empty, "samples": self.latency.count(),
+                "p50": self.latency.percentile(50), "p95": self.latency.percentile(95)}
+
+
+# ---- tushare ----
+
+_pro = None
+_pro_lock = threading.Lock()
+
+
+def _tushare_api():
+    """
+    首次使用时初始化 tushare（需要在 config.py 中提供 TUSHARE_TOKEN），未配置或未安装时返回 None。
+    """
+    global _pro
+    if _pro is None and TUSHARE_TOKEN:
+        with _pro_lock:
+            if _pro is None:
+                try:
+                    import tushare as ts
+                    ts.set_token(TUSHARE_TOKEN)
+                    _pro = ts.pro_api()
+                except ImportError:
+                    return None
+    return _pro
+
+
+def _tushare_fetch(stock_code: str, start_date: str, end_date: str):
+    # tushare 接口要求日期格式YYYYMMDD，多个代码以逗号分隔
+    return _tushare_api().daily(ts_code=stock_code, start_date=start_date, end_date=end_date)
+
+
+def _tushare_normalize(df: pd.DataFrame) -> pd.DataFrame:
+    # 转换日期格式并排序，重命名列统一格式（vol 单位为手）
+    df = df.rename(columns={'trade_date': 'date', 'vol': 'volume'})
+    df['date'] = pd.to_datetime(df['date'])
+    keep = COLUMNS + (['ts_code'] if 'ts_code' in df.columns else [])
+    return df.sort_values('date').reset_index(drop=True)[keep]
+
+
+# ---- akshare ----
+
+@functools.lru_cache(maxsize=None)
+def _akshare_available() -> bool:
+    # 只检查是否安装，不导入（akshare 导入较慢，首次实际使用或启动预热时才导入）
+    return importlib.util.find_spec("akshare") is not None
+
+
+def _akshare_fetch(stock_code: str, start_date: str, end_date: str):
+    import akshare as ak
+    # akshare 接口使用 YYYYMMDD 格式日期和不带交易所后缀的代码
+    return ak.stock_zh_a_hist(symbol=stock_code.split('.')[0], period="daily",
+                              start_date=start_date, end_date=end_date, adjust="")
+
+
+def _akshare_normalize(df: pd.DataFrame) -> pd.DataFrame:
+    # akshare返回的DataFrame含列: 日期, 开盘, 收盘, 最高, 最低, 成交量（单位为手）, etc.
+    df = df.rename(columns={'日期': 'date', '开盘': 'open', '收盘': 'close',
+                            '最高': 'high', '最低': 'low', '成交量': 'volume'})
+    df['date'] = pd.to_datetime(df['date'])
+    return df.sort_values('date').reset_index(drop=True)[COLUMNS]
+
+
+SOURCES = {
+    "tushare": Source("tushare", _tushare_fetch, _tushare_normalize, available=lambda: _tushare_api() is not None),
+    "akshare": Source("akshare", _akshare_fetch, _akshare_normalize, available=_akshare_available),
+}
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="market-data")
+
+
+def _candidates() -> list:
+    return [SOURCES[name] for name in MARKET_DATA_SOURCES if name in SOURCES and SOURCES[name].available()]
+
+
+def _try(source: Source, stock_code: str, start_date: str, end_date: str):
+    try:
+        return source.fetch(stock_code, start_date, end_date)
+    except Exception as e:
+        logger.warning("行情数据源 %s 请求失败 %s [%s, %s]: %s", source.name, stock_code, start_date, end_date, e)
+        telemetry.record_error(f"market_data.{source.name}", e)
+        return None
+
+
+def _hedged(primary: Source, secondary: Source, stock_code: str, start_date: str, end_date: str, delay: float):
+    """
+    先请求主源，delay 秒（主源 p95 延迟）内未返回、或先于此失败（或无数据）时再请求备用源，取先返回数据者。
+    两者均无数据时返回空 DataFrame，均失败时返回 None。
+    """
+    empty = None
+    pending = {_executor.submit(telemetry.bind(_try), primary, stock_code, start_date, end_date)}
+    hedged = False
+    while pending:
+        done, pending = wait(pending, timeout=None if hedged else delay, return_when=FIRST_COMPLETED)
+        for fut in done:
+            df = fut.result()
+            if df is not None and not df.empty:
+                return df
+            if df is not None:
+                empty = df
+        if not hedged:
+            hedged = True
+            if secondary.breaker.allow():
+                if not done:
+                    logger.info("行情数据源 %s 超过 p95 延迟 %.2fs，对冲请求 %s", primary.name, delay, secondary.name)
+                    telemetry.incr("market_data_hedges_total", source=primary.name)
+                pending.add(_executor.submit(telemetry.bind(_try), secondary, stock_code, start_date, end_date))
+    return empty
+
+
+def fetch_daily(stock_code: str, start_date: str, end_date: str):
+    """
+    按优先级从各行情数据源拉取日线，返回列为 date, open, high, low, close, volume 的 DataFrame，
+    df.attrs["source"] 为实际提供数据的数据源；数据源正常响应但区间内无数据（如停牌、节假日）时返回空 DataFrame，
+    全部失败（或熔断）时返回 None，由调用方视为拉取失败稍后重试。
+    熔断中的数据源直接跳过；主源延迟样本充足时，超过其 p95 延迟即对冲请求下一个数据源。
+    """
+    sources = _candidates()
+    empty = None
+    i = 0
+    while i < len(sources):
+        source = sources[i]
+        if not source.breaker.allow():
+            logger.info("行情数据源 %s 熔断中，跳过", source.name)
+            i += 1
+            continue
+        secondary = sources[i + 1] if i + 1 < len(sources) else None
+        if (MARKET_DATA_HEDGE and secondary is not None
+                and source.latency.count() >= MARKET_DATA_HEDGE_MIN_SAMPLES):
+            df = _hedged(source, secondary, stock_code, start_date, end_date, source.latency.percentile(95))
+            i += 2
+        else:
+            df = _try(source, stock_code, start_date, end_date)
+            i += 1
+        if df is not None and not df.empty:
+            return df
+        if df is not None:
+            empty = df
+    return empty
+
+
+def fetch_daily_many(stock_codes: list, start_date: str, end_date: str) -> dict:
+    """
+    批量拉取多只股票同一日期范围的日线（tushare 日线接口支持逗号分隔的多个代码）。
+    按自然日数估算每次请求的行数，使单次返回不超过接口行数上限，避免结果被截断。
+    返回 {代码: DataFrame}，未取得数据的代码不在结果中（由调用方逐只回退）。
+    """
+    result = {}
+    source = SOURCES["tushare"]
+    if not stock_codes or "tushare" not in MARKET_DATA_SOURCES or not source.available():
+        return result
+    days = (datetime.strptime(end_date, "%Y%m%d") - datetime.strptime(start_date, "%Y%m%d")).days + 1
+    chunk = max(TUSHARE_DAILY_ROW_LIMIT // max(days, 1), 1)
+    for i in range(0, len(stock_codes), chunk):
+        if not source.breaker.allow():
+            break
+        df = _try(source, ",".join(stock_codes[i:i + chunk]), start_date, end_date)
+        if df is None or df.empty:
+            continue
+        for code, part in df.groupby('ts_code'):
+            part = part[COLUMNS].reset_index(drop=True)
+            part.attrs["source"] = source.name
+            result[code] = part
+    return result
+
+
+def stats() -> dict:
+    """
+    返回各数据源的熔断状态、成功/失败/无数据次数及延迟分位数（秒）。
+    """
+    return {name: source.stats() for name, source in SOURCES.items()}
+
+
+def warm_up() -> list:
+    """
+    预先初始化已配置的数据源（检查可用性时创建 tushare 接口，导入 akshare），返回可用数据源名称。
+    """
+    names = [source.name for source in _candidates()]
+    if "akshare" in names:
+        import akshare  # noqa: F401
+    return names
+
+
+def _metrics() -> list:
+    samples = []
+    for name, s in stats().items():
+        labels = {"source": name}
+        samples.extend([("market_data_requests_total", {**labels, "result": "success"}, s["successes"]),
+                        ("market_data_requests_total", {**labels, "result": "failure"}, s["failures"]),
+                        ("market_data_requests_total", {**labels, "result": "empty"}, s["empty"]),
+                        ("market_data_breaker_open", labels, int(s["state"] != "closed"))])
+        if s["p95"] is not None:
+            samples.append(("market_data_latency_p95_seconds", labels, s["p95"]))
+    return samples
+
+
+telemetry.register_collector(_metrics)
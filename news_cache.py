@@ -0,0 +1,70 @@
+import logging
+import unicodedata
+import zhipu_client
+import security_master
+import telemetry
+from cache_utils import RefreshingCache
+from config import NEWS_CACHE_TTL, NEWS_CACHE_REFRESH_AHEAD, NEWS_CACHE_MAX_STALE, NEWS_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# 搜索结果中保留的字段
+RESULT_FIELDS = ("title", "content", "link", "media", "publish_date", "refer")
+
+# 进程内共享的搜索结果缓存：新鲜期内直接命中，临近过期时后台刷新，过期后一段时间内先返回旧结果再后台刷新；
+# 同一查询的并发未命中只发起一次搜索
+_cache = RefreshingCache(ttl=NEWS_CACHE_TTL, refresh_ahead=NEWS_CACHE_REFRESH_AHEAD,
+                         max_stale=NEWS_CACHE_MAX_STALE, max_entries=NEWS_CACHE_MAX_ENTRIES,
+                         name="news_search")
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化搜索查询：全角转半角（NFKC）、转小写、合并连续空白，使写法不同的相同查询共享缓存。
+    """
+    return " ".join(unicodedata.normalize("NFKC", query or "").lower().split())
+
+
+def industry_query(industry_name: str) -> str:
+    """
+    行业新闻的搜索查询。行业名称先规范为证券主数据中的写法，同一行业的全部股票因此共享同一条缓存。
+    """
+    return f"{security_master.get_master().canonical_industry(industry_name)} 行业 新闻"
+
+
+def _to_dict(res) -> dict:
+    # 搜索结果可能以对象属性或dict形式呈现，统一转换为只含常用字段的dict，便于缓存和跨线程共享
+    if isinstance(res, dict):
+        return {k: res.get(k, "") or "" for k in RESULT_FIELDS}
+    return {k: getattr(res, k, "") or "" for k in RESULT_FIELDS}
+
+
+def web_search(search_query: str, count: int = 10, search_engine: str = "search_pro",
+               search_domain_filter: str = None, search_recency_filter: str = None, **kwargs) -> list:
+    """
+    带缓存的网络搜索，返回搜索结果列表 [{"title", "content", "link", ...}]（调用方不应修改返回的列表）。
+    缓存键为 (规范化查询, 搜索引擎, 域名过滤, 时间范围过滤, 条数)，其余参数（如 content_size）原样传给接口。
+    """
+    key = (normalize_query(search_query), search_engine, search_domain_filter or "", search_recency_filter or "", count)
+
+    def _load():
+        params = {"search_engine": search_engine, "search_query": search_query, "count": count, **kwargs}
+        if search_domain_filter:
+            params["search_domain_filter"] = search_domain_filter
+        if search_recency_filter:
+            params["search_recency_filter"] = search_recency_filter
+        with telemetry.span("search", query=key[0]) as sp:
+            response = zhipu_client.get_client().web_search.web_search(**params)
+            results = [_to_dict(res) for res in getattr(response, "search_result", None) or []]
+            sp["results"] = len(results)
+            sp["response_bytes"] = sum(len(res["content"].encode("utf-8")) for res in results)
+            telemetry.incr("search_bytes_total", sp["response_bytes"])
+        return results
+    return _cache.get(key, _load)
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+telemetry.register_collector(lambda: telemetry.cache_samples("news_search", stats()))
@@ -1,108 +1,210 @@
+import re
 import json
-from zhipuai import ZhipuAI
-from config import ZHIPU_API_KEY
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import zhipu_client
+import news_cache
+import prompt_budget
+import telemetry
+from llm_cache import chat_completion
+from config import NEWS_MAX_WORKERS, NEWS_MINHASH_PERMUTATIONS, NEWS_DEDUP_JACCARD, NEWS_SUMMARY_BATCH_SIZE
 
-def search_news(stock_name: str, industry_name: str):
-    """
-    搜索指定股票名称的近期新闻（搜狐网站，近1个月），以及所属行业的新闻。
-    对每条新闻使用大模型生成摘要和情绪判断。
-    返回三个值：stock_summaries（股票新闻摘要列表）、industry_summaries（行业新闻摘要列表）、markdown_str（用于展示的Markdown字符串）。
-    """
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
-    # 搜索股票相关新闻（限定搜狐网，最近一个月，最多10条）
-    stock_response = client.web_search.web_search(
-        search_engine="search_pro",
-        search_query=f"{stock_name} 股票 新闻",
-        count=10,
-        search_domain_filter="finance.sina.com.cn",
-        search_recency_filter="oneMonth",
-        content_size="high"
-    )
-    # 搜索行业相关新闻（限定搜狐网，最近一个月，最多5条）
-    industry_response = client.web_search.web_search(
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "你是一个智能助手，请阅读新闻内容并用不超过30字总结其主要内容，"
+    "并判断该新闻的情绪是乐观、悲观或中性。"
+    "回答格式为：摘要（情绪）。"
+)
+BATCH_SYSTEM_PROMPT = (
+    "你是一个智能助手，请逐条阅读以下编号的新闻，为每条新闻用不超过30字总结其主要内容，"
+    "并判断该新闻的情绪是乐观、悲观或中性。"
+    '只输出 JSON 数组，每个元素形如 {"id": 编号, "summary": "摘要", "sentiment": "乐观/悲观/中性"}，不要输出其他内容。'
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=NEWS_MAX_WORKERS, thread_name_prefix="news")
+    return _executor
+
+
+def _search(query: str, count: int) -> list:
+    # 搜索新闻（限定新浪财经，最近一个月）；结果按查询与过滤条件共享缓存
+    return news_cache.web_search(
+        query,
+        count=count,
         search_engine="search_pro",
-        search_query=f"{industry_name} 行业 新闻",
-        count=5,
         search_domain_filter="finance.sina.com.cn",
         search_recency_filter="oneMonth",
         content_size="high"
     )
-    # 提取搜索结果列表
-    stock_data = stock_response.__dict__
-    industry_data = industry_response.__dict__
-    stock_results = stock_data.get('search_result', [])
-    industry_results = industry_data.get('search_result', [])
-    # 初始化返回结果和Markdown列表
-    stock_summaries = []
-    industry_summaries = []
-    stock_md_lines = []
-    industry_md_lines = []
-    # ChatGLM 模型用于摘要和情感分析
-    glm_client = ZhipuAI(api_key=ZHIPU_API_KEY)
-    system_prompt = (
-        "你是一个智能助手，请阅读新闻内容并用不超过30字总结其主要内容，"
-        "并判断该新闻的情绪是乐观、悲观或中性。"
-        "回答格式为：摘要（情绪）。"
+
+
+def _extract(res: dict) -> dict:
+    """
+    提取标题、内容、链接。
+    """
+    return {"title": res.get('title', "") or "", "content": res.get('content', "") or "",
+            "link": res.get('link', "") or ""}
+
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+# MinHash 使用的哈希族 h(x) = (a * x + b) mod p，p 为梅森素数 2^31 - 1，参数固定以保证结果可复现
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240601)
+_HASH_A = _rng.integers(1, int(_PRIME), size=NEWS_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, int(_PRIME), size=NEWS_MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash(text: str, shingle: int = 3) -> np.ndarray:
+    """
+    MinHash 签名：对去除标点空白后的字符 n-gram 集合计算 NEWS_MINHASH_PERMUTATIONS 个最小哈希值。
+    两个签名相等位置的比例即两段文本 n-gram 集合 Jaccard 相似度的估计。
+    """
+    norm = _NON_WORD.sub("", text.lower())
+    grams = {norm[i:i + shingle] for i in range(max(len(norm) - shingle + 1, 1))} if norm else set()
+    if not grams:
+        return np.full(NEWS_MINHASH_PERMUTATIONS, int(_PRIME), dtype=np.uint64)
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little")
+                          for g in grams), dtype=np.uint64, count=len(grams)) % _PRIME
+    return ((hashes[:, None] * _HASH_A + _HASH_B) % _PRIME).min(axis=0)
+
+
+def _assign_groups(items: list) -> list:
+    """
+    为每条新闻分配重复组编号：标题+内容的 MinHash 估计相似度达到阈值（或链接相同）时归入此前出现的同一组。
+    转载稿件通常只有来源、编辑署名等少量差异，相似度远高于不同新闻。
+    """
+    signatures = []
+    groups = []
+    for item in items:
+        sig = minhash(f"{item['title']}\n{item['content']}")
+        group = None
+        for g, (other_sig, other_link) in enumerate(signatures):
+            if (item["link"] and item["link"] == other_link) or np.mean(sig == other_sig) >= NEWS_DEDUP_JACCARD:
+                group = g
+                break
+        if group is None:
+            group = len(signatures)
+            signatures.append((sig, item["link"]))
+        groups.append(group)
+    return groups
+
+
+def _text_to_summarize(item: dict) -> str:
+    # 将标题和内容合并供模型总结（提高准确性）
+    return item["content"] if not item["title"] else f"标题：{item['title']}\n{item['content']}"
+
+
+def _summarize_one(item: dict) -> str:
+    # 调用 ChatGLM 模型生成摘要和情绪（正文过长时按调用点 token 预算截断）
+    text, = prompt_budget.fit("news_summary", SYSTEM_PROMPT, [_text_to_summarize(item)])
+    summary = chat_completion(
+        zhipu_client.get_client(), "news_summary",
+        model="glm-4-plus",
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        temperature=0.2,
+        top_p=0.8
+    ).strip()
+    # 去除可能的格式符号
+    return summary.strip('`').strip()
+
+
+def _summarize_batch(items: list) -> list:
+    """
+    将多条新闻打包为一个请求，要求模型返回结构化的逐条摘要与情绪；解析失败的条目回退到逐条摘要。
+    """
+    # 各条新闻分摊调用点 token 预算，较长的正文被截断
+    texts = prompt_budget.fit("news_summary", BATCH_SYSTEM_PROMPT, [_text_to_summarize(item) for item in items])
+    user_content = "\n\n".join(f"【{i}】{text}" for i, text in enumerate(texts))
+    reply = chat_completion(
+        zhipu_client.get_client(), "news_summary",
+        model="glm-4-plus",
+        messages=[
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.2,
+        top_p=0.8
     )
-    # 处理股票新闻列表
-    for res in stock_results[:10]:
-        title = ""
-        content = ""
-        link = ""
-        # 提取标题、内容、链接（SearchResultResp对象可能以属性或dict形式呈现）
-        if hasattr(res, 'title'):
-            title = res.title or ""
-            content = getattr(res, 'content', "") or ""
-            link = getattr(res, 'link', "") or ""
-        elif isinstance(res, dict):
-            title = res.get('title', "")
-            content = res.get('content', "")
-            link = res.get('link', "")
-        # 将标题和内容合并供模型总结（提高准确性）
-        text_to_summarize = content if not title else f"标题：{title}\n{content}"
-        # 调用 ChatGLM 模型生成摘要和情绪
-        response = glm_client.chat.completions.create(
-            model="glm-4-plus",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text_to_summarize}
-            ],
-            temperature=0.2,
-            top_p=0.8
-        )
-        summary = response.choices[0].message.content.strip()
-        # 去除可能的格式符号
-        summary = summary.strip('`').strip()
-        stock_summaries.append(summary)
-        # 组装 Markdown 链接行
-        stock_md_lines.append(f"- {summary} [🔗原文链接]({link})")
-    # 处理行业新闻列表（过程类似）
-    for res in industry_results[:5]:
-        title = ""
-        content = ""
-        link = ""
-        if hasattr(res, 'title'):
-            title = res.title or ""
-            content = getattr(res, 'content', "") or ""
-            link = getattr(res, 'link', "") or ""
-        elif isinstance(res, dict):
-            title = res.get('title', "")
-            content = res.get('content', "")
-            link = res.get('link', "")
-        text_to_summarize = content if not title else f"标题：{title}\n{content}"
-        response = glm_client.chat.completions.create(
-            model="glm-4-plus",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text_to_summarize}
-            ],
-            temperature=0.2,
-            top_p=0.8
-        )
-        summary = response.choices[0].message.content.strip()
-        summary = summary.strip('`').strip()
-        industry_summaries.append(summary)
-        industry_md_lines.append(f"- {summary} [🔗原文链接]({link})")
+    summaries = [None] * len(items)
+    match = re.search(r"\[.*\]", reply, re.S)
+    try:
+        for entry in json.loads(match.group(0)) if match else []:
+            i = int(entry["id"])
+            if 0 <= i < len(items) and entry.get("summary"):
+                summaries[i] = f"{entry['summary'].strip()}（{entry.get('sentiment', '中性')}）"
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("批量新闻摘要解析失败，回退到逐条摘要: %s", e)
+    for i, summary in enumerate(summaries):
+        if summary is None:
+            summaries[i] = _summarize_one(items[i])
+    return summaries
+
+
+def _summarize_all(items: list) -> list:
+    """
+    并发生成摘要：NEWS_SUMMARY_BATCH_SIZE 为 0 时逐条并发请求，否则按批打包后并发请求。
+    """
+    executor = _get_executor()
+    if NEWS_SUMMARY_BATCH_SIZE <= 0:
+        return list(executor.map(telemetry.bind(_summarize_one), items))
+    batches = [items[i:i + NEWS_SUMMARY_BATCH_SIZE] for i in range(0, len(items), NEWS_SUMMARY_BATCH_SIZE)]
+    return [summary for batch in executor.map(telemetry.bind(_summarize_batch), batches) for summary in batch]
+
+
+def search_news(stock_name: str, industry_name: str):
+    """
+    搜索指定股票名称的近期新闻（新浪财经，近1个月），以及所属行业的新闻。
+    两次搜索并发进行；近似重复的转载新闻（MinHash）只保留首条，对去重后的新闻并发生成摘要和情绪判断，
+    同时出现在股票新闻与行业新闻中的文章只摘要一次。
+    返回三个值：stock_summaries（股票新闻摘要列表）、industry_summaries（行业新闻摘要列表）、markdown_str（用于展示的Markdown字符串）。
+    """
+    executor = _get_executor()
+    # 搜索股票相关新闻（最多10条）与行业相关新闻（最多5条）
+    stock_future = executor.submit(telemetry.bind(_search), f"{stock_name} 股票 新闻", 10)
+    industry_future = executor.submit(telemetry.bind(_search), news_cache.industry_query(industry_name), 5)
+    stock_items = [_extract(res) for res in stock_future.result()[:10]]
+    industry_items = [_extract(res) for res in industry_future.result()[:5]]
+    # 去重：同一列表内的重复转载只保留首条；跨列表的重复文章共用同一份摘要
+    items = stock_items + industry_items
+    groups = _assign_groups(items)
+    unique = {}
+    for item, group in zip(items, groups):
+        unique.setdefault(group, item)
+    order = sorted(unique)
+    summaries = dict(zip(order, _summarize_all([unique[g] for g in order])))
+
+    def _collect(part_items, part_groups):
+        seen = set()
+        part_summaries = []
+        md_lines = []
+        for item, group in zip(part_items, part_groups):
+            if group in seen:
+                continue
+            seen.add(group)
+            part_summaries.append(summaries[group])
+            # 组装 Markdown 链接行
+            md_lines.append(f"- {summaries[group]} [🔗原文链接]({item['link']})")
+        return part_summaries, md_lines
+
+    stock_summaries, stock_md_lines = _collect(stock_items, groups[:len(stock_items)])
+    industry_summaries, industry_md_lines = _collect(industry_items, groups[len(stock_items):])
+    if len(items) > len(unique):
+        logger.info("新闻去重：%d 条中 %d 条为近似重复", len(items), len(items) - len(unique))
     # 组装最终的 Markdown 字符串
     markdown_str = "### 股票新闻\n" + "\n".join(stock_md_lines) + "\n\n### 行业新闻\n" + "\n".join(industry_md_lines)
-    return stock_summaries, industry_summaries, markdown_str
\ No newline at end of file
+    return stock_summaries, industry_summaries, markdown_str
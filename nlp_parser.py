@@ -1,12 +1,34 @@
 import re
+import logging
 import datetime
-from zhipuai import ZhipuAI
-from config import ZHIPU_API_KEY
+import news_cache
+import security_master
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+def _name_candidate(q: str) -> str:
+    """
+    从查询中提取中文股票名称候选（去除常见无关词后取最长的中文串），主数据中未找到证券时使用。
+    """
+    temp_q = q
+    for kw in ["最近", "过去", "情况", "如何", "怎么样", "的", "股票"]:
+        temp_q = temp_q.replace(kw, " ")
+    name_candidates = re.findall(r'[\u4e00-\u9fff]{2,}', temp_q)
+    if name_candidates:
+        # 取最长的中文片段作为股票名称
+        name_candidates.sort(key=len, reverse=True)
+        stock_name_candidate = name_candidates[0]
+        # 如果候选名称中不包含明显的非公司字样，则采用
+        if stock_name_candidate not in ["行情", "数据", "情况"]:
+            return stock_name_candidate
+    return ""
 
 def parse_user_query(query: str) -> dict:
     """
     解析用户的自然语言查询，提取股票代码、名称、查询模式（数据或分析）、起止日期等信息。
-    返回字典包含: mode, stock_code, stock_name, start_date, end_date。
+    返回字典包含: mode, stock_code, stock_name, industry_name, start_date, end_date，
+    以及 stocks（文本中识别出的全部证券列表，按出现顺序）。
     """
     result = {
         "mode": "analysis",
@@ -80,11 +102,28 @@ def parse_user_query(query: str) -> dict:
     stock_code = ""
     stock_name = ""
     # 检查是否包含形如 000001.SZ 或 600000.SH 的代码
-    code_match = re.search(r'\d{6}\.[SsZz][HhZz]', q)
+    code_match = re.search(r'\d{6}\.[SsZzBb][HhZzJj]', q)
     if code_match:
         stock_code = code_match.group(0).upper()
+    # 使用本地证券主数据一次扫描识别文本中提及的全部证券（名称、6位代码、拼音缩写），无需网络请求
+    master = security_master.get_master()
+    matches = master.find_all(q)
+    result["stocks"] = matches
+    if stock_code:
+        # 显式代码优先，从主数据补全官方名称和行业
+        row = master.lookup_code(stock_code)
+        if row:
+            stock_name = row["name"]
+            result["industry_name"] = row["industry"]
+        else:
+            # 代码不在主数据中（如新上市）：仍从文本中提取名称，供新闻搜索使用
+            stock_name = _name_candidate(q)
+    elif matches:
+        stock_code = matches[0]["ts_code"]
+        stock_name = matches[0]["name"]
+        result["industry_name"] = matches[0]["industry"]
     else:
-        # 检查6位数字（可能缺少交易所后缀）
+        # 主数据中未找到时，检查6位数字（可能缺少交易所后缀）
         code_match = re.search(r'\d{6}', q)
         if code_match:
             code_digits = code_match.group(0)
@@ -93,111 +132,56 @@ def parse_user_query(query: str) -> dict:
                 stock_code = code_digits + ".SH"
             else:
                 stock_code = code_digits + ".SZ"
-    # 提取中文股票名称（去除常见无关词后取最长的中文串）
-    temp_q = q
-    for kw in ["最近", "过去", "情况", "如何", "怎么样", "的", "股票"]:
-        temp_q = temp_q.replace(kw, " ")
-    name_candidates = re.findall(r'[\u4e00-\u9fff]{2,}', temp_q)
-    if name_candidates:
-        # 取最长的中文片段作为股票名称
-        name_candidates.sort(key=len, reverse=True)
-        stock_name_candidate = name_candidates[0]
-        # 如果候选名称中不包含明显的非公司字样，则采用
-        if stock_name_candidate not in ["行情", "数据", "情况"]:
-            stock_name = stock_name_candidate
-    # 如果同时得到了股票代码和名称，则优先使用代码查询；若只有名称则需要通过名称查代码
+        # 提取中文股票名称：有代码时用于新闻搜索，无代码时用于提示无法识别的名称
+        stock_name = _name_candidate(q)
     result["stock_code"] = stock_code
     result["stock_name"] = stock_name
-    # 若没有代码，尝试通过名称获取代码和标准名称
-    if stock_code == "" and stock_name:
-        try:
-            # 使用 Tushare 获取匹配的股票代码和行业（需配置 TUSHARE_TOKEN）
-            from config import TUSHARE_TOKEN
-            if TUSHARE_TOKEN:
-                import tushare as ts
-                ts.set_token(TUSHARE_TOKEN)
-                pro = ts.pro_api()
-                df_basic = pro.stock_basic(exchange='', list_status='L', fields='ts_code,name,industry')
-                # 精确匹配名称
-                match = df_basic[df_basic['name'] == stock_name]
-                if match.empty:
-                    # 尝试模糊匹配（名称包含）
-                    match = df_basic[df_basic['name'].str.contains(stock_name)]
-                if not match.empty:
-                    stock_code = match.iloc[0]['ts_code']
-                    stock_name_official = match.iloc[0]['name']
-                    industry_name = match.iloc[0]['industry']
-                    result["stock_code"] = stock_code
-                    result["stock_name"] = stock_name_official
-                    result["industry_name"] = industry_name
-        except Exception:
-            pass
     # 若通过名称未找到，则结果中可能只有名称，这种情况下在后续步骤处理
     return result
 
+def _news_summaries(results: list, count: int) -> list:
+    summaries = []
+    for doc in results[:count]:
+        # 使用content作为新闻摘要，没有则用标题
+        summary_text = (doc.get('content') or doc.get('title') or '').strip()
+        if summary_text:
+            # 截取前120字以内的一段
+            if len(summary_text) > 120:
+                summary_text = summary_text[:120] + "..."
+            summaries.append(summary_text)
+    return summaries
+
 def get_stock_news(stock_name: str, count: int = 10) -> list:
     """
     使用 ZhipuAI 的网络搜索功能获取股票相关新闻标题或摘要。返回最多 count 条相关新闻摘要列表。
+    搜索结果经 news_cache 缓存，相同查询在有效期内不再重复搜索。
     """
-    summaries = []
     if not stock_name:
-        return summaries
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
+        return []
     try:
-        search_query = f"{stock_name} 股票 新闻"
-        resp = client.web_search.web_search(search_engine="search_pro", search_query=search_query,
-                                            page=1, count=count, search_result=True, content_summary=True)
-        documents = resp.get("data", {}).get("documents", [])
-        for doc in documents[:count]:
-            # 尝试使用content_summary或content作为新闻摘要，没有则用标题
-            summary_text = ""
-            if 'content' in doc and doc['content']:
-                summary_text = doc['content']
-            elif 'content_summary' in doc and doc['content_summary']:
-                summary_text = doc['content_summary']
-            elif 'snippet' in doc and doc['snippet']:
-                summary_text = doc['snippet']
-            else:
-                summary_text = doc.get('title', '')
-            summary_text = summary_text.strip()
-            if summary_text:
-                # 截取前120字以内的一段
-                if len(summary_text) > 120:
-                    summary_text = summary_text[:120] + "..."
-                summaries.append(summary_text)
-    except Exception:
-        # 如果搜索 API 调用失败，返回空列表
-        summaries = []
-    return summaries
+        with telemetry.span("news", kind="stock", query=stock_name) as sp:
+            summaries = _news_summaries(news_cache.web_search(f"{stock_name} 股票 新闻", count=count), count)
+            sp["items"] = len(summaries)
+            return summaries
+    except Exception as e:
+        # 如果搜索 API 调用失败，记录错误后返回空列表（分析在没有股票新闻的情况下继续）
+        logger.warning("获取股票新闻失败 %s: %s", stock_name, e)
+        telemetry.record_error("nlp_parser.get_stock_news", e)
+        return []
 
 def get_industry_news(industry_name: str, count: int = 5) -> list:
     """
     使用 ZhipuAI 网络搜索获取行业相关新闻摘要列表。返回最多 count 条相关行业新闻摘要。
+    行业名称按证券主数据规范化后作为缓存键，同一行业的全部股票共享同一份搜索结果。
     """
-    summaries = []
     if not industry_name:
-        return summaries
-    client = ZhipuAI(api_key=ZHIPU_API_KEY)
+        return []
     try:
-        search_query = f"{industry_name} 行业 新闻"
-        resp = client.web_search.web_search(search_engine="search_pro", search_query=search_query,
-                                            page=1, count=count, search_result=True, content_summary=True)
-        documents = resp.get("data", {}).get("documents", [])
-        for doc in documents[:count]:
-            summary_text = ""
-            if 'content' in doc and doc['content']:
-                summary_text = doc['content']
-            elif 'content_summary' in doc and doc['content_summary']:
-                summary_text = doc['content_summary']
-            elif 'snippet' in doc and doc['snippet']:
-                summary_text = doc['snippet']
-            else:
-                summary_text = doc.get('title', '')
-            summary_text = summary_text.strip()
-            if summary_text:
-                if len(summary_text) > 120:
-                    summary_text = summary_text[:120] + "..."
-                summaries.append(summary_text)
-    except Exception:
-        summaries = []
-    return summaries
\ No newline at end of file
+        with telemetry.span("news", kind="industry", query=industry_name) as sp:
+            summaries = _news_summaries(news_cache.web_search(news_cache.industry_query(industry_name), count=count), count)
+            sp["items"] = len(summaries)
+            return summaries
+    except Exception as e:
+        logger.warning("获取行业新闻失败 %s: %s", industry_name, e)
+        telemetry.record_error("nlp_parser.get_industry_news", e)
+        return []
@@ -0,0 +1,101 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class StagePipeline:
+    """
+    按依赖关系组织的阶段图执行器。
+    每个阶段是一个函数，其依赖阶段的结果以同名关键字参数传入；
+    互不依赖的阶段在线程池中并发执行，整体耗时接近关键路径而非各阶段之和。
+    每个阶段记录为名为 "stage.<阶段名>" 的 span，阶段内产生的 span 归入调用 run 时所在的请求追踪。
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.stages = {}
+
+    def add(self, name: str, func, deps=()):
+        """
+        注册一个阶段。deps 为依赖的阶段名列表，执行时以 func(**{dep: 结果}) 调用。
+        """
+        if name in self.stages:
+            raise ValueError(f"阶段重复注册: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"阶段 {name} 依赖未注册的阶段: {dep}")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def run(self, on_stage_done=None):
+        """
+        执行全部阶段，返回 (results, timings)。
+        on_stage_done(name, result) 在每个阶段成功完成后立即回调（用于向界面推送已就绪的结果）。
+        results: {阶段名: 返回值}
+        timings: {阶段名: {"start": 相对开始秒数, "end": 相对结束秒数, "duration": 耗时秒数}}
+        任一阶段抛出异常时，不再提交新阶段，等待已运行阶段结束后重新抛出该异常。
+        """
+        results = {}
+        timings = {}
+        pending = dict(self.stages)
+        running = {}
+        t0 = time.perf_counter()
+
+        def _timed(name, func, kwargs):
+            start = time.perf_counter()
+            try:
+                with telemetry.span(f"stage.{name}"):
+                    return func(**kwargs)
+            finally:
+                end = time.perf_counter()
+                timings[name] = {
+                    "start": round(start - t0, 4),
+                    "end": round(end - t0, 4),
+                    "duration": round(end - start, 4),
+                }
+
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                # 提交所有依赖已满足的阶段
+                if error is None:
+                    for name, (func, deps) in list(pending.items()):
+                        if all(dep in results for dep in deps):
+                            kwargs = {dep: results[dep] for dep in deps}
+                            running[pool.submit(telemetry.bind(_timed), name, func, kwargs)] = name
+                            del pending[name]
+                    if pending and not running:
+                        raise RuntimeError(f"阶段依赖无法满足: {sorted(pending)}")
+                else:
+                    pending.clear()
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        results[name] = fut.result()
+                        if on_stage_done is not None:
+                            on_stage_done(name, results[name])
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                            logger.warning("阶段 %s 执行失败: %s", name, e)
+        total = round(time.perf_counter() - t0, 4)
+        timings["__total__"] = {"start": 0.0, "end": total, "duration": total}
+        if error is not None:
+            raise error
+        return results, timings
+
+
+def format_timings(timings: dict) -> str:
+    """
+    将阶段耗时整理为便于阅读的文本（按开始时间排序），用于日志中确认各阶段的并发重叠情况。
+    """
+    lines = []
+    for name, t in sorted(timings.items(), key=lambda kv: (kv[0] == "__total__", kv[1]["start"])):
+        lines.append(f"{name:<16} start={t['start']:>8.3f}s end={t['end']:>8.3f}s duration={t['duration']:>8.3f}s")
+    return "\n".join(lines)
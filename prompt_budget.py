@@ -0,0 +1,98 @@
+import re
+import logging
+import telemetry
+from config import PROMPT_BUDGETS
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字与全角标点（每个字符约计 1 个 token）
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 截断时优先停在这些字符之后（句末标点或换行）
+_BREAKS = "。！？；!?;\n"
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数：中日韩文字及全角标点按每字 1 个 token，其余字符按每 4 个 1 个 token。
+    不依赖分词器，对中文偏保守（实际 token 数通常更少），用于预算控制已足够。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compress(text: str) -> str:
+    """
+    去掉对模型无意义的格式：Markdown 加粗/标题/分隔线标记、行首行尾空白、连续空行。
+    """
+    text = re.sub(r"^[-*_]{3,}\s*$|\*\*|__|^#+\s*", "", text or "", flags=re.M)
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """
+    将文本截断到不超过 max_tokens 个 token（含截断标记），尽量停在句末或行末。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    # token 数随前缀长度单调不减，二分查找满足预算的最长前缀
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens - 1:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    # 前缀后半段内有句末标点或换行时停在该处，避免留下半句
+    pos = max(cut.rfind(ch) for ch in _BREAKS)
+    if pos >= len(cut) // 2:
+        cut = cut[:pos + 1]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+def allocate(texts: list, budget: int) -> list:
+    """
+    在 budget 个 token 内分配多段文本：不超过平均份额的文本保留原文，节省下来的预算留给其余文本，
+    超出份额的文本截断到各自分得的预算。
+    """
+    sizes = [estimate_tokens(t) for t in texts]
+    if sum(sizes) <= budget:
+        return list(texts)
+    limits = [0] * len(texts)
+    remaining = max(budget, 0)
+    order = sorted(range(len(texts)), key=lambda i: sizes[i])
+    for k, i in enumerate(order):
+        limits[i] = min(sizes[i], remaining // (len(order) - k))
+        remaining -= limits[i]
+    return [t if limits[i] >= sizes[i] else truncate(t, limits[i]) for i, t in enumerate(texts)]
+
+
+def fit(call_site: str, fixed: str, texts: list) -> list:
+    """
+    按调用点的输入 token 预算（PROMPT_BUDGETS）组装提示词的可变部分，返回处理后的 texts。
+    fixed 为提示词中不可压缩的部分（指令、格式要求等），计入预算；texts 先去掉格式标记，超出预算时按 allocate 截断。
+    每次组装记录为 "prompt.<调用点>" span（估算的原始/最终 token 数、预算、是否截断），并累加 prompt_tokens_total。
+    未配置预算的调用点只做格式压缩。
+    """
+    budget = PROMPT_BUDGETS.get(call_site)
+    with telemetry.span(f"prompt.{call_site}", budget=budget) as sp:
+        fixed_tokens = estimate_tokens(fixed)
+        before = fixed_tokens + sum(estimate_tokens(t) for t in texts)
+        texts = [compress(t) for t in texts]
+        trimmed = budget is not None and fixed_tokens + sum(estimate_tokens(t) for t in texts) > budget
+        if trimmed:
+            texts = allocate(texts, budget - fixed_tokens)
+        after = fixed_tokens + sum(estimate_tokens(t) for t in texts)
+        sp.update(input_tokens=before, tokens=after, trimmed=trimmed)
+    telemetry.incr("prompt_tokens_total", before, call_site=call_site, stage="input")
+    telemetry.incr("prompt_tokens_total", after, call_site=call_site, stage="sent")
+    if trimmed:
+        telemetry.incr("prompt_trimmed_total", call_site=call_site)
+        logger.info("调用点 %s 的提示词超出预算 %d，估算 token 数 %d → %d", call_site, budget, before, after)
+    return texts
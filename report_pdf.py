@@ -0,0 +1,134 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import PDF_IMAGE_DPI, PDF_WORKERS
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = 'STSong-Light'
+FONT_SIZE = 12
+# 页面布局（单位：磅，A4 为 595 x 842）
+PAGE_TOP = 800
+PAGE_BOTTOM = 100
+HEADING_LEFT = 50
+TEXT_LEFT = 70
+TEXT_RIGHT = 545
+LINE_HEIGHT = 18
+# 第二页图表的放置位置与尺寸：(x, y, 宽, 高)
+IMAGE_BOXES = [(50, 440, 500, 300), (50, 100, 500, 300)]
+
+_font_lock = threading.Lock()
+_font_registered = False
+_char_widths = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def register_font():
+    """
+    注册中文字体（每个进程只注册一次）。
+    """
+    global _font_registered
+    if _font_registered:
+        return
+    with _font_lock:
+        if not _font_registered:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+            pdfmetrics.registerFont(UnicodeCIDFont(FONT_NAME))
+            _font_registered = True
+
+
+def _char_width(ch: str, font_size: float) -> float:
+    width = _char_widths.get(ch)
+    if width is None:
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        width = _char_widths[ch] = stringWidth(ch, FONT_NAME, 1000)
+    return width * font_size / 1000
+
+
+def wrap_text(text: str, max_width: float, font_size: float = FONT_SIZE) -> list:
+    """
+    按实际字宽换行：逐字累计 stringWidth，超过 max_width 时断行；原文中的换行符保留为段落分隔。
+    """
+    register_font()
+    lines = []
+    for paragraph in text.split("\n"):
+        line_start = 0
+        width = 0.0
+        for i, ch in enumerate(paragraph):
+            w = _char_width(ch, font_size)
+            if width + w > max_width and i > line_start:
+                lines.append(paragraph[line_start:i])
+                line_start = i
+                width = 0.0
+            width += w
+        lines.append(paragraph[line_start:])
+    return lines
+
+
+def _scaled_image(path: str, width: float, height: float):
+    """
+    将图片按放置尺寸（磅）和 PDF_IMAGE_DPI 预先缩放，避免把全分辨率图片嵌入 PDF。
+    """
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    size = (max(int(width / 72 * PDF_IMAGE_DPI), 1), max(int(height / 72 * PDF_IMAGE_DPI), 1))
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        if img.width > size[0] or img.height > size[1]:
+            img = img.resize(size, Image.LANCZOS)
+    return ImageReader(img)
+
+
+def build_report(pdf_path: str, title: str, sections, images) -> str:
+    """
+    生成PDF报告：第一页起为标题和各分析段落，新页放图表。
+    sections: [(标题, 文本, 评分)]；images: 图片路径列表（依次放入 IMAGE_BOXES）。
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    register_font()
+    c = canvas.Canvas(pdf_path, pagesize=A4)
+    c.setFont(FONT_NAME, FONT_SIZE)
+    # 报告标题
+    c.drawString(HEADING_LEFT, PAGE_TOP, title)
+    y = PAGE_TOP - 30
+    # 输出每个分析段落文本
+    for cat, text, score in sections:
+        c.drawString(HEADING_LEFT, y, f"{cat} (评分: {score})：")
+        y -= 20
+        for line in wrap_text(text, TEXT_RIGHT - TEXT_LEFT):
+            c.drawString(TEXT_LEFT, y, line)
+            y -= LINE_HEIGHT
+            if y < PAGE_BOTTOM:  # 页面空间不足时换页
+                c.showPage()
+                c.setFont(FONT_NAME, FONT_SIZE)
+                y = PAGE_TOP
+        y -= 10
+        if y < PAGE_BOTTOM:
+            c.showPage()
+            c.setFont(FONT_NAME, FONT_SIZE)
+            y = PAGE_TOP
+    # 新页放图表
+    c.showPage()
+    for path, (x, y, width, height) in zip(images, IMAGE_BOXES):
+        try:
+            c.drawImage(_scaled_image(path, width, height), x, y, width=width, height=height)
+        except Exception as e:
+            logger.warning("PDF插入图表失败 %s: %s", path, e)
+    c.save()
+    return pdf_path
+
+
+def submit(fn, *args, **kwargs):
+    """
+    在后台线程中执行 fn(*args, **kwargs)（PDF生成），返回 Future。
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="report-pdf")
+    return _executor.submit(fn, *args, **kwargs)
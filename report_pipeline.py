@@ -0,0 +1,82 @@
+import analyzer
+import analysis_inputs
+import artifacts
+import bar_store
+import nlp_parser
+import pipeline
+import stock_plotter
+from config import PIPELINE_MAX_WORKERS
+
+# 图表阶段产出并缓存的产物名称
+CHART_ARTIFACTS = ("price_chart", "volume_chart")
+
+
+def get_charts(stock_code, stock_name, start_date, end_date, mode, label, fetcher=None):
+    """
+    获取行情并返回 (产物目录, (价格图路径, 成交量图路径), 数据来源)。
+    数据来源为 {"text": 来源说明, "complete": 是否所有区间均获取成功}，数据缺失时不再无提示地显示空图表。
+    产物目录按 (代码, 起止日期, 模式, 本地行情数据版本) 内容寻址，相同查询直接复用已生成的图表（及三面分析用的数值摘要）。
+    fetcher 为缺失区间的上游拉取函数（默认逐只拉取，批量分析时使用预取结果）。
+    """
+    df = stock_plotter.load_history(stock_code, start_date, end_date, fetcher)
+    store = artifacts.get_store()
+    key = artifacts.artifact_key(stock_code, start_date, end_date, mode, bar_store.version(stock_code))
+    report_dir = store.entry_dir(key, label)
+
+    def _build(out_dir):
+        price_chart_path, volume_chart_path = stock_plotter.generate_charts(
+            stock_code, stock_name, start_date, end_date, out_dir, df=df)
+        return {"price_chart": price_chart_path, "volume_chart": volume_chart_path}
+    files = store.get_or_create(report_dir, CHART_ARTIFACTS, _build)
+    if mode == "analysis" and analysis_inputs.uses_digest():
+        # 三面分析使用数值摘要时，与图表一起由本次获取的行情生成并缓存
+        analysis_inputs.prepare_digest(report_dir, df)
+    data_source = {"text": stock_plotter.describe_source(df), "complete": not df.attrs.get("failed")}
+    return report_dir, tuple(files[name] for name in CHART_ARTIFACTS), data_source
+
+
+def build_analysis_pipeline(stock_code, stock_name, industry_name, start_date, end_date, mode, label,
+                            on_token=None, macro=None, industry_news=None, fetcher=None, max_workers=None):
+    """
+    按依赖关系构建单只股票的分析阶段图，互不依赖的阶段并发执行。
+    图表、股票新闻、行业新闻、宏观分析互不依赖；三面分析依赖图表与新闻；AI分析依赖三面分析与宏观分析。
+    on_token(section, text) 接收流式输出（section 为 "analysis" / "macro" / "ai"）；
+    macro、industry_news 由调用方提供时（如批量分析中多只股票共享）直接使用，不再重复获取；
+    fetcher 传给图表阶段用于拉取缺失的行情区间。
+    """
+    def _tokens(section):
+        if on_token is None:
+            return None
+        return lambda text: on_token(section, text)
+
+    pipe = pipeline.StagePipeline(max_workers=max_workers or PIPELINE_MAX_WORKERS)
+    # 1. 获取历史行情数据并绘制图表
+    pipe.add("charts", lambda: get_charts(stock_code, stock_name, start_date, end_date, mode, label, fetcher))
+    # 2. 获取新闻摘要（股票新闻10条，行业新闻5条）
+    pipe.add("stock_news", lambda: nlp_parser.get_stock_news(stock_name, count=10))
+    if industry_news is not None:
+        pipe.add("industry_news", lambda: industry_news)
+    else:
+        pipe.add("industry_news", lambda: nlp_parser.get_industry_news(industry_name, count=5) if industry_name else [])
+
+    # 3. 调用多模态大模型获取 基本面/行业/技术面 分析，并解析三部分分析文本
+    def _three_analysis(charts, stock_news, industry_news):
+        images, digest = analysis_inputs.chart_inputs(charts[0], charts[1])
+        analysis_text = analyzer.analyze_fund_ind_tech(stock_name, stock_news, industry_news, images, digest,
+                                                       on_token=_tokens("analysis"))
+        # 防止重复输出，确保只生成一次分析结论
+        return analyzer.parse_three_analysis(analysis_text.strip())
+    pipe.add("analysis", _three_analysis, deps=("charts", "stock_news", "industry_news"))
+    # 4. 获取宏观分析及其评分（与个股无关，命中进程内缓存） 和 AI自由分析
+    if macro is not None:
+        pipe.add("macro", lambda: macro)
+    else:
+        pipe.add("macro", lambda: analyzer.get_macro_analysis(on_token=_tokens("macro")))
+    pipe.add("ai", lambda analysis, macro: analyzer.analyze_ai_free(
+        stock_name, *analysis, macro[0], on_token=_tokens("ai")).strip(), deps=("analysis", "macro"))
+    # 5. 分别对五部分分析调用AI评分取平均，各评分在对应文本就绪后立即开始
+    pipe.add("score_fund", lambda analysis: analyzer.get_score(analysis[0], "基本面分析"), deps=("analysis",))
+    pipe.add("score_industry", lambda analysis: analyzer.get_score(analysis[1], "行业分析"), deps=("analysis",))
+    pipe.add("score_tech", lambda analysis: analyzer.get_score(analysis[2], "技术面分析"), deps=("analysis",))
+    pipe.add("score_ai", lambda ai: analyzer.get_score(ai, "AI分析"), deps=("ai",))
+    return pipe
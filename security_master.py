@@ -0,0 +1,220 @@
+import re
+import logging
+import threading
+from collections import deque
+from config import SECURITY_MASTER_CSV, SECURITY_MASTER_SNAPSHOT
+from security_snapshot import SecuritySnapshot, csv_digest, csv_stat
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    """
+    统一全角字符为半角并转为小写，使名称、代码、拼音缩写在同一字符空间中匹配。
+    """
+    chars = []
+    for ch in text:
+        code = ord(ch)
+        if code == 0x3000:
+            code = 0x20
+        elif 0xFF01 <= code <= 0xFF5E:
+            code -= 0xFEE0
+        chars.append(chr(code))
+    return "".join(chars).lower()
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机：构建一次后，对任意文本单次线性扫描即可找出全部模式的出现位置。
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern: str, value):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def iter(self, text: str):
+        """
+        逐个产出 (start, end, value)，end 为不含的结束位置。
+        """
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._out[node]:
+                yield i + 1 - length, i + 1, value
+
+
+class SecurityMaster:
+    """
+    基于本地证券主数据的股票识别器，底层数据为 SecuritySnapshot（优先内存映射快照文件）。
+    名称（含去除 ST 前缀、A 股后缀的别名）、6 位代码、拼音缩写均编入同一个 Aho-Corasick 自动机，
+    可在一次线性扫描中找出自由文本中提及的全部证券，无需网络请求。
+    """
+
+    def __init__(self, snapshot: SecuritySnapshot):
+        self.snapshot = snapshot
+        self._automaton = self._build(snapshot)
+        self._industries = None
+        self._industry_names = None
+
+    @classmethod
+    def load(cls, snapshot_path: str, csv_path: str):
+        """
+        快照文件由当前 CSV 生成时直接内存映射，否则从 CSV 在内存中构建快照。
+        先比较头部记录的 CSV 大小与修改时间（不读取 CSV）；不一致时（如检出仓库后修改时间改变）再比较内容哈希。
+        """
+        try:
+            snapshot = SecuritySnapshot.open(snapshot_path)
+            if ((snapshot.source_size, snapshot.source_mtime_ns) == csv_stat(csv_path)
+                    or snapshot.source_digest == csv_digest(csv_path)):
+                return cls(snapshot)
+            logger.warning("证券主数据快照 %s 与 %s 不一致，从 CSV 重新构建（请运行 csv_to_jsonl.py 更新快照）",
+                           snapshot_path, csv_path)
+        except (OSError, ValueError):
+            pass
+        return cls(SecuritySnapshot.from_csv(csv_path))
+
+    @staticmethod
+    def _build(snapshot: SecuritySnapshot) -> AhoCorasick:
+        # 统计每个模式对应的证券，多只证券共用的别名/拼音缩写存在歧义，不予收录
+        owners = {}
+
+        def _register(pattern, kind, i):
+            pattern = _normalize(pattern)
+            if len(pattern) < 2:
+                return
+            owners.setdefault((pattern, kind), set()).add(i)
+
+        names = {_normalize(snapshot.value(i, "name")) for i in range(len(snapshot))}
+        for i in range(len(snapshot)):
+            name = snapshot.value(i, "name")
+            symbol = snapshot.value(i, "symbol")
+            cnspell = snapshot.value(i, "cnspell")
+            _register(name, "name", i)
+            alias = re.sub(r"^\*?ST", "", name)
+            alias = re.sub(r"(?<=[\u4e00-\u9fff])[AB]$", "", alias)
+            if alias != name and _normalize(alias) not in names:
+                _register(alias, "name", i)
+            if symbol.isdigit():
+                _register(symbol, "symbol", i)
+            if len(cnspell) >= 3:
+                _register(cnspell, "cnspell", i)
+        automaton = AhoCorasick()
+        for (pattern, kind), rows in owners.items():
+            if len(rows) == 1:
+                automaton.add(pattern, (kind, next(iter(rows))))
+        return automaton.build()
+
+    def find_all(self, text: str) -> list:
+        """
+        找出文本中提及的全部证券（按出现顺序、去重），重叠匹配时取最左最长者。
+        返回 [{"ts_code", "name", "industry", "matched"}]。
+        """
+        norm = _normalize(text)
+        candidates = []
+        for start, end, (kind, i) in self._automaton.iter(norm):
+            # 代码与拼音缩写须是独立的字母数字串，避免匹配到更长代码或英文单词的一部分
+            if kind != "name":
+                if start > 0 and norm[start - 1].isascii() and norm[start - 1].isalnum():
+                    continue
+                if end < len(norm) and norm[end].isascii() and norm[end].isalnum():
+                    continue
+            candidates.append((start, end, i))
+        candidates.sort(key=lambda c: (c[0], c[0] - c[1]))
+        found = []
+        seen = set()
+        last_end = 0
+        for start, end, i in candidates:
+            if start < last_end:
+                continue
+            last_end = end
+            if i in seen:
+                continue
+            seen.add(i)
+            found.append({"ts_code": self.snapshot.value(i, "ts_code"), "name": self.snapshot.value(i, "name"),
+                          "industry": self.snapshot.value(i, "industry"), "matched": text[start:end]})
+        return found
+
+    def lookup_code(self, ts_code: str):
+        """
+        按 ts_code 返回证券行字典，不存在时返回 None。
+        """
+        i = self.snapshot.find_code(ts_code)
+        return self.snapshot[i] if i is not None else None
+
+    def lookup_name(self, name: str) -> list:
+        """
+        按名称返回全部同名证券的行字典列表。
+        """
+        return [self.snapshot[i] for i in self.snapshot.find_name(name)]
+
+    def lookup_industry(self, industry: str) -> list:
+        """
+        返回属于某一行业的全部证券行字典（按主数据顺序），行业索引在首次调用时建立。
+        """
+        return [self.snapshot[i] for i in self._industry_index().get(industry, [])]
+
+    def canonical_industry(self, industry: str) -> str:
+        """
+        将行业名称（可能含全角字符、大小写或首尾空白差异）规范为主数据中的写法，不存在时原样返回去除空白后的名称。
+        同一行业的全部股票由此得到相同的行业名称，可共享按行业缓存的数据（如行业新闻）。
+        """
+        industry = (industry or "").strip()
+        index = self._industry_index()
+        if industry in index:
+            return industry
+        if self._industry_names is None:
+            self._industry_names = {_normalize(name): name for name in index if name}
+        return self._industry_names.get(_normalize(industry), industry)
+
+    def _industry_index(self) -> dict:
+        if self._industries is None:
+            index = {}
+            for i in range(len(self.snapshot)):
+                index.setdefault(self.snapshot.value(i, "industry"), []).append(i)
+            self._industries = index
+        return self._industries
+
+
+_master = None
+_master_lock = threading.Lock()
+
+
+def get_master() -> SecurityMaster:
+    """
+    返回进程级共享的证券主数据（首次使用时构建一次）。
+    """
+    global _master
+    if _master is None:
+        with _master_lock:
+            if _master is None:
+                _master = SecurityMaster.load(SECURITY_MASTER_SNAPSHOT, SECURITY_MASTER_CSV)
+    return _master
@@ -0,0 +1,194 @@
+import os
+import csv
+import hashlib
+import mmap
+import struct
+import sys
+from bisect import bisect_left
+
+# 快照文件格式（小端）：
+#   头部: 魔数 8 字节 | 源 CSV 内容的 SHA-256 32 字节 | 源 CSV 大小 u64 | 源 CSV 修改时间 i64（纳秒）|
+#         行数 u32 | 字符串数 u32 | 各段偏移 u32 × len(SECTIONS)
+#   strings: 字符串偏移表 u32[字符串数 + 1] + UTF-8 字节串（全部字符串驻留去重，行业/地域等分类列共享同一条目）
+#   每个字符串列: u32[行数]，存放字符串编号
+#   list_date: u32[行数]，YYYYMMDD 定长整数
+#   idx_ts_code / idx_name: u32[行数]，按 UTF-8 字节序排序的行号，用于 O(log n) 二分查找
+MAGIC = b"SMSNAP03"
+STRING_COLUMNS = ["ts_code", "symbol", "name", "area", "industry", "cnspell", "market", "act_name", "act_ent_type"]
+SECTIONS = ["strings"] + STRING_COLUMNS + ["list_date", "idx_ts_code", "idx_name"]
+_HEADER = struct.Struct("<8s32sQqII" + "I" * len(SECTIONS))
+
+
+def read_csv_rows(csv_path: str) -> list:
+    """
+    读取 data.csv 的全部行（保留同名证券，不做去重）。
+    """
+    rows = []
+    with open(csv_path, "r", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            if not row.get("ts_code") or not row.get("name"):
+                continue
+            record = {col: (row.get(col) or "").strip() for col in STRING_COLUMNS}
+            record["symbol"] = record["symbol"].zfill(6)
+            date = (row.get("list_date") or "").strip()
+            record["list_date"] = int(date) if date.isdigit() else 0
+            rows.append(record)
+    return rows
+
+
+def csv_stat(csv_path: str) -> tuple:
+    """
+    返回 CSV 文件的 (大小, 修改时间纳秒)，用于快速判断快照是否由当前 CSV 生成。
+    """
+    st = os.stat(csv_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def csv_digest(csv_path: str) -> bytes:
+    """
+    返回 CSV 文件内容的 SHA-256。大小或修改时间与快照记录不一致时（如检出仓库后）再按内容比较。
+    """
+    with open(csv_path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def csv_source(csv_path: str) -> tuple:
+    """
+    返回写入快照头部的源 CSV 信息 (SHA-256, 大小, 修改时间纳秒)。
+    """
+    return (csv_digest(csv_path),) + csv_stat(csv_path)
+
+
+def build_snapshot(rows: list, source: tuple = (b"", 0, 0)) -> bytes:
+    """
+    将证券主数据行编码为紧凑的数组化二进制快照，source 为源 CSV 的 csv_source。
+    """
+    strings = []
+    string_ids = {}
+
+    def _intern(s):
+        sid = string_ids.get(s)
+        if sid is None:
+            sid = string_ids[s] = len(strings)
+            strings.append(s.encode("utf-8"))
+        return sid
+
+    columns = {col: [_intern(row[col]) for row in rows] for col in STRING_COLUMNS}
+    blobs = {}
+    offsets = [0]
+    for b in strings:
+        offsets.append(offsets[-1] + len(b))
+    blobs["strings"] = struct.pack(f"<{len(offsets)}I", *offsets) + b"".join(strings)
+    for col in STRING_COLUMNS:
+        blobs[col] = struct.pack(f"<{len(rows)}I", *columns[col])
+    blobs["list_date"] = struct.pack(f"<{len(rows)}I", *[row["list_date"] for row in rows])
+    for col in ("ts_code", "name"):
+        order = sorted(range(len(rows)), key=lambda i: strings[columns[col][i]])
+        blobs[f"idx_{col}"] = struct.pack(f"<{len(rows)}I", *order)
+    section_offsets = []
+    body = bytearray()
+    for name in SECTIONS:
+        # 各段按 4 字节对齐，便于 memoryview 直接按 u32 读取
+        body.extend(b"\0" * (-(_HEADER.size + len(body)) % 4))
+        section_offsets.append(_HEADER.size + len(body))
+        body.extend(blobs[name])
+    return _HEADER.pack(MAGIC, *source, len(rows), len(strings), *section_offsets) + bytes(body)
+
+
+def write_snapshot(rows: list, path: str, source: tuple = (b"", 0, 0)):
+    with open(path, "wb") as f:
+        f.write(build_snapshot(rows, source))
+
+
+class SecuritySnapshot:
+    """
+    证券主数据快照读取器。底层缓冲区可为 mmap（多个工作进程共享同一份页缓存）或 bytes，
+    各列均为零拷贝的 u32 视图，按需解码为行字典；ts_code / name 查找为 O(log n) 二分查找。
+    """
+
+    def __init__(self, buffer):
+        if sys.byteorder != "little":
+            raise RuntimeError("证券主数据快照仅支持小端平台")
+        self._buffer = buffer
+        view = memoryview(buffer)
+        (magic, self.source_digest, self.source_size, self.source_mtime_ns,
+         self._n_rows, n_strings, *offsets) = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError("不是有效的证券主数据快照文件")
+        sections = dict(zip(SECTIONS, offsets))
+        strings_at = sections["strings"]
+        self._string_offsets = view[strings_at: strings_at + 4 * (n_strings + 1)].cast("I")
+        self._string_blob = view[strings_at + 4 * (n_strings + 1):]
+        self._columns = {}
+        for name in SECTIONS[1:]:
+            at = sections[name]
+            self._columns[name] = view[at: at + 4 * self._n_rows].cast("I")
+
+    @classmethod
+    def open(cls, path: str):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_csv(cls, csv_path: str):
+        return cls(build_snapshot(read_csv_rows(csv_path), csv_source(csv_path)))
+
+    def __len__(self):
+        return self._n_rows
+
+    def _string_bytes(self, sid: int) -> bytes:
+        return bytes(self._string_blob[self._string_offsets[sid]: self._string_offsets[sid + 1]])
+
+    def value(self, i: int, col: str):
+        if col == "list_date":
+            return self._columns["list_date"][i]
+        return self._string_bytes(self._columns[col][i]).decode("utf-8")
+
+    def __getitem__(self, i: int) -> dict:
+        if not 0 <= i < self._n_rows:
+            raise IndexError(i)
+        row = {col: self.value(i, col) for col in STRING_COLUMNS}
+        row["list_date"] = self._columns["list_date"][i]
+        return row
+
+    def _search(self, col: str, key: str) -> list:
+        index = self._columns[f"idx_{col}"]
+        ids = self._columns[col]
+        target = key.encode("utf-8")
+        keys = _SortedKeys(self, index, ids)
+        lo = bisect_left(keys, target)
+        found = []
+        while lo < len(index) and keys[lo] == target:
+            found.append(index[lo])
+            lo += 1
+        return found
+
+    def find_code(self, ts_code: str):
+        """
+        按 ts_code 查找，返回行号或 None。
+        """
+        hits = self._search("ts_code", ts_code)
+        return hits[0] if hits else None
+
+    def find_name(self, name: str) -> list:
+        """
+        按名称查找，返回全部同名证券的行号列表。
+        """
+        return self._search("name", name)
+
+
+class _SortedKeys:
+    """
+    将排序索引包装为按位置取键（UTF-8 字节）的只读序列，供 bisect 使用。
+    """
+
+    def __init__(self, snapshot: SecuritySnapshot, index, ids):
+        self._snapshot = snapshot
+        self._index = index
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, pos: int) -> bytes:
+        return self._snapshot._string_bytes(self._ids[self._index[pos]])
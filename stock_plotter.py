@@ -1,72 +1,67 @@
 import os
 import math
+import logging
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from datetime import datetime, timedelta
-from config import TUSHARE_TOKEN
+import bar_store
+import market_data
+import chart_renderer
+import downsample
+import indicators
+import telemetry
+from cache_utils import SingleFlight
 
-plt.rcParams['font.sans-serif'] = ['Heiti TC']   
-plt.rcParams['axes.unicode_minus'] = False  
-plt.rcParams['figure.dpi'] = 800
+logger = logging.getLogger(__name__)
 
-# 如果使用 Tushare，则初始化其 API（需要在 config.py 中提供 TUSHARE_TOKEN）
-pro = None
-if TUSHARE_TOKEN:
-    try:
-        import tushare as ts
-        ts.set_token(TUSHARE_TOKEN)
-        pro = ts.pro_api()
-    except ImportError:
-        pro = None
+def prefetch_history(stock_codes: list, start_date: str, end_date: str):
+    """
+    批量分析前按缺失日期区间分组预取行情：本地缺失区间相同的股票合并为一次上游请求。
+    返回可传给 load_history 的 fetcher：请求落在已预取区间内时直接返回预取数据，其余回退到逐只拉取。
+    """
+    groups = {}
+    for code in stock_codes:
+        for gap_start, gap_end in bar_store.missing_ranges(code, start_date, end_date):
+            groups.setdefault((gap_start, gap_end), []).append(code)
+    prefetched = {}
+    for (gap_start, gap_end), codes in groups.items():
+        if len(codes) < 2:
+            continue
+        for code, df in market_data.fetch_daily_many(codes, gap_start, gap_end).items():
+            prefetched.setdefault(code, []).append((gap_start, gap_end, df))
+
+    def fetcher(stock_code: str, start: str, end: str):
+        for gap_start, gap_end, df in prefetched.get(stock_code, []):
+            if gap_start <= start and end <= gap_end:
+                mask = (df['date'] >= pd.to_datetime(start)) & (df['date'] <= pd.to_datetime(end))
+                part = df[mask].reset_index(drop=True)
+                part.attrs["source"] = df.attrs.get("source")
+                return part
+        return market_data.fetch_daily(stock_code, start, end)
+    return fetcher
 
-def generate_charts(stock_code: str, stock_name: str, start_date: str, end_date: str, output_dir: str):
+# 同一 (代码, 区间, fetcher) 的并发行情加载只执行一次（如同时查询同一只股票的多个请求、图表与导出）
+_history_flight = SingleFlight("history")
+
+def load_history(stock_code: str, start_date: str, end_date: str, fetcher=None) -> pd.DataFrame:
     """
-    获取股票在指定日期范围内的历史行情数据，并生成收盘价走势图和成交量图。
-    保存图表为PNG文件和行情数据为Excel文件，返回图表文件路径和Excel文件路径。
+    获取股票在指定日期范围内的历史行情（本地列存储 + 增量拉取）。
+    fetcher 默认为逐只按数据源优先级拉取的 market_data.fetch_daily，批量分析时可传入 prefetch_history 返回的 fetcher。
+    均未获取到数据时返回日期连续、行情为 NaN 的 DataFrame，以免后续报错。
+    df.attrs["sources"] 为数据来源（上游数据源名称或 "local"，无数据时为空列表），df.attrs["failed"] 为拉取失败的区间。
+    同一区间的并发调用合并为一次加载，各调用方得到共享同一份数据的浅拷贝（不应原地修改列数据）。
     """
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    # 获取历史数据（优先使用 tushare，其次尝试 akshare）
-    df = None
-    if pro:
-        try:
-            # tushare 接口要求日期格式YYYYMMDD
-            df_query = pro.daily(ts_code=stock_code, start_date=start_date, end_date=end_date)
-            if not df_query.empty:
-                # 转换日期格式并排序
-                df_query['trade_date'] = pd.to_datetime(df_query['trade_date'])
-                df_query.sort_values('trade_date', inplace=True)
-                df_query.reset_index(drop=True, inplace=True)
-                # 重命名列统一格式
-                df_query.rename(columns={'trade_date': 'date', 'open': 'open', 'high': 'high', 
-                                         'low': 'low', 'close': 'close', 'vol': 'volume'}, inplace=True)
-                df = df_query[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
-            else:
-                df = None
-        except Exception:
-            df = None
-    if df is None:
-        try:
-            import akshare as ak
-        except ImportError:
-            ak = None
-        if ak:
-            # akshare 接口使用 YYYYMMDD 格式日期
-            try:
-                df_query = ak.stock_zh_a_hist(symbol=stock_code.split('.')[0], period="daily",
-                                              start_date=start_date, end_date=end_date, adjust="")
-                # akshare返回的DataFrame含列: 日期, 开盘, 收盘, 最高, 最低, 成交量, etc.
-                df_query.rename(columns={'日期': 'date', '开盘': 'open', '收盘': 'close',
-                                         '最高': 'high', '最低': 'low', '成交量': 'volume'}, inplace=True)
-                df_query['date'] = pd.to_datetime(df_query['date'])
-                df_query.sort_values('date', inplace=True)
-                df_query.reset_index(drop=True, inplace=True)
-                df = df_query[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
-            except Exception:
-                df = None
+    df = _history_flight.do((stock_code, start_date, end_date, fetcher),
+                            lambda: _load_history(stock_code, start_date, end_date, fetcher))
+    return df.copy(deep=False)
+
+def _load_history(stock_code: str, start_date: str, end_date: str, fetcher=None) -> pd.DataFrame:
+    with telemetry.span("fetch", code=stock_code, start=start_date, end=end_date) as sp:
+        df = bar_store.get_bars(stock_code, start_date, end_date, fetcher or market_data.fetch_daily)
+        sp["rows"] = 0 if df is None else len(df)
     # 如果仍未获取数据，则生成一个空的 DataFrame 以免后续报错
     if df is None or df.empty:
+        logger.warning("未获取到 %s [%s, %s] 的行情数据，图表将为空", stock_code, start_date, end_date)
         date_range = pd.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date))
         df = pd.DataFrame({
             'date': date_range,
@@ -76,90 +71,53 @@ def generate_charts(stock_code: str, stock_name: str, start_date: str, end_date:
             'close': [math.nan]*len(date_range),
             'volume': [math.nan]*len(date_range)
         })
-    # 计算技术指标: 移动平均线和布林带上下轨，以及成交量均线
-    df['MA5'] = df['close'].rolling(window=5).mean()
-    df['MA10'] = df['close'].rolling(window=10).mean()
-    df['MA20'] = df['close'].rolling(window=20).mean()
-    df['MA60'] = df['close'].rolling(window=60).mean()
-    # Bollinger Bands (20日均线上下2倍标准差)
-    df['BOLL_mid'] = df['MA20']
-    df['BOLL_std'] = df['close'].rolling(window=20).std()
-    df['BOLL_upper'] = df['BOLL_mid'] + 2 * df['BOLL_std']
-    df['BOLL_lower'] = df['BOLL_mid'] - 2 * df['BOLL_std']
-    # 成交量移动平均线
-    df['VOL_MA5'] = df['volume'].rolling(window=5).mean()
-    df['VOL_MA10'] = df['volume'].rolling(window=10).mean()
-    df['VOL_MA20'] = df['volume'].rolling(window=20).mean()
-    df['VOL_MA60'] = df['volume'].rolling(window=60).mean()
+        df.attrs.update(sources=[], failed=[[start_date, end_date]])
+    return df
 
-    dates = df['date']
-    closes = df['close']
-    volumes = df['volume']
+def describe_source(df: pd.DataFrame) -> str:
+    """
+    将 load_history 返回数据的来源整理为便于展示的说明，如 "tushare"、"本地缓存"、"akshare（部分区间获取失败）"、"无数据"。
+    """
+    sources = df.attrs.get("sources", [])
+    if not sources:
+        return "无数据"
+    text = "、".join("本地缓存" if s == "local" else s for s in sources)
+    if df.attrs.get("failed"):
+        text += "（部分区间获取失败）"
+    return text
 
-    # 绘制收盘价走势图
-    fig1, ax1 = plt.subplots(figsize=(10, 6))
-    ax1.set_title(f"{stock_name} 收盘价走势", fontsize=12)
-    ax1.set_xlabel("日期", fontsize=10)
-    ax1.set_ylabel("价格", fontsize=10)
-    # 绘制收盘价曲线
-    ax1.plot(dates, closes, label='收盘价', color='black')
-    # 绘制移动平均线 (5日, 10日, 20日, 60日)
-    ax1.plot(dates, df['MA5'], label='MA5', color='red')
-    ax1.plot(dates, df['MA10'], label='MA10', color='orange')
-    ax1.plot(dates, df['MA20'], label='MA20', color='green')
-    ax1.plot(dates, df['MA60'], label='MA60', color='purple')
-    # 绘制布林带上下轨
-    ax1.plot(dates, df['BOLL_upper'], label='BOLL上轨', color='grey', linestyle='--')
-    ax1.plot(dates, df['BOLL_lower'], label='BOLL下轨', color='grey', linestyle='--')
-    # 日期轴格式化，不重叠
-    ax1.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10))
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    fig1.autofmt_xdate(rotation=45)
-    ax1.legend(fontsize=8)
-    ax1.grid(True, linestyle='--', alpha=0.5)
-    price_chart_path = os.path.join(output_dir, "price_chart.png")
-    fig1.savefig(price_chart_path, dpi=150, bbox_inches='tight')
-    plt.close(fig1)
+def generate_charts(stock_code: str, stock_name: str, start_date: str, end_date: str, output_dir: str, df: pd.DataFrame = None):
+    """
+    获取股票在指定日期范围内的历史行情数据，并生成收盘价走势图和成交量图。
+    保存图表文件并返回 (价格图路径, 成交量图路径)；行情数据的表格导出由 exporters 按需生成。
+    历史行情优先读取本地列存储（bar_store），仅缺失的日期区间才从上游拉取；
+    调用方已通过 load_history 取得行情时可直接传入 df。
+    """
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+    # 获取历史数据（本地存储 + 增量拉取）
+    if df is None:
+        df = load_history(stock_code, start_date, end_date)
+    # 技术指标（均线、布林带、成交量均线、MACD、RSI、KDJ）：本地行情存储随K线追加增量维护，
+    # 行情不来自本地存储时由 indicators 的向量化内核整体计算
+    with telemetry.span("indicators", rows=len(df)):
+        ind = indicators.for_frame(df)
+    df = df.assign(**ind)
 
-    # 绘制成交量走势图
-    fig2, ax2 = plt.subplots(figsize=(10, 4))
-    ax2.set_title(f"{stock_name} 成交量", fontsize=12)
-    ax2.set_xlabel("日期", fontsize=10)
-    ax2.set_ylabel("成交量", fontsize=10)
-    # 绘制成交量柱状图（使用涨跌颜色）
-    vol_colors = None
-    try:
-        # 根据涨跌设置颜色：收盘价较前日上涨为红，下降为绿
-        close_vals = df['close'].fillna(method='ffill')  # 填充NaN以便比较
-        # 用前一日的收盘比对当前收盘
-        prev_close = close_vals.shift(1)
-        vol_colors = ['red' if close_vals[i] >= prev_close[i] else 'green' for i in range(len(close_vals))]
-    except Exception:
-        vol_colors = ['blue'] * len(volumes)  # 若数据不全则统一颜色
-    ax2.bar(dates, volumes, color=vol_colors, label='成交量')
-    # 绘制成交量均线 (5日, 10日, 20日, 60日)
-    ax2.plot(dates, df['VOL_MA5'], label='MA5', color='orange')
-    ax2.plot(dates, df['VOL_MA10'], label='MA10', color='purple')
-    ax2.plot(dates, df['VOL_MA20'], label='MA20', color='brown')
-    ax2.plot(dates, df['VOL_MA60'], label='MA60', color='blue')
-    # 日期轴格式化，防止重叠
-    ax2.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10))
-    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    fig2.autofmt_xdate(rotation=45)
-    ax2.legend(fontsize=8)
-    ax2.grid(True, linestyle='--', alpha=0.5)
-    volume_chart_path = os.path.join(output_dir, "volume_chart.png")
-    fig2.savefig(volume_chart_path, dpi=150, bbox_inches='tight')
-    plt.close(fig2)
+    # 绘制收盘价走势图与成交量图（复用图表模板，两张图在进程池中并行渲染）
+    # 指标已在全分辨率数据上计算，绘图前按绘图区像素宽度降采样：曲线用 LTTB，柱线按需改为周线/月线
+    with telemetry.span("render", rows=len(df)) as sp:
+        width_px = chart_renderer.plot_width_px()
+        dates = mdates.date2num(df['date'].values)
+        price_dates, price_series = downsample.downsample_price(
+            dates, {key: df[key].to_numpy() for key, _, _, _ in chart_renderer.PRICE_SERIES}, width_px)
+        price_payload = {"dates": price_dates, "series": price_series}
+        # 根据涨跌设置颜色：收盘价较前一根上涨为红，下降为绿
+        volume_payload = downsample.downsample_volume(
+            df['date'].values, df['close'].to_numpy(), df['volume'].to_numpy(),
+            {key: df[key].to_numpy() for key, _, _ in chart_renderer.VOLUME_SERIES}, width_px)
+        volume_payload["dates"] = mdates.date2num(volume_payload["dates"])
+        price_chart_path, volume_chart_path = chart_renderer.render_charts(output_dir, stock_name, price_payload, volume_payload)
+        sp["bytes"] = os.path.getsize(price_chart_path) + os.path.getsize(volume_chart_path)
 
-    # 保存行情数据到 Excel 文件
-    code_for_file = stock_code.replace('.', '_')
-    excel_file_name = f"{code_for_file}_{start_date}_{end_date}.xlsx"
-    excel_path = os.path.join(output_dir, excel_file_name)
-    # 输出DataFrame到Excel（不包含NaN的技术指标列）
-    df_to_save = df[['date', 'open', 'high', 'low', 'close', 'volume',
-                     'MA5', 'MA10', 'MA20', 'MA60',
-                     'BOLL_upper', 'BOLL_lower',
-                     'VOL_MA5', 'VOL_MA10', 'VOL_MA20', 'VOL_MA60']].copy()
-    df_to_save.to_excel(excel_path, index=False)
-    return price_chart_path, volume_chart_path, excel_path
\ No newline at end of file
+    return price_chart_path, volume_chart_path
@@ -0,0 +1,292 @@
+import json
+import time
+import logging
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from config import METRICS_HOST, METRICS_PORT, METRICS_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# Prometheus 指标名前缀
+PREFIX = "stockinsight"
+# 耗时分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 当前线程（上下文）所属的 (请求追踪, 父 span 编号)；线程池中执行的任务需通过 bind 传递
+_current = contextvars.ContextVar("telemetry_span", default=(None, None))
+
+
+class Trace:
+    """
+    单次请求的追踪：记录请求期间（包括在线程池中执行的阶段）产生的全部 span，可导出为 JSON。
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def _add(self, record: dict):
+        with self._lock:
+            self._spans.append(record)
+
+    @contextmanager
+    def activate(self):
+        """
+        在当前线程中激活本追踪，期间产生的 span 归入本追踪（须在同一线程内进入和退出）。
+        """
+        token = _current.set((self, None))
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def finish(self, error: BaseException = None) -> float:
+        """
+        结束追踪，按追踪名称记录请求耗时（及失败次数），返回耗时秒数。
+        """
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._t0
+            self.error = type(error).__name__ if error is not None else None
+            _registry.observe(f"request.{self.name}", self.duration, self.error)
+        return self.duration
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: s["start"])
+        return {"name": self.name, "attrs": self.attrs, "started": self.started,
+                "duration": None if self.duration is None else round(self.duration, 4),
+                "error": self.error, "spans": spans}
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+
+
+class _Summary:
+    """
+    某一 span 名称的耗时统计：累计次数、总耗时、失败次数，以及最近 METRICS_WINDOW 次耗时（用于分位数）。
+    """
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.samples = deque(maxlen=window)
+
+
+class _Registry:
+    def __init__(self, window: int):
+        self._window = window
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._counters = {}
+        self._collectors = []
+
+    def observe(self, name: str, seconds: float, error: str = None):
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = _Summary(self._window)
+            summary.count += 1
+            summary.total += seconds
+            summary.samples.append(seconds)
+            if error is not None:
+                summary.errors += 1
+
+    def incr(self, name: str, value: float, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {name: (s.count, s.total, s.errors, list(s.samples)) for name, s in self._summaries.items()}
+            counters = dict(self._counters)
+            collectors = list(self._collectors)
+        spans = {}
+        for name, (count, total, errors, samples) in sorted(summaries.items()):
+            quantiles = np.quantile(samples, QUANTILES) if samples else [0.0] * len(QUANTILES)
+            spans[name] = {"count": count, "sum": round(total, 6), "errors": errors,
+                           **{f"p{int(q * 100)}": round(float(v), 6) for q, v in zip(QUANTILES, quantiles)}}
+        samples = [{"name": name, "labels": dict(labels), "value": value}
+                   for (name, labels), value in sorted(counters.items())]
+        for collector in collectors:
+            try:
+                samples.extend({"name": name, "labels": labels, "value": value} for name, labels, value in collector())
+            except Exception as e:
+                logger.warning("采集指标失败 %s: %s", getattr(collector, "__name__", collector), e)
+        return {"spans": spans, "metrics": samples}
+
+
+_registry = _Registry(METRICS_WINDOW)
+_started = time.time()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    记录一段操作的耗时：计入按名称汇总的耗时统计，当前上下文存在请求追踪时同时作为子 span 记入追踪。
+    with 语句得到 attrs 字典，可在操作过程中补充属性（如 token 数、字节数），一并写入追踪。
+    """
+    trace, parent = _current.get()
+    span_id = trace._next_id() if trace is not None else None
+    token = _current.set((trace, span_id)) if trace is not None else None
+    error = None
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter()
+        if token is not None:
+            _current.reset(token)
+        _registry.observe(name, end - start, error)
+        if trace is not None:
+            trace._add({"id": span_id, "parent": parent, "name": name,
+                        "start": round(start - trace._t0, 4), "duration": round(end - start, 4),
+                        "thread": threading.current_thread().name, "error": error, "attrs": attrs})
+
+
+def bind(fn):
+    """
+    返回在当前上下文（请求追踪与父 span）中执行 fn 的函数，用于提交到线程池的任务。
+    """
+    ctx = contextvars.copy_context()
+
+    def _run(*args, **kwargs):
+        # 同一个 Context 不能被多个线程同时进入，每次调用使用一份拷贝
+        return ctx.copy().run(fn, *args, **kwargs)
+    return _run
+
+
+def incr(name: str, value: float = 1, **labels):
+    """
+    累加计数器，如 incr("llm_tokens_total", 120, call_site="score", kind="prompt")。
+    """
+    _registry.incr(name, value, labels)
+
+
+def record_error(where: str, error: BaseException):
+    """
+    记录一次被捕获处理（未向上抛出）的错误，按发生位置和异常类型计数。
+    """
+    _registry.incr("errors_total", 1, {"where": where, "type": type(error).__name__})
+
+
+def register_collector(collector):
+    """
+    注册指标采集函数，导出指标时调用，返回 [(指标名, 标签dict, 数值)]，用于缓存命中率等由各模块自行统计的数据。
+    """
+    _registry.register(collector)
+
+
+def cache_samples(cache: str, stats: dict, **labels) -> list:
+    """
+    将缓存的 {"hits", "misses"} 统计转换为命中、未命中次数及命中率指标。
+    """
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    labels = {"cache": cache, **labels}
+    return [("cache_hits_total", labels, hits), ("cache_misses_total", labels, misses),
+            ("cache_hit_ratio", labels, hits / (hits + misses) if hits + misses else 0.0)]
+
+
+def snapshot() -> dict:
+    """
+    返回全部指标：{"uptime", "spans": {名称: {count, sum, errors, p50, p95, p99}}, "metrics": [{name, labels, value}]}。
+    """
+    return {"uptime": round(time.time() - _started, 1), **_registry.snapshot()}
+
+
+def _label_text(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def prometheus_text() -> str:
+    """
+    以 Prometheus 文本格式导出全部指标。
+    """
+    snap = snapshot()
+    lines = [f"# TYPE {PREFIX}_uptime_seconds gauge", f"{PREFIX}_uptime_seconds {snap['uptime']}",
+             f"# TYPE {PREFIX}_span_seconds summary"]
+    for name, s in snap["spans"].items():
+        for q in QUANTILES:
+            lines.append(f"{PREFIX}_span_seconds{_label_text({'span': name, 'quantile': q})} {s[f'p{int(q * 100)}']}")
+        lines.append(f"{PREFIX}_span_seconds_sum{_label_text({'span': name})} {s['sum']}")
+        lines.append(f"{PREFIX}_span_seconds_count{_label_text({'span': name})} {s['count']}")
+    lines.append(f"# TYPE {PREFIX}_span_errors_total counter")
+    for name, s in snap["spans"].items():
+        lines.append(f"{PREFIX}_span_errors_total{_label_text({'span': name})} {s['errors']}")
+    declared = set()
+    # 同名指标的样本须连续输出
+    for sample in sorted(snap["metrics"], key=lambda sample: sample["name"]):
+        metric = f"{PREFIX}_{sample['name']}"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} {'counter' if sample['name'].endswith('_total') else 'gauge'}")
+        lines.append(f"{metric}{_label_text(sample['labels'])} {sample['value']}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            body = prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(snapshot(), ensure_ascii=False, indent=2).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s", format % args)
+
+
+def start_server(host: str = None, port: int = None):
+    """
+    在后台线程中启动本地指标服务：/metrics（Prometheus 文本格式）与 /metrics.json（JSON）。
+    端口为 0 时不启动，返回 None。
+    """
+    host = host or METRICS_HOST
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("指标服务已启动 http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,67 @@
+import time
+import logging
+import telemetry
+from config import STARTUP_WARMUP
+
+logger = logging.getLogger(__name__)
+
+
+# 各预热步骤在函数内导入所需模块，只预热配置中列出的部分
+def _security_master():
+    import security_master
+    security_master.get_master()
+
+
+def _charts():
+    import chart_renderer
+    chart_renderer.warm_up()
+
+
+def _pdf_font():
+    import report_pdf
+    report_pdf.register_font()
+
+
+def _zhipu_client():
+    import zhipu_client
+    zhipu_client.get_client()
+
+
+def _market_data():
+    import market_data
+    market_data.warm_up()
+
+
+def _llm_cache():
+    import llm_cache
+    llm_cache.get_cache()
+
+
+STEPS = {
+    "security_master": _security_master,
+    "charts": _charts,
+    "pdf_font": _pdf_font,
+    "zhipu_client": _zhipu_client,
+    "market_data": _market_data,
+    "llm_cache": _llm_cache,
+}
+
+
+def run(steps: list = None) -> dict:
+    """
+    依次执行预热步骤（默认为 config.STARTUP_WARMUP），返回各步骤耗时（秒）。
+    单个步骤失败只记录警告，不影响启动，相应部分仍会在首次使用时初始化。
+    """
+    timings = {}
+    with telemetry.span("warmup"):
+        for name in STARTUP_WARMUP if steps is None else steps:
+            start = time.perf_counter()
+            try:
+                with telemetry.span(f"warmup.{name}"):
+                    STEPS[name]()
+            except Exception as e:
+                logger.warning("预热 %s 失败: %s", name, e)
+                telemetry.record_error("warmup", e)
+            timings[name] = round(time.perf_counter() - start, 3)
+    logger.info("预热完成: %s", timings)
+    return timings
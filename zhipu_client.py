@@ -0,0 +1,141 @@
+import time
+import random
+import logging
+import threading
+from types import SimpleNamespace
+import httpx
+import telemetry
+from config import (ZHIPU_API_KEY, ZHIPU_MAX_CONNECTIONS, ZHIPU_MAX_KEEPALIVE, ZHIPU_KEEPALIVE_EXPIRY,
+                    ZHIPU_MAX_CONCURRENCY, ZHIPU_MAX_RETRIES, ZHIPU_BACKOFF_BASE, ZHIPU_BACKOFF_MAX,
+                    ZHIPU_CALL_TIMEOUTS)
+
+logger = logging.getLogger(__name__)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    限流（429）、服务端错误（5xx）、超时与连接错误可以重试，其余错误（如鉴权失败、参数错误）直接抛出。
+    """
+    from zhipuai import APIStatusError, APITimeoutError, APIConnectionError
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (APITimeoutError, APIConnectionError, httpx.TimeoutException, httpx.TransportError))
+
+
+def _retry_after(error: Exception):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientClient:
+    """
+    对 ZhipuAI 客户端的包装：所有请求共享同一个 httpx 连接池（keep-alive 复用 TLS 连接），
+    以信号量限制对 API 主机的并发请求数（流式请求占用名额直到响应读完），为每次调用设置超时，
+    并在 429/5xx/超时时按带抖动的指数退避重试（流式请求仅在尚未产出分片时重试）。
+    暴露与 ZhipuAI 相同的 chat.completions.create 与 web_search.web_search 接口。
+    """
+
+    def __init__(self, client, max_concurrency: int, max_retries: int,
+                 backoff_base: float, backoff_max: float, timeouts: dict):
+        self.raw = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeouts = timeouts
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._wrap(client.chat.completions.create, "chat")))
+        self.web_search = SimpleNamespace(
+            web_search=self._wrap(client.web_search.web_search, "web_search"))
+
+    def _wrap(self, fn, kind: str):
+        def _call(**kwargs):
+            kwargs.setdefault("timeout", self.timeouts.get(kind))
+            return self.call(fn, **kwargs)
+        return _call
+
+    def call(self, fn, **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(fn, kwargs)
+        attempt = 0
+        while True:
+            try:
+                with self._semaphore:
+                    return fn(**kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                attempt += 1
+                self._backoff(e, attempt)
+
+    def _stream(self, fn, kwargs):
+        """
+        流式请求：并发名额一直占用到响应读完或迭代器关闭（而非只在建立请求时占用），长时间的流式输出同样计入并发上限。
+        建立请求或读取响应时出错，若尚未产出任何分片则按同样的退避策略重试；已产出分片后出错直接抛出，
+        以免调用方收到重复的内容。
+        """
+        attempt = 0
+        while True:
+            sent = False
+            error = None
+            self._semaphore.acquire()
+            try:
+                response = fn(**kwargs)
+                try:
+                    for chunk in response:
+                        sent = True
+                        yield chunk
+                finally:
+                    # 调用方提前关闭迭代器时释放底层 HTTP 连接
+                    http_response = getattr(response, "response", None)
+                    if http_response is not None:
+                        http_response.close()
+                return
+            except Exception as e:
+                if sent or attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                error = e
+            finally:
+                self._semaphore.release()
+            attempt += 1
+            self._backoff(error, attempt)
+
+    def _backoff(self, error: Exception, attempt: int):
+        # 全抖动指数退避：在 [0, min(上限, 基数 * 2^(attempt-1))] 内随机等待，服务端给出 Retry-After 时取二者较大值
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        logger.warning("智谱 API 调用失败（%s），%.2f 秒后第 %d 次重试", error, delay, attempt)
+        telemetry.incr("zhipu_retries_total", type=type(error).__name__)
+        time.sleep(delay)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ResilientClient:
+    """
+    返回进程级共享的智谱 API 客户端（首次使用时创建；zhipuai SDK 也在此时才导入）。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from zhipuai import ZhipuAI
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=ZHIPU_MAX_CONNECTIONS,
+                                        max_keepalive_connections=ZHIPU_MAX_KEEPALIVE,
+                                        keepalive_expiry=ZHIPU_KEEPALIVE_EXPIRY),
+                    timeout=ZHIPU_CALL_TIMEOUTS.get("chat"),
+                )
+                # 重试由 ResilientClient 统一处理，关闭 SDK 自带的重试
+                raw = ZhipuAI(api_key=ZHIPU_API_KEY, max_retries=0, http_client=http_client)
+                _client = ResilientClient(raw, ZHIPU_MAX_CONCURRENCY, ZHIPU_MAX_RETRIES,
+                                          ZHIPU_BACKOFF_BASE, ZHIPU_BACKOFF_MAX, ZHIPU_CALL_TIMEOUTS)
+    return _client